@@ -0,0 +1,159 @@
+'''
+Business: Bulk export of users, purchases and market listings for reporting
+Args: entity, format (csv/ndjson) and role/is_banned/created_from/created_to filters
+      after (the X-Next-After of the previous page), ADMIN_EXPORT_PAGE_ROWS env var
+Returns: one gzip-compressed page of the export per call, keyset-paged by the entity's key
+'''
+import gzip
+import io
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, IO, List, Optional, Tuple
+
+EXPORT_BATCH_SIZE = 2000
+# Rows per response; keeps the compressed, base64-encoded page inside the gateway's response limit
+EXPORT_PAGE_ROWS: int = int(os.environ.get('ADMIN_EXPORT_PAGE_ROWS', '20000'))
+
+# entity -> (SELECT, key columns the export is ordered and paged by with their types, date column)
+EXPORT_QUERIES: Dict[str, Tuple[str, Tuple[Tuple[str, type], ...], str]] = {
+    'users': (
+        "SELECT u.id, u.email, u.username, u.display_name, u.role, u.balance, u.is_banned, u.is_verified, u.has_checkmark, u.created_at FROM users u",
+        (('u.id', int),),
+        'u.created_at'
+    ),
+    'purchases': (
+        "SELECT p.id, p.user_id, u.email, p.game_id, g.title, p.price, p.is_on_market, p.market_price, p.purchased_at FROM purchases p JOIN users u ON p.user_id = u.id JOIN games g ON p.game_id = g.id",
+        (('p.id', int),),
+        'p.purchased_at'
+    ),
+    'market_listings': (
+        """SELECT * FROM (
+            SELECT 'game' AS item_type, p.id, p.user_id, u.email AS seller_email, u.role, u.is_banned, p.game_id AS item_id, g.title AS item_name, p.market_price, p.purchased_at
+            FROM purchases p JOIN users u ON p.user_id = u.id JOIN games g ON p.game_id = g.id
+            WHERE p.is_on_market = TRUE
+            UNION ALL
+            SELECT 'frame' AS item_type, uf.id, uf.user_id, u.email AS seller_email, u.role, u.is_banned, uf.frame_id AS item_id, f.name AS item_name, uf.market_price, uf.purchased_at
+            FROM user_frames uf JOIN users u ON uf.user_id = u.id JOIN frames f ON uf.frame_id = f.id
+            WHERE uf.is_on_market = TRUE
+        ) u""",
+        # Game and frame listings share the id space, so the item type breaks ties
+        (('u.id', int), ('u.item_type', str)),
+        'u.purchased_at'
+    ),
+}
+
+
+def parse_after(entity: str, value: Optional[str]) -> Optional[List[Any]]:
+    '''Key of the last exported row from an after param; raises ValueError when malformed'''
+    if not value:
+        return None
+    keys = EXPORT_QUERIES[entity][1]
+    parts = value.split(',')
+    if len(parts) != len(keys):
+        raise ValueError('after does not match the export key')
+    return [cast(part) for (_, cast), part in zip(keys, parts)]
+
+
+def build_export_query(cur: Any, entity: str, params: Dict[str, Any],
+                       after: Optional[List[Any]] = None, through: Optional[List[Any]] = None) -> str:
+    '''
+    Render the filtered export SELECT with parameters inlined via mogrify,
+    so the same text works for COPY and for a named server-side cursor.
+    after and through bound the key of the rows, exclusive and inclusive.
+    '''
+    base, keys, created_column = EXPORT_QUERIES[entity]
+    columns = ', '.join(column for column, _ in keys)
+    placeholders = ', '.join(['%s'] * len(keys))
+    conditions: List[str] = []
+    args: List[Any] = []
+    if params.get('role'):
+        conditions.append('u.role = %s')
+        args.append(params['role'])
+    if params.get('is_banned') in ('true', 'false'):
+        conditions.append('u.is_banned = %s')
+        args.append(params['is_banned'] == 'true')
+    if params.get('created_from'):
+        conditions.append(f'{created_column} >= %s')
+        args.append(date.fromisoformat(params['created_from']))
+    if params.get('created_to'):
+        conditions.append(f'{created_column} < %s::date + 1')
+        args.append(date.fromisoformat(params['created_to']))
+    if after is not None:
+        conditions.append(f'({columns}) > ({placeholders})')
+        args.extend(after)
+    if through is not None:
+        conditions.append(f'({columns}) <= ({placeholders})')
+        args.extend(through)
+
+    query = base
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += f' ORDER BY {columns}'
+    return cur.mogrify(query, args).decode()
+
+
+def page_end(cur: Any, entity: str, query: str) -> Optional[List[Any]]:
+    '''Key of the last row of a full page of query when more rows follow it, None on the last page'''
+    names = ', '.join(column.split('.')[1] for column, _ in EXPORT_QUERIES[entity][1])
+    cur.execute(f'SELECT {names} FROM ({query}) page ORDER BY {names} OFFSET {EXPORT_PAGE_ROWS - 1} LIMIT 2')
+    rows = cur.fetchall()
+    return list(rows[0]) if len(rows) == 2 else None
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def write_export(conn: Any, query: str, fmt: str, sink: IO[bytes], header: bool = True) -> int:
+    '''
+    CSV goes through COPY ... TO STDOUT, NDJSON through a named cursor read in
+    EXPORT_BATCH_SIZE chunks; either way rows never pile up in Python.
+    Returns the number of exported rows.
+    '''
+    if fmt == 'csv':
+        cur = conn.cursor()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV{' HEADER' if header else ''}", sink)
+        count = max(cur.rowcount, 0)
+        cur.close()
+        return count
+
+    cur = conn.cursor(name='admin_export')
+    cur.itersize = EXPORT_BATCH_SIZE
+    cur.execute(query)
+    count = 0
+    columns = None
+    for row in cur:
+        if columns is None:
+            columns = [c.name for c in cur.description]
+        sink.write(json.dumps(dict(zip(columns, row)), default=_json_default, ensure_ascii=False).encode())
+        sink.write(b'\n')
+        count += 1
+    cur.close()
+    return count
+
+
+def export_gzip(conn: Any, entity: str, fmt: str, params: Dict[str, Any]) -> Tuple[bytes, int, Optional[str]]:
+    '''
+    One page of the export: up to EXPORT_PAGE_ROWS rows after params['after'],
+    gzip-compressed in memory, and the after value of the next page (None on
+    the last one). Only the first CSV page has a header, so pages concatenate. The page is cut at a key found first, so rows inserted
+    meanwhile widen it slightly rather than shifting rows between pages.
+    Raises ValueError on a malformed date filter or after value.
+    '''
+    cur = conn.cursor()
+    after = parse_after(entity, params.get('after'))
+    end = page_end(cur, entity, build_export_query(cur, entity, params, after))
+    query = build_export_query(cur, entity, params, after, end)
+    cur.close()
+
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as sink:
+        count = write_export(conn, query, fmt, sink, header=after is None)
+    conn.rollback()
+    return buffer.getvalue(), count, ','.join(str(v) for v in end) if end is not None else None
@@ -1,7 +1,438 @@
-import json
-import os
-import psycopg2
-from typing import Dict, Any
+import base64
+from datetime import date, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional
+from cache import catalog_cache
+from db import acquire, release, stats
+from export import EXPORT_QUERIES, export_gzip
+from response import json_response
+from router import MeteredCursor, Router
+from session import InvalidToken, authenticate, ban_versions
+from trending import refresh_trending
+
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+MAX_BULK_IDS = 10000
+BAD_BULK_INPUT = (TypeError, ValueError, AttributeError, InvalidOperation)
+STATS_BUCKET_DAYS = {'hour': 1 / 24, 'day': 1, 'week': 7, 'month': 30}
+DEFAULT_STATS_DAYS = 30
+MAX_STATS_BUCKETS = 1000
+MAX_STATS_TOP = 100
+
+def parse_ids(values: Any) -> List[int]:
+    '''Distinct ids in request order; raises ValueError when empty or over MAX_BULK_IDS'''
+    ids = list(dict.fromkeys(int(v) for v in values))
+    if not ids or len(ids) > MAX_BULK_IDS:
+        raise ValueError('id count out of range')
+    return ids
+
+def parse_amounts(values: Any) -> Dict[int, Decimal]:
+    '''{"id": amount} map from JSON; raises ValueError on empty, oversized or non-finite input'''
+    amounts = {int(k): Decimal(str(v)) for k, v in values.items()}
+    if not amounts or len(amounts) > MAX_BULK_IDS or not all(a.is_finite() for a in amounts.values()):
+        raise ValueError('amounts out of range')
+    return amounts
+
+def bulk_response(event: Dict[str, Any], ids: List[int], rows: List[tuple], field: Optional[str] = None) -> Dict[str, Any]:
+    '''Per-id outcome in request order from the RETURNING id[, value] rows of a bulk update'''
+    updated = {r[0]: r[1:] for r in rows}
+    results = []
+    for item_id in ids:
+        if item_id not in updated:
+            results.append({'id': item_id, 'status': 'not_found'})
+            continue
+        result = {'id': item_id, 'status': 'updated'}
+        if field:
+            result[field] = updated[item_id][0]
+        results.append(result)
+    return json_response(event, 200, {'results': results, 'updated': len(updated), 'not_found': len(ids) - len(updated)})
+
+router = Router('admin', default_actions={'GET': 'users'})
+
+@router.route('GET', 'users')
+def get_users(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    search = params.get('search', '')
+    if search:
+        cur.execute(
+            "SELECT id, email, username, role, balance, is_banned, is_verified, has_checkmark, created_at FROM users WHERE username ILIKE %s OR email ILIKE %s ORDER BY created_at DESC",
+            (f'%{search}%', f'%{search}%')
+        )
+    else:
+        cur.execute(
+            "SELECT id, email, username, role, balance, is_banned, is_verified, has_checkmark, created_at FROM users ORDER BY created_at DESC"
+        )
+    users = cur.fetchall()
+    
+    return json_response(event, 200, [{
+        'id': u[0],
+        'email': u[1],
+        'username': u[2],
+        'role': u[3],
+        'balance': u[4],
+        'is_banned': u[5],
+        'is_verified': u[6],
+        'has_checkmark': u[7],
+        'created_at': u[8]
+    } for u in users])
+
+@router.route('GET', 'export')
+def get_export(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    entity = params.get('entity', 'users')
+    fmt = params.get('format', 'csv')
+    
+    if entity not in EXPORT_QUERIES or fmt not in EXPORT_CONTENT_TYPES:
+        return json_response(event, 400, {'error': 'Unknown entity or format'})
+    
+    try:
+        data, count, next_after = export_gzip(conn, entity, fmt, params)
+    except ValueError:
+        return json_response(event, 400, {'error': 'Invalid date filter or after value'})
+    
+    headers = {
+        'Content-Type': EXPORT_CONTENT_TYPES[fmt],
+        'Content-Encoding': 'gzip',
+        'Content-Disposition': f'attachment; filename="{entity}.{fmt}"',
+        'X-Export-Rows': str(count),
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'Content-Disposition, X-Export-Rows, X-Next-After'
+    }
+    if next_after is not None:
+        headers['X-Next-After'] = next_after
+    
+    return {
+        'statusCode': 200,
+        'headers': headers,
+        'isBase64Encoded': True,
+        'body': base64.b64encode(data).decode()
+    }
+
+@router.route('GET', 'pool_stats')
+def get_pool_stats(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    return json_response(event, 200, stats())
+
+@router.route('GET', 'sales_stats')
+def get_sales_stats(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    bucket = params.get('bucket', 'day')
+    try:
+        day_to = date.fromisoformat(params['to']) if params.get('to') else date.today()
+        day_from = date.fromisoformat(params['from']) if params.get('from') else day_to - timedelta(days=DEFAULT_STATS_DAYS - 1)
+        top = min(max(int(params.get('top', 10)), 1), MAX_STATS_TOP)
+    except ValueError:
+        return json_response(event, 400, {'error': 'Invalid from, to or top'})
+    
+    days = (day_to - day_from).days + 1
+    if bucket not in STATS_BUCKET_DAYS or days < 1 or days / STATS_BUCKET_DAYS[bucket] > MAX_STATS_BUCKETS:
+        return json_response(event, 400, {'error': f'bucket must be one of {", ".join(STATS_BUCKET_DAYS)} with at most {MAX_STATS_BUCKETS} buckets in range'})
+    day_end = day_to + timedelta(days=1)
+    
+    cur.execute(
+        """SELECT date_trunc(%s, bucket) AS b, kind, SUM(sales), SUM(amount)
+        FROM sales_hourly
+        WHERE bucket >= %s AND bucket < %s
+        GROUP BY 1, 2
+        ORDER BY 1, 2""",
+        (bucket, day_from, day_end)
+    )
+    series: List[Dict[str, Any]] = []
+    totals: Dict[str, Dict[str, Any]] = {}
+    for started, kind, sales, amount in cur.fetchall():
+        if not series or series[-1]['bucket'] != started:
+            series.append({'bucket': started})
+        series[-1][kind] = {'sales': sales, 'amount': amount}
+        total = totals.setdefault(kind, {'sales': 0, 'amount': 0})
+        total['sales'] += sales
+        total['amount'] += amount
+    
+    cur.execute(
+        """SELECT t.item_id, g.title, t.sales, t.revenue, t.refunded
+        FROM (
+            SELECT item_id,
+                COALESCE(SUM(sales) FILTER (WHERE kind = 'game'), 0) AS sales,
+                COALESCE(SUM(amount) FILTER (WHERE kind = 'game'), 0) AS revenue,
+                COALESCE(SUM(amount) FILTER (WHERE kind = 'refund'), 0) AS refunded
+            FROM sales_daily_items
+            WHERE day >= %s AND day < %s AND kind IN ('game', 'refund')
+            GROUP BY item_id
+            ORDER BY revenue DESC, item_id
+            LIMIT %s
+        ) t
+        LEFT JOIN games g ON g.id = t.item_id
+        ORDER BY t.revenue DESC, t.item_id""",
+        (day_from, day_end, top)
+    )
+    top_games = [{
+        'game_id': g[0],
+        'title': g[1],
+        'sales': g[2],
+        'revenue': g[3],
+        'refunded': g[4]
+    } for g in cur.fetchall()]
+    
+    cur.execute(
+        """SELECT t.seller_id, u.username, t.sales, t.turnover
+        FROM (
+            SELECT seller_id, SUM(sales) AS sales, SUM(amount) AS turnover
+            FROM sales_daily_sellers
+            WHERE day >= %s AND day < %s
+            GROUP BY seller_id
+            ORDER BY turnover DESC, seller_id
+            LIMIT %s
+        ) t
+        LEFT JOIN users u ON u.id = t.seller_id
+        ORDER BY t.turnover DESC, t.seller_id""",
+        (day_from, day_end, top)
+    )
+    top_sellers = [{
+        'user_id': u[0],
+        'username': u[1],
+        'sales': u[2],
+        'turnover': u[3]
+    } for u in cur.fetchall()]
+    
+    return json_response(event, 200, {
+        'bucket': bucket,
+        'from': day_from,
+        'to': day_to,
+        'totals': totals,
+        'series': series,
+        'top_games': top_games,
+        'top_sellers': top_sellers
+    })
+
+@router.route('PUT', 'ban')
+def ban(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    
+    cur.execute(
+        "UPDATE users SET is_banned = %s, ban_version = ban_version + 1 WHERE id = %s",
+        (True, user_id)
+    )
+    conn.commit()
+    ban_versions.forget(user_id)
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'unban')
+def unban(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    
+    cur.execute(
+        "UPDATE users SET is_banned = %s WHERE id = %s",
+        (False, user_id)
+    )
+    conn.commit()
+    ban_versions.forget(user_id)
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'update_balance')
+def update_balance(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    
+    balance = body_data.get('balance')
+    cur.execute(
+        "UPDATE users SET balance = %s WHERE id = %s",
+        (balance, user_id)
+    )
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'update_game_price')
+def update_game_price(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    game_id = body_data.get('game_id')
+    price = body_data.get('price')
+    cur.execute(
+        "UPDATE games SET price = %s WHERE id = %s",
+        (price, game_id)
+    )
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'toggle_popular')
+def toggle_popular(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    game_id = body_data.get('game_id')
+    is_popular = body_data.get('is_popular')
+    cur.execute(
+        "UPDATE games SET is_popular = %s WHERE id = %s",
+        (is_popular, game_id)
+    )
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'refresh_trending')
+def refresh_trending_scores(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    result = refresh_trending(cur)
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return json_response(event, 200, result)
+
+@router.route('PUT', 'toggle_verified')
+def toggle_verified(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    
+    cur.execute(
+        "UPDATE users SET is_verified = NOT is_verified WHERE id = %s RETURNING is_verified",
+        (user_id,)
+    )
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'toggle_checkmark')
+def toggle_checkmark(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    
+    cur.execute(
+        "UPDATE users SET has_checkmark = NOT has_checkmark WHERE id = %s RETURNING has_checkmark",
+        (user_id,)
+    )
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('PUT', 'bulk_ban')
+def bulk_ban(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        user_ids = parse_ids(body_data.get('user_ids'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'user_ids must list 1-{MAX_BULK_IDS} ids'})
+    
+    cur.execute(
+        """UPDATE users u SET is_banned = TRUE, ban_version = u.ban_version + 1
+        FROM unnest(%s::int[]) AS t(id)
+        WHERE u.id = t.id
+        RETURNING u.id""",
+        (user_ids,)
+    )
+    rows = cur.fetchall()
+    conn.commit()
+    for row in rows:
+        ban_versions.forget(row[0])
+    
+    return bulk_response(event, user_ids, rows)
+
+@router.route('PUT', 'bulk_unban')
+def bulk_unban(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        user_ids = parse_ids(body_data.get('user_ids'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'user_ids must list 1-{MAX_BULK_IDS} ids'})
+    
+    cur.execute(
+        """UPDATE users u SET is_banned = FALSE
+        FROM unnest(%s::int[]) AS t(id)
+        WHERE u.id = t.id
+        RETURNING u.id""",
+        (user_ids,)
+    )
+    rows = cur.fetchall()
+    conn.commit()
+    for row in rows:
+        ban_versions.forget(row[0])
+    
+    return bulk_response(event, user_ids, rows)
+
+@router.route('PUT', 'bulk_update_balance')
+def bulk_update_balance(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        balances = parse_amounts(body_data.get('balances'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'balances must map 1-{MAX_BULK_IDS} user ids to amounts'})
+    
+    cur.execute(
+        """UPDATE users u SET balance = t.balance
+        FROM unnest(%s::int[], %s::numeric[]) AS t(id, balance)
+        WHERE u.id = t.id
+        RETURNING u.id, u.balance""",
+        (list(balances), list(balances.values()))
+    )
+    rows = cur.fetchall()
+    conn.commit()
+    
+    return bulk_response(event, list(balances), rows, 'balance')
+
+@router.route('PUT', 'bulk_toggle_verified')
+def bulk_toggle_verified(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        user_ids = parse_ids(body_data.get('user_ids'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'user_ids must list 1-{MAX_BULK_IDS} ids'})
+    
+    cur.execute(
+        """UPDATE users u SET is_verified = NOT u.is_verified
+        FROM unnest(%s::int[]) AS t(id)
+        WHERE u.id = t.id
+        RETURNING u.id, u.is_verified""",
+        (user_ids,)
+    )
+    rows = cur.fetchall()
+    conn.commit()
+    
+    return bulk_response(event, user_ids, rows, 'is_verified')
+
+@router.route('PUT', 'bulk_toggle_checkmark')
+def bulk_toggle_checkmark(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        user_ids = parse_ids(body_data.get('user_ids'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'user_ids must list 1-{MAX_BULK_IDS} ids'})
+    
+    cur.execute(
+        """UPDATE users u SET has_checkmark = NOT u.has_checkmark
+        FROM unnest(%s::int[]) AS t(id)
+        WHERE u.id = t.id
+        RETURNING u.id, u.has_checkmark""",
+        (user_ids,)
+    )
+    rows = cur.fetchall()
+    conn.commit()
+    
+    return bulk_response(event, user_ids, rows, 'has_checkmark')
+
+@router.route('PUT', 'bulk_update_game_price')
+def bulk_update_game_price(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        prices = parse_amounts(body_data.get('prices'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'prices must map 1-{MAX_BULK_IDS} game ids to amounts'})
+    
+    cur.execute(
+        """UPDATE games g SET price = t.price
+        FROM unnest(%s::int[], %s::numeric[]) AS t(id, price)
+        WHERE g.id = t.id
+        RETURNING g.id, g.price""",
+        (list(prices), list(prices.values()))
+    )
+    rows = cur.fetchall()
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return bulk_response(event, list(prices), rows, 'price')
+
+@router.route('PUT', 'bulk_toggle_popular')
+def bulk_toggle_popular(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        game_ids = parse_ids(body_data.get('game_ids'))
+    except BAD_BULK_INPUT:
+        return json_response(event, 400, {'error': f'game_ids must list 1-{MAX_BULK_IDS} ids'})
+    
+    cur.execute(
+        """UPDATE games g SET is_popular = %s
+        FROM unnest(%s::int[]) AS t(id)
+        WHERE g.id = t.id
+        RETURNING g.id, g.is_popular""",
+        (bool(body_data.get('is_popular')), game_ids)
+    )
+    rows = cur.fetchall()
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return bulk_response(event, game_ids, rows, 'is_popular')
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -18,164 +449,35 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
+    try:
+        session = authenticate(event)
+    except InvalidToken:
+        return json_response(event, 401, {'error': 'Invalid or expired session'})
+    
+    if session is None:
+        return json_response(event, 401, {'error': 'Admin session required'})
+    if session['role'] != 'admin':
+        return json_response(event, 403, {'error': 'Admin role required'})
+    
+    metrics = router.metrics_response(event)
+    if metrics is not None:
+        return metrics
+    
+    conn = acquire()
+    conn.cursor_factory = MeteredCursor
     cur = conn.cursor()
     
     try:
-        if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            action = params.get('action', 'users')
-            
-            if action == 'users':
-                search = params.get('search', '')
-                if search:
-                    cur.execute(
-                        "SELECT id, email, username, role, balance, is_banned, is_verified, has_checkmark, created_at FROM users WHERE username ILIKE %s OR email ILIKE %s ORDER BY created_at DESC",
-                        (f'%{search}%', f'%{search}%')
-                    )
-                else:
-                    cur.execute(
-                        "SELECT id, email, username, role, balance, is_banned, is_verified, has_checkmark, created_at FROM users ORDER BY created_at DESC"
-                    )
-                users = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': u[0],
-                        'email': u[1],
-                        'username': u[2],
-                        'role': u[3],
-                        'balance': float(u[4]),
-                        'is_banned': u[5],
-                        'is_verified': u[6],
-                        'has_checkmark': u[7],
-                        'created_at': str(u[8])
-                    } for u in users])
-                }
-        
-        elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action')
-            user_id = body_data.get('user_id')
-            
-            if action == 'ban':
-                cur.execute(
-                    "UPDATE users SET is_banned = %s WHERE id = %s",
-                    (True, user_id)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'unban':
-                cur.execute(
-                    "UPDATE users SET is_banned = %s WHERE id = %s",
-                    (False, user_id)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'update_balance':
-                balance = body_data.get('balance')
-                cur.execute(
-                    "UPDATE users SET balance = %s WHERE id = %s",
-                    (balance, user_id)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'update_game_price':
-                game_id = body_data.get('game_id')
-                price = body_data.get('price')
-                cur.execute(
-                    "UPDATE games SET price = %s WHERE id = %s",
-                    (price, game_id)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'toggle_popular':
-                game_id = body_data.get('game_id')
-                is_popular = body_data.get('is_popular')
-                cur.execute(
-                    "UPDATE games SET is_popular = %s WHERE id = %s",
-                    (is_popular, game_id)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'toggle_verified':
-                cur.execute(
-                    "UPDATE users SET is_verified = NOT is_verified WHERE id = %s RETURNING is_verified",
-                    (user_id,)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'toggle_checkmark':
-                cur.execute(
-                    "UPDATE users SET has_checkmark = NOT has_checkmark WHERE id = %s RETURNING has_checkmark",
-                    (user_id,)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
+        if not ban_versions.is_current(cur, session):
+            return json_response(event, 403, {'error': 'Session revoked'})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return router.dispatch(event, cur, conn)
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release(conn)
\ No newline at end of file
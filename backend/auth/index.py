@@ -1,7 +1,71 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any
+import math
+from typing import Dict, Any, Optional
+from db import acquire, release
+from passwords import hash_password, verify_password
+from ratelimit import auth_limiter, client_ip
+from response import CORS_HEADERS, json_response
+from router import MeteredCursor, Router
+from session import issue_token
+
+DUMMY_PASSWORD_HASH = hash_password('')
+
+router = Router('auth')
+
+@router.route('POST', 'register')
+def register(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    email = body_data.get('email')
+    password = body_data.get('password')
+    
+    cur.execute(
+        "INSERT INTO users (email, password) VALUES (%s, %s) RETURNING id, email, role, balance, is_banned, ban_version",
+        (email, hash_password(password))
+    )
+    user = cur.fetchone()
+    conn.commit()
+    
+    return json_response(event, 200, {
+        'id': user[0],
+        'email': user[1],
+        'role': user[2],
+        'balance': float(user[3]),
+        'is_banned': user[4],
+        'token': issue_token(user[0], user[2], user[5])
+    })
+
+@router.route('POST', 'login')
+def login(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    email = body_data.get('email')
+    password = body_data.get('password')
+    
+    cur.execute(
+        "SELECT id, email, role, balance, is_banned, ban_version, password FROM users WHERE email = %s",
+        (email,)
+    )
+    user = cur.fetchone()
+    matches, needs_rehash = verify_password(password or '', user[6] if user else DUMMY_PASSWORD_HASH)
+    
+    if not user or not matches:
+        return json_response(event, 401, {'error': 'Invalid credentials'})
+    
+    if user[4]:
+        return json_response(event, 403, {'error': 'Вы заблокированы'})
+    
+    if needs_rehash:
+        cur.execute(
+            "UPDATE users SET password = %s WHERE id = %s",
+            (hash_password(password), user[0])
+        )
+        conn.commit()
+    
+    return json_response(event, 200, {
+        'id': user[0],
+        'email': user[1],
+        'role': user[2],
+        'balance': float(user[3]),
+        'is_banned': user[4],
+        'token': issue_token(user[0], user[2], user[5])
+    })
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -18,85 +82,33 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
+    metrics = router.metrics_response(event)
+    if metrics is not None:
+        return metrics
+    
+    if method == 'GET' and (event.get('queryStringParameters') or {}).get('action') == 'rate_limit_stats':
+        return json_response(event, 200, auth_limiter.stats())
+    
+    body_data = json.loads(event.get('body', '{}')) if method == 'POST' else {}
+    
+    conn = acquire()
+    conn.cursor_factory = MeteredCursor
     cur = conn.cursor()
     
     try:
-        if method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action')
-            email = body_data.get('email')
-            password = body_data.get('password')
-            
-            if action == 'register':
-                cur.execute(
-                    "INSERT INTO users (email, password) VALUES (%s, %s) RETURNING id, email, role, balance, is_banned",
-                    (email, password)
-                )
-                user = cur.fetchone()
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'id': user[0],
-                        'email': user[1],
-                        'role': user[2],
-                        'balance': float(user[3]),
-                        'is_banned': user[4]
-                    })
-                }
-            
-            elif action == 'login':
-                cur.execute(
-                    "SELECT id, email, role, balance, is_banned FROM users WHERE email = %s AND password = %s",
-                    (email, password)
-                )
-                user = cur.fetchone()
-                
-                if not user:
-                    return {
-                        'statusCode': 401,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Invalid credentials'})
-                    }
-                
-                if user[4]:
-                    return {
-                        'statusCode': 403,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Вы заблокированы'})
-                    }
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({
-                        'id': user[0],
-                        'email': user[1],
-                        'role': user[2],
-                        'balance': float(user[3]),
-                        'is_banned': user[4]
-                    })
-                }
+        if body_data.get('action') in ('login', 'register'):
+            retry_after = auth_limiter.check(cur, client_ip(event), body_data.get('email'))
+            if retry_after:
+                return json_response(event, 429, {'error': 'Too many attempts, try again later'},
+                                     {**CORS_HEADERS, 'Retry-After': str(math.ceil(retry_after))})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return router.dispatch(event, cur, conn)
     finally:
         cur.close()
-        conn.close()
+        release(conn)
@@ -0,0 +1,42 @@
+'''
+Business: Salted PBKDF2 password hashing with configurable cost
+Args: PASSWORD_HASH_ITERATIONS env var, plain password and stored value
+Returns: encoded hash for storage and verification with rehash hint
+'''
+import base64
+import hashlib
+import hmac
+import os
+from typing import Tuple
+
+HASH_ITERATIONS: int = int(os.environ.get('PASSWORD_HASH_ITERATIONS', '310000'))
+HASH_SCHEME = 'pbkdf2_sha256'
+SALT_BYTES = 16
+
+
+def hash_password(password: str, iterations: int = HASH_ITERATIONS) -> str:
+    '''Encoded as pbkdf2_sha256$<iterations>$<salt>$<hash>, fits users.password'''
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return '$'.join([
+        HASH_SCHEME,
+        str(iterations),
+        base64.b64encode(salt).decode(),
+        base64.b64encode(digest).decode(),
+    ])
+
+
+def verify_password(password: str, stored: str) -> Tuple[bool, bool]:
+    '''
+    Returns (matches, needs_rehash). Rows still holding the legacy plain-text
+    value are compared in constant time and flagged for rehash, as are hashes
+    made with a different iteration count than the current setting.
+    '''
+    parts = stored.split('$')
+    if len(parts) != 4 or parts[0] != HASH_SCHEME:
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+
+    iterations = int(parts[1])
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), base64.b64decode(parts[2]), iterations)
+    matches = hmac.compare_digest(digest, base64.b64decode(parts[3]))
+    return matches, matches and iterations != HASH_ITERATIONS
@@ -0,0 +1,111 @@
+'''
+Business: Token-bucket limiter for login/register keyed by client IP and email
+Args: AUTH_RATE_* env vars; buckets live in the auth_rate_buckets table so every instance shares them
+Returns: auth_limiter whose check() gives 0 to admit or seconds to retry after
+'''
+import os
+from typing import Dict, Any, List, Optional, Tuple
+
+# Rows whose bucket has refilled are deleted on every PRUNE_EVERY-th check
+PRUNE_EVERY: int = int(os.environ.get('AUTH_RATE_PRUNE_EVERY', '1000'))
+
+RULES: List[Tuple[str, float, float]] = [
+    ('ip', float(os.environ.get('AUTH_RATE_IP_BURST', '20')), float(os.environ.get('AUTH_RATE_IP_PER_MINUTE', '30')) / 60),
+    ('email', float(os.environ.get('AUTH_RATE_EMAIL_BURST', '5')), float(os.environ.get('AUTH_RATE_EMAIL_PER_MINUTE', '5')) / 60),
+    ('global', float(os.environ.get('AUTH_RATE_GLOBAL_BURST', '200')), float(os.environ.get('AUTH_RATE_GLOBAL_PER_SECOND', '100'))),
+]
+
+REFILLED = "LEAST(%(capacity)s, b.tokens + EXTRACT(EPOCH FROM now() - b.updated_at) * %(rate)s)"
+
+
+class PostgresStore:
+    '''
+    One row per bucket, updated by a single upsert so concurrent instances
+    serialize on the row lock. A rejected take leaves the row untouched, which
+    is how RETURNING tells the two outcomes apart: only a take that got a token
+    moves updated_at to now().
+    '''
+
+    def take(self, cur: Any, key: str, capacity: float, rate: float) -> float:
+        cur.execute(
+            f"""INSERT INTO auth_rate_buckets AS b (key, tokens, updated_at)
+            VALUES (%(key)s, %(capacity)s - 1, now())
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = CASE WHEN {REFILLED} >= 1 THEN {REFILLED} - 1 ELSE b.tokens END,
+                updated_at = CASE WHEN {REFILLED} >= 1 THEN now() ELSE b.updated_at END
+            RETURNING CASE WHEN b.updated_at = now() THEN 0 ELSE (1 - {REFILLED}) / %(rate)s END""",
+            {'key': key, 'capacity': capacity, 'rate': rate}
+        )
+        return float(cur.fetchone()[0])
+
+    def prune(self, cur: Any, rules: List[Tuple[str, float, float]]) -> None:
+        '''Drop rows idle long enough to have refilled under every rule; a missing row is a full bucket'''
+        refill_seconds = max(capacity / rate for _, capacity, rate in rules)
+        cur.execute(
+            "DELETE FROM auth_rate_buckets WHERE updated_at < now() - make_interval(secs => %s)",
+            (refill_seconds,)
+        )
+
+
+class RateLimiter:
+    '''
+    Every rule is a token bucket; a request must get a token from each
+    bucket it maps to. The takes are committed on their own, before the
+    request runs, so a failing login still spends its tokens. If the store
+    errors the request is admitted, since shedding all logins would be worse
+    than a short unlimited window.
+    '''
+
+    def __init__(self, store: Any, rules: List[Tuple[str, float, float]] = RULES) -> None:
+        self.store = store
+        self.rules = rules
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {name: 0 for name, _, _ in rules}
+        self.store_errors = 0
+        self.checks = 0
+
+    def check(self, cur: Any, ip: Optional[str], email: Optional[str]) -> float:
+        subjects = {'global': 'all', 'ip': ip, 'email': (email or '').strip().lower() or None}
+        if self.checks % PRUNE_EVERY == 0:
+            self._run(cur, lambda: self.store.prune(cur, self.rules))
+        self.checks += 1
+        for name, capacity, rate in self.rules:
+            if subjects.get(name) is None:
+                continue
+            wait = self._run(cur, lambda: self.store.take(cur, f'{name}:{subjects[name]}', capacity, rate))
+            if wait:
+                self.rejected[name] += 1
+                return wait
+        self.admitted += 1
+        return 0.0
+
+    def _run(self, cur: Any, step: Any) -> Any:
+        '''Run one store call in its own transaction; errors are counted and read as admit'''
+        try:
+            result = step()
+            cur.connection.commit()
+            return result
+        except Exception:
+            cur.connection.rollback()
+            self.store_errors += 1
+            return 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'admitted': self.admitted,
+            'rejected': sum(self.rejected.values()),
+            'rejected_by_rule': dict(self.rejected),
+            'store_errors': self.store_errors,
+        }
+
+
+def client_ip(event: Dict[str, Any]) -> Optional[str]:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    if identity.get('sourceIp'):
+        return identity['sourceIp']
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    forwarded = headers.get('x-forwarded-for', '')
+    return forwarded.split(',')[0].strip() or headers.get('x-real-ip') or None
+
+
+auth_limiter = RateLimiter(PostgresStore())
@@ -0,0 +1,164 @@
+'''
+Business: Declarative (method, action) routing with per-route metrics
+Args: route functions taking (event, params or body, cursor, connection)
+Returns: dispatch() for handler() and Prometheus text on GET ?action=metrics,
+         route metrics followed by this instance's connection pool counters
+'''
+import json
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional, Tuple
+
+import psycopg2.extensions
+
+from db import stats as pool_stats
+from response import json_response
+
+LATENCY_BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BODY_METHODS = ('POST', 'PUT', 'DELETE')
+# db.stats() key, metric name and type for each pool sample; ratios and averages are left to the query side
+POOL_METRICS: Tuple[Tuple[str, str, str], ...] = (
+    ('pool_size', 'db_pool_size', 'gauge'),
+    ('idle', 'db_pool_idle_connections', 'gauge'),
+    ('in_use', 'db_pool_in_use_connections', 'gauge'),
+    ('hits', 'db_pool_hits_total', 'counter'),
+    ('misses', 'db_pool_misses_total', 'counter'),
+    ('waits', 'db_pool_waits_total', 'counter'),
+    ('wait_ms', 'db_pool_wait_milliseconds_total', 'counter'),
+    ('connect_ms', 'db_pool_connect_milliseconds_total', 'counter'),
+    ('discarded', 'db_pool_discarded_total', 'counter'),
+    ('registered_statements', 'db_prepared_statements', 'gauge'),
+    ('prepares', 'db_prepares_total', 'counter'),
+    ('prepared_executions', 'db_prepared_executions_total', 'counter'),
+)
+
+RouteFunc = Callable[[Dict[str, Any], Dict[str, Any], Any, Any], Optional[Dict[str, Any]]]
+
+_counters = threading.local()
+
+
+class MeteredCursor(psycopg2.extensions.cursor):
+    '''Counts statements and result rows for the route currently dispatching'''
+
+    def execute(self, query: Any, vars: Any = None) -> None:
+        super().execute(query, vars)
+        _counters.queries = getattr(_counters, 'queries', 0) + 1
+        if self.description is not None and self.rowcount > 0:
+            _counters.rows = getattr(_counters, 'rows', 0) + self.rowcount
+
+
+class RouteStats:
+    def __init__(self) -> None:
+        self.buckets: List[int] = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.statuses: Dict[int, int] = {}
+
+    def observe(self, seconds: float, status: int, queries: int, rows: int) -> None:
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+        self.count += 1
+        self.seconds += seconds
+        self.queries += queries
+        self.rows += rows
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class Router:
+    '''
+    Routes are keyed by (method, action); action None is the fallback for
+    the method. GET reads the action from query params, POST/PUT/DELETE from
+    the JSON body. A route returning None falls through to 405 as before.
+    '''
+
+    def __init__(self, function: str, default_actions: Optional[Dict[str, str]] = None) -> None:
+        self.function = function
+        self.default_actions = default_actions or {}
+        self.routes: Dict[Tuple[str, Optional[str]], RouteFunc] = {}
+        self.stats: Dict[str, RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def route(self, method: str, action: Optional[str] = None) -> Callable[[RouteFunc], RouteFunc]:
+        def register(func: RouteFunc) -> RouteFunc:
+            self.routes[(method, action)] = func
+            return func
+        return register
+
+    def dispatch(self, event: Dict[str, Any], cur: Any, conn: Any) -> Dict[str, Any]:
+        started = time.perf_counter()
+        method: str = event.get('httpMethod', 'GET')
+        if method in BODY_METHODS:
+            data = json.loads(event.get('body') or '{}')
+        else:
+            data = event.get('queryStringParameters') or {}
+        action = data.get('action', self.default_actions.get(method))
+        key = (method, action) if (method, action) in self.routes else (method, None)
+        func = self.routes.get(key)
+
+        _counters.queries = 0
+        _counters.rows = 0
+        try:
+            response = func(event, data, cur, conn) if func is not None else None
+        except Exception:
+            self.observe(f'{method} {key[1]}' if key[1] else method, started, {'statusCode': 500})
+            raise
+        if response is None:
+            response = json_response(event, 405, {'error': 'Method not allowed'})
+        name = f'{method} {key[1]}' if func is not None and key[1] else method
+        return self.observe(name, started, response)
+
+    def observe(self, name: str, started: float, response: Dict[str, Any]) -> Dict[str, Any]:
+        '''Record one request against a route; also used for paths served before dispatch'''
+        seconds = time.perf_counter() - started
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = RouteStats()
+            stats.observe(seconds, response['statusCode'], getattr(_counters, 'queries', 0), getattr(_counters, 'rows', 0))
+        _counters.queries = 0
+        _counters.rows = 0
+        return response
+
+    def render(self) -> str:
+        families: Dict[str, List[str]] = {
+            'route_duration_seconds histogram': [],
+            'route_requests_total counter': [],
+            'route_db_queries_total counter': [],
+            'route_db_rows_total counter': [],
+        }
+        duration, requests, queries, rows = families.values()
+        with self._lock:
+            for name in sorted(self.stats):
+                stats = self.stats[name]
+                labels = f'function="{self.function}",route="{name}"'
+                for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                    duration.append(f'route_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                duration.append(f'route_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                duration.append(f'route_duration_seconds_sum{{{labels}}} {stats.seconds:.6f}')
+                duration.append(f'route_duration_seconds_count{{{labels}}} {stats.count}')
+                for status, count in sorted(stats.statuses.items()):
+                    requests.append(f'route_requests_total{{{labels},status="{status}"}} {count}')
+                queries.append(f'route_db_queries_total{{{labels}}} {stats.queries}')
+                rows.append(f'route_db_rows_total{{{labels}}} {stats.rows}')
+        pool = pool_stats()
+        for key, metric, kind in POOL_METRICS:
+            families[f'{metric} {kind}'] = [f'{metric}{{function="{self.function}"}} {pool[key]}']
+        lines: List[str] = []
+        for family, samples in families.items():
+            lines.append(f'# TYPE {family}')
+            lines.extend(samples)
+        return '\n'.join(lines) + '\n'
+
+    def metrics_response(self, event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        '''Prometheus exposition for GET ?action=metrics, None for any other request'''
+        if event.get('httpMethod') != 'GET' or (event.get('queryStringParameters') or {}).get('action') != 'metrics':
+            return None
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'text/plain; version=0.0.4', 'Access-Control-Allow-Origin': '*'},
+            'isBase64Encoded': False,
+            'body': self.render()
+        }
@@ -0,0 +1,222 @@
+'''
+Business: Module-level PostgreSQL connection pool shared by warm invocations
+Args: DATABASE_URL, DB_POOL_SIZE, DB_POOL_TIMEOUT, DB_POOL_CHECK_AFTER,
+      DB_PREPARE_STATEMENTS, DB_PREPARED_PER_CONNECTION, DB_STATEMENT_REGISTRY_SIZE env vars
+Returns: acquire()/release() pair used by handler(), statement() for hot queries
+         prepared once per pooled connection, plus stats() for monitoring
+'''
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+import psycopg2
+import psycopg2.extensions
+from typing import Dict, Any, List, Optional, Sequence, Set, Tuple
+
+POOL_SIZE: int = int(os.environ.get('DB_POOL_SIZE', '4'))
+POOL_TIMEOUT: float = float(os.environ.get('DB_POOL_TIMEOUT', '5'))
+CHECK_AFTER: float = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+PREPARE_STATEMENTS: bool = os.environ.get('DB_PREPARE_STATEMENTS', '1') != '0'
+PREPARED_PER_CONNECTION: int = int(os.environ.get('DB_PREPARED_PER_CONNECTION', '64'))
+STATEMENT_REGISTRY_SIZE: int = int(os.environ.get('DB_STATEMENT_REGISTRY_SIZE', '256'))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+_lock = threading.Condition()
+_idle: List[Tuple[Any, float]] = []
+_in_use: int = 0
+_stats: Dict[str, float] = {
+    'hits': 0,
+    'misses': 0,
+    'waits': 0,
+    'wait_ms': 0.0,
+    'connect_ms': 0.0,
+    'discarded': 0,
+    'prepares': 0,
+    'prepared_executions': 0,
+}
+_statements: 'OrderedDict[str, Statement]' = OrderedDict()
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    '''Remembers which registered statements are already prepared in its session'''
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+
+
+class Statement:
+    '''
+    SQL with %s placeholders, registered under a name. execute() issues
+    PREPARE on the first use per connection and EXECUTE by name afterwards,
+    so Postgres parses and plans it once per session instead of per call.
+    With DB_PREPARE_STATEMENTS=0, on connections outside the pool, or once a
+    connection holds DB_PREPARED_PER_CONNECTION statements, it runs the SQL as is.
+    '''
+
+    def __init__(self, name: str, sql: str) -> None:
+        self.name = name
+        self.sql = sql
+        self.params = 0
+
+        def number(match: Any) -> str:
+            if match.group(0) == '%%':
+                return '%'
+            self.params += 1
+            return f'${self.params}'
+
+        self.prepare_sql = f'PREPARE {name} AS ' + re.sub(r'%%|%s', number, sql)
+        self.execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * self.params)})" if self.params else f'EXECUTE {name}'
+
+    def execute(self, cur: Any, args: Sequence[Any] = ()) -> None:
+        prepared = getattr(cur.connection, 'prepared', None)
+        if not PREPARE_STATEMENTS or prepared is None:
+            cur.execute(self.sql, args)
+            return
+        if self.name not in prepared:
+            if len(prepared) >= PREPARED_PER_CONNECTION:
+                cur.execute(self.sql, args)
+                return
+            cur.execute(self.prepare_sql)
+            prepared.add(self.name)
+            _stats['prepares'] += 1
+        cur.execute(self.execute_sql, args)
+        _stats['prepared_executions'] += 1
+
+
+def statement(name: str, sql: str) -> Statement:
+    '''
+    Registry lookup for a named statement. The name gets a digest of the SQL,
+    so query builders can pass one name for every shape they produce. Only the
+    DB_STATEMENT_REGISTRY_SIZE most recently used shapes are kept; an evicted
+    one is rebuilt under the same name, which connections that already
+    prepared it keep executing.
+    '''
+    key = f"{name}_{hashlib.md5(sql.encode()).hexdigest()[:10]}"
+    with _lock:
+        found = _statements.get(key)
+        if found is None:
+            found = _statements[key] = Statement(key, sql)
+            while len(_statements) > STATEMENT_REGISTRY_SIZE:
+                _statements.popitem(last=False)
+        else:
+            _statements.move_to_end(key)
+    return found
+
+
+def _connect() -> Any:
+    started = time.monotonic()
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'), connection_factory=PooledConnection)
+    _stats['connect_ms'] += (time.monotonic() - started) * 1000
+    return conn
+
+
+def _discard(conn: Any) -> None:
+    _stats['discarded'] += 1
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+def _healthy(conn: Any, last_used: float) -> bool:
+    if conn.closed:
+        return False
+    if time.monotonic() - last_used < CHECK_AFTER:
+        return True
+    try:
+        cur = conn.cursor()
+        cur.execute('SELECT 1')
+        cur.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def acquire() -> Any:
+    '''
+    Take a connection from the pool, opening a new one on a miss.
+    Blocks up to DB_POOL_TIMEOUT seconds when POOL_SIZE connections are in use.
+    '''
+    global _in_use
+    with _lock:
+        if not _idle and _in_use >= POOL_SIZE:
+            _stats['waits'] += 1
+            started = time.monotonic()
+            ready = _lock.wait_for(lambda: _idle or _in_use < POOL_SIZE, POOL_TIMEOUT)
+            _stats['wait_ms'] += (time.monotonic() - started) * 1000
+            if not ready:
+                raise PoolTimeout('No free database connection')
+        conn: Optional[Any] = None
+        if _idle:
+            conn, last_used = _idle.pop()
+        _in_use += 1
+
+    try:
+        if conn is not None and not _healthy(conn, last_used):
+            _discard(conn)
+            conn = None
+        if conn is None:
+            _stats['misses'] += 1
+            conn = _connect()
+        else:
+            _stats['hits'] += 1
+        return conn
+    except Exception:
+        with _lock:
+            _in_use -= 1
+            _lock.notify()
+        raise
+
+
+def release(conn: Any) -> None:
+    '''
+    Return a connection to the pool. Open transactions are rolled back;
+    connections that were dropped or fail the rollback are discarded.
+    '''
+    global _in_use
+    keep = not conn.closed
+    if keep and conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            keep = False
+    if not keep:
+        _discard(conn)
+
+    with _lock:
+        _in_use -= 1
+        if keep and len(_idle) < POOL_SIZE:
+            _idle.append((conn, time.monotonic()))
+        elif keep:
+            _discard(conn)
+        _lock.notify()
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        requests = _stats['hits'] + _stats['misses']
+        return {
+            'pool_size': POOL_SIZE,
+            'idle': len(_idle),
+            'in_use': _in_use,
+            'hits': int(_stats['hits']),
+            'misses': int(_stats['misses']),
+            'hit_ratio': round(_stats['hits'] / requests, 4) if requests else 0.0,
+            'waits': int(_stats['waits']),
+            'wait_ms': round(_stats['wait_ms'], 2),
+            'connect_ms': round(_stats['connect_ms'], 2),
+            'avg_connect_ms': round(_stats['connect_ms'] / _stats['misses'], 2) if _stats['misses'] else 0.0,
+            'discarded': int(_stats['discarded']),
+            'prepare_statements': PREPARE_STATEMENTS,
+            'registered_statements': len(_statements),
+            'prepares': int(_stats['prepares']),
+            'prepared_executions': int(_stats['prepared_executions']),
+        }
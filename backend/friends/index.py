@@ -1,7 +1,290 @@
-import json
-import os
-import psycopg2
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from db import acquire, release
+from realtime import notify_message, wait_for_messages
+from response import CORS_HEADERS, json_response
+from router import MeteredCursor, Router
+from session import InvalidToken, authenticate, ban_versions
+from suggestions import SUGGESTION_POOL, fetch_suggestions, lock_friend_graph, record_friendships
+
+DEFAULT_SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 50
+SEARCH_CANDIDATES = 200
+AUTOCOMPLETE_LIMIT = 10
+DEFAULT_MESSAGES_LIMIT = 50
+MAX_MESSAGES_LIMIT = 200
+DEFAULT_SUGGESTIONS_LIMIT = 10
+MAX_FRIEND_BATCH = 10000
+
+router = Router('friends')
+
+@router.route('GET', 'friends')
+def get_friends(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = params.get('user_id')
+    
+    cur.execute(
+        """SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.has_checkmark, u.active_frame_id, fr.image_url as frame_url
+        FROM t_p84121358_steam_clone_dark.friendships f 
+        JOIN t_p84121358_steam_clone_dark.users u ON f.friend_id = u.id 
+        LEFT JOIN t_p84121358_steam_clone_dark.frames fr ON u.active_frame_id = fr.id
+        WHERE f.user_id = %s""",
+        (user_id,)
+    )
+    friends = cur.fetchall()
+    
+    return json_response(event, 200, [{
+        'id': f[0],
+        'username': f[1],
+        'display_name': f[2],
+        'avatar_url': f[3],
+        'is_verified': f[4],
+        'has_checkmark': f[5],
+        'active_frame_id': f[6],
+        'frame_url': f[7]
+    } for f in friends])
+
+@router.route('GET', 'search')
+def search_users(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = params.get('user_id')
+    
+    search = params.get('search', '').strip().lower()
+    prefix = search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    
+    if params.get('mode') == 'autocomplete':
+        cur.execute(
+            """SELECT id, username, display_name, avatar_url
+            FROM t_p84121358_steam_clone_dark.users
+            WHERE lower(username) COLLATE "C" LIKE %s AND id != %s
+            ORDER BY lower(username) COLLATE "C"
+            LIMIT %s""",
+            (prefix, user_id, AUTOCOMPLETE_LIMIT)
+        )
+        users = cur.fetchall()
+        
+        return json_response(event, 200, [{
+            'id': u[0],
+            'username': u[1],
+            'display_name': u[2],
+            'avatar_url': u[3]
+        } for u in users])
+    
+    paginated = 'limit' in params or 'offset' in params
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_SEARCH_LIMIT)), 1), MAX_SEARCH_LIMIT)
+        offset = min(max(int(params.get('offset', 0)), 0), SEARCH_CANDIDATES - limit)
+    except ValueError:
+        return json_response(event, 400, {'error': 'Invalid limit or offset'})
+    
+    cur.execute(
+        """WITH candidates AS (
+            (SELECT id, username, display_name, avatar_url, is_verified, has_checkmark, active_frame_id
+             FROM t_p84121358_steam_clone_dark.users
+             WHERE lower(username) COLLATE "C" LIKE %(prefix)s
+             ORDER BY lower(username) COLLATE "C" LIMIT %(pool)s)
+            UNION
+            (SELECT id, username, display_name, avatar_url, is_verified, has_checkmark, active_frame_id
+             FROM t_p84121358_steam_clone_dark.users
+             WHERE lower(display_name) COLLATE "C" LIKE %(prefix)s
+             ORDER BY lower(display_name) COLLATE "C" LIMIT %(pool)s)
+        )
+        SELECT c.id, c.username, c.display_name, c.avatar_url, c.is_verified, c.has_checkmark, c.active_frame_id, f.image_url as frame_url
+        FROM candidates c
+        LEFT JOIN t_p84121358_steam_clone_dark.frames f ON c.active_frame_id = f.id
+        WHERE c.id != %(user_id)s
+        ORDER BY (lower(c.username) = %(term)s OR lower(c.display_name) = %(term)s) DESC,
+            c.has_checkmark DESC, c.is_verified DESC, length(c.username) ASC, c.username ASC
+        LIMIT %(limit)s OFFSET %(offset)s""",
+        {'prefix': prefix, 'pool': SEARCH_CANDIDATES, 'user_id': user_id, 'term': search, 'limit': limit + 1, 'offset': offset}
+    )
+    users = cur.fetchall()
+    
+    next_offset = offset + limit if len(users) > limit and offset + limit < SEARCH_CANDIDATES else None
+    results = [{
+        'id': u[0],
+        'username': u[1],
+        'display_name': u[2],
+        'avatar_url': u[3],
+        'is_verified': u[4],
+        'has_checkmark': u[5],
+        'active_frame_id': u[6],
+        'frame_url': u[7]
+    } for u in users[:limit]]
+    
+    return json_response(event, 200, {'users': results, 'next_offset': next_offset} if paginated else results)
+
+@router.route('GET', 'messages')
+def get_messages(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = params.get('user_id')
+    
+    friend_id = params.get('friend_id')
+    try:
+        low, high = sorted((int(user_id), int(friend_id)))
+        since_id = int(params['since_id']) if params.get('since_id') else None
+        before_id = int(params['before_id']) if params.get('before_id') else None
+        limit = min(max(int(params.get('limit', DEFAULT_MESSAGES_LIMIT)), 1), MAX_MESSAGES_LIMIT)
+    except (TypeError, ValueError):
+        return json_response(event, 400, {'error': 'Invalid user_id, friend_id or cursor'})
+    
+    if since_id is not None:
+        cur.execute(
+            """SELECT id, sender_id, receiver_id, message, created_at
+            FROM t_p84121358_steam_clone_dark.messages
+            WHERE LEAST(sender_id, receiver_id) = %s AND GREATEST(sender_id, receiver_id) = %s AND id > %s
+            ORDER BY id ASC
+            LIMIT %s""",
+            (low, high, since_id, limit)
+        )
+        messages = cur.fetchall()
+    elif before_id is not None or 'limit' in params:
+        cur.execute(
+            """SELECT id, sender_id, receiver_id, message, created_at
+            FROM t_p84121358_steam_clone_dark.messages
+            WHERE LEAST(sender_id, receiver_id) = %s AND GREATEST(sender_id, receiver_id) = %s AND id < %s
+            ORDER BY id DESC
+            LIMIT %s""",
+            (low, high, before_id or 2147483647, limit)
+        )
+        messages = cur.fetchall()[::-1]
+    else:
+        cur.execute(
+            """SELECT id, sender_id, receiver_id, message, created_at
+            FROM t_p84121358_steam_clone_dark.messages
+            WHERE LEAST(sender_id, receiver_id) = %s AND GREATEST(sender_id, receiver_id) = %s
+            ORDER BY id ASC""",
+            (low, high)
+        )
+        messages = cur.fetchall()
+    
+    return json_response(event, 200, [{
+        'id': m[0],
+        'sender_id': m[1],
+        'receiver_id': m[2],
+        'message': m[3],
+        'created_at': m[4]
+    } for m in messages])
+
+@router.route('GET', 'suggestions')
+def get_suggestions(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = params.get('user_id')
+    
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_SUGGESTIONS_LIMIT)), 1), SUGGESTION_POOL)
+    except ValueError:
+        limit = DEFAULT_SUGGESTIONS_LIMIT
+    users = fetch_suggestions(cur, user_id, limit)
+    
+    return json_response(event, 200, [{
+        'id': u[0],
+        'username': u[1],
+        'display_name': u[2],
+        'avatar_url': u[3],
+        'is_verified': u[4],
+        'has_checkmark': u[5],
+        'active_frame_id': u[6],
+        'frame_url': u[7],
+        'mutual_friends': u[8],
+        'shared_games': u[9]
+    } for u in users])
+
+@router.route('GET', 'wait_messages')
+def wait_messages(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = params.get('user_id')
+    
+    try:
+        listener_id = int(user_id)
+        friend = int(params['friend_id']) if params.get('friend_id') else None
+        since_id = int(params['since_id']) if params.get('since_id') else None
+        timeout = float(params.get('timeout', 20))
+    except (TypeError, ValueError):
+        return json_response(event, 400, {'error': 'Invalid user_id, friend_id or since_id'})
+    
+    messages, next_since = wait_for_messages(conn, listener_id, friend, since_id, timeout)
+    
+    return json_response(event, 200, [{
+        'id': m[0],
+        'sender_id': m[1],
+        'receiver_id': m[2],
+        'message': m[3],
+        'created_at': m[4]
+    } for m in messages], {**CORS_HEADERS, 'X-Since-Id': str(next_since), 'Access-Control-Expose-Headers': 'X-Since-Id'})
+
+@router.route('POST', 'add_friend')
+def add_friend(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    friend_id = body_data.get('friend_id')
+    
+    low, high = sorted((int(user_id), int(friend_id)))
+    lock_friend_graph(cur, (low, high))
+    cur.execute(
+        "INSERT INTO t_p84121358_steam_clone_dark.friendships (user_id, friend_id) VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING id",
+        (low, high)
+    )
+    created = cur.fetchone() is not None
+    cur.execute(
+        "INSERT INTO t_p84121358_steam_clone_dark.friendships (user_id, friend_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        (high, low)
+    )
+    if created:
+        record_friendships(cur, [(low, high)])
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'add_friends')
+def add_friends(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    pairs = body_data.get('pairs') or []
+    try:
+        normalized = sorted({tuple(sorted((int(a), int(b)))) for a, b in pairs if int(a) != int(b)})
+    except (TypeError, ValueError):
+        normalized = None
+    if normalized is None or len(pairs) > MAX_FRIEND_BATCH:
+        return json_response(event, 400, {'error': f'pairs must be a list of at most {MAX_FRIEND_BATCH} [user_id, friend_id] pairs'})
+    
+    lows = [low for low, _ in normalized]
+    highs = [high for _, high in normalized]
+    lock_friend_graph(cur, lows + highs)
+    cur.execute(
+        """WITH pairs AS (
+            SELECT e.a, e.b
+            FROM unnest(%s::int[], %s::int[]) AS e(a, b)
+            WHERE EXISTS (SELECT 1 FROM t_p84121358_steam_clone_dark.users u WHERE u.id = e.a)
+              AND EXISTS (SELECT 1 FROM t_p84121358_steam_clone_dark.users u WHERE u.id = e.b)
+        )
+        INSERT INTO t_p84121358_steam_clone_dark.friendships (user_id, friend_id)
+        SELECT user_id, friend_id FROM (
+            SELECT a AS user_id, b AS friend_id FROM pairs
+            UNION ALL
+            SELECT b, a FROM pairs
+        ) directed
+        ORDER BY user_id, friend_id
+        ON CONFLICT DO NOTHING
+        RETURNING user_id, friend_id""",
+        (lows, highs)
+    )
+    inserted = cur.fetchall()
+    record_friendships(cur, [(a, b) for a, b in inserted if a < b])
+    conn.commit()
+    
+    return json_response(event, 200, {
+        'success': True,
+        'inserted': len(inserted),
+        'skipped': 2 * len(pairs) - len(inserted)
+    })
+
+@router.route('POST', 'send_message')
+def send_message(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    sender_id = body_data.get('sender_id')
+    receiver_id = body_data.get('receiver_id')
+    message = body_data.get('message')
+    
+    cur.execute(
+        "INSERT INTO t_p84121358_steam_clone_dark.messages (sender_id, receiver_id, message) VALUES (%s, %s, %s) RETURNING id",
+        (sender_id, receiver_id, message)
+    )
+    msg_id = cur.fetchone()[0]
+    notify_message(cur, receiver_id, sender_id, msg_id)
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True, 'id': msg_id})
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -18,150 +301,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
+    try:
+        session = authenticate(event)
+    except InvalidToken:
+        return json_response(event, 401, {'error': 'Invalid or expired session'})
+    
+    metrics = router.metrics_response(event)
+    if metrics is not None:
+        return metrics
+    
+    conn = acquire()
+    conn.cursor_factory = MeteredCursor
     cur = conn.cursor()
     
     try:
-        if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            action = params.get('action')
-            user_id = params.get('user_id')
-            
-            if action == 'friends':
-                cur.execute(
-                    """SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.has_checkmark, u.active_frame_id, fr.image_url as frame_url
-                    FROM t_p84121358_steam_clone_dark.friendships f 
-                    JOIN t_p84121358_steam_clone_dark.users u ON f.friend_id = u.id 
-                    LEFT JOIN t_p84121358_steam_clone_dark.frames fr ON u.active_frame_id = fr.id
-                    WHERE f.user_id = %s""",
-                    (user_id,)
-                )
-                friends = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': f[0],
-                        'username': f[1],
-                        'display_name': f[2],
-                        'avatar_url': f[3],
-                        'is_verified': f[4],
-                        'has_checkmark': f[5],
-                        'active_frame_id': f[6],
-                        'frame_url': f[7]
-                    } for f in friends])
-                }
-            
-            elif action == 'search':
-                search = params.get('search', '')
-                cur.execute(
-                    """SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.has_checkmark, u.active_frame_id, f.image_url as frame_url
-                    FROM t_p84121358_steam_clone_dark.users u
-                    LEFT JOIN t_p84121358_steam_clone_dark.frames f ON u.active_frame_id = f.id
-                    WHERE (u.username ILIKE %s OR u.display_name ILIKE %s) AND u.id != %s
-                    ORDER BY u.has_checkmark DESC, u.is_verified DESC, u.username ASC""",
-                    (f'%{search}%', f'%{search}%', user_id)
-                )
-                users = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': u[0],
-                        'username': u[1],
-                        'display_name': u[2],
-                        'avatar_url': u[3],
-                        'is_verified': u[4],
-                        'has_checkmark': u[5],
-                        'active_frame_id': u[6],
-                        'frame_url': u[7]
-                    } for u in users])
-                }
-            
-            elif action == 'messages':
-                friend_id = params.get('friend_id')
-                cur.execute(
-                    """SELECT id, sender_id, receiver_id, message, created_at 
-                    FROM t_p84121358_steam_clone_dark.messages 
-                    WHERE (sender_id = %s AND receiver_id = %s) OR (sender_id = %s AND receiver_id = %s)
-                    ORDER BY created_at ASC""",
-                    (user_id, friend_id, friend_id, user_id)
-                )
-                messages = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': m[0],
-                        'sender_id': m[1],
-                        'receiver_id': m[2],
-                        'message': m[3],
-                        'created_at': str(m[4])
-                    } for m in messages])
-                }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action')
-            
-            if action == 'add_friend':
-                user_id = body_data.get('user_id')
-                friend_id = body_data.get('friend_id')
-                
-                cur.execute(
-                    "INSERT INTO t_p84121358_steam_clone_dark.friendships (user_id, friend_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                    (user_id, friend_id)
-                )
-                cur.execute(
-                    "INSERT INTO t_p84121358_steam_clone_dark.friendships (user_id, friend_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                    (friend_id, user_id)
-                )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'send_message':
-                sender_id = body_data.get('sender_id')
-                receiver_id = body_data.get('receiver_id')
-                message = body_data.get('message')
-                
-                cur.execute(
-                    "INSERT INTO t_p84121358_steam_clone_dark.messages (sender_id, receiver_id, message) VALUES (%s, %s, %s) RETURNING id",
-                    (sender_id, receiver_id, message)
-                )
-                msg_id = cur.fetchone()[0]
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True, 'id': msg_id})
-                }
+        if session is not None and not ban_versions.is_current(cur, session):
+            return json_response(event, 403, {'error': 'Session revoked'})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return router.dispatch(event, cur, conn)
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release(conn)
\ No newline at end of file
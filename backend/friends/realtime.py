@@ -0,0 +1,100 @@
+'''
+Business: Push-style chat delivery over Postgres LISTEN/NOTIFY
+Args: pooled connection, receiver user_id, optional friend_id, since_id cursor
+      (omitted on the first poll, which then waits for messages sent after it)
+Returns: new messages as soon as a notification arrives, [] on timeout, and
+         the since_id to resume from
+'''
+import json
+import select
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import psycopg2
+
+MAX_WAIT_SECONDS = 25.0
+
+
+def channel_for(user_id: int) -> str:
+    return f'chat_user_{int(user_id)}'
+
+
+def notify_message(cur: Any, receiver_id: int, sender_id: int, message_id: int) -> None:
+    '''Queue a notification; Postgres delivers it only when the transaction commits'''
+    cur.execute(
+        "SELECT pg_notify(%s, %s)",
+        (channel_for(receiver_id), json.dumps({'id': message_id, 'sender_id': int(sender_id)}))
+    )
+
+
+def _fetch_new(cur: Any, user_id: int, friend_id: Optional[int], since_id: int) -> List[tuple]:
+    if friend_id is not None:
+        low, high = sorted((user_id, friend_id))
+        cur.execute(
+            """SELECT id, sender_id, receiver_id, message, created_at
+            FROM t_p84121358_steam_clone_dark.messages
+            WHERE LEAST(sender_id, receiver_id) = %s AND GREATEST(sender_id, receiver_id) = %s AND id > %s
+            ORDER BY id ASC""",
+            (low, high, since_id)
+        )
+    else:
+        cur.execute(
+            """SELECT id, sender_id, receiver_id, message, created_at
+            FROM t_p84121358_steam_clone_dark.messages
+            WHERE receiver_id = %s AND id > %s
+            ORDER BY id ASC""",
+            (user_id, since_id)
+        )
+    return cur.fetchall()
+
+
+def wait_for_messages(conn: Any, user_id: int, friend_id: Optional[int], since_id: Optional[int],
+                      timeout: float) -> Tuple[List[tuple], int]:
+    '''
+    LISTEN first, then check the table once so nothing sent between the
+    client's last poll and the LISTEN is missed. Without a since_id there is
+    no last poll, so the cursor starts at the newest message instead of
+    replaying the whole inbox. After that the connection
+    sits idle in select() until a matching notification or the timeout.
+    Whatever the handler read before dispatch (the ban-version check) is
+    rolled back first, since autocommit cannot be switched inside a transaction.
+    A connection that breaks meanwhile is closed instead of restored, so
+    release() discards it rather than pooling one still subscribed.
+    '''
+    channel = channel_for(user_id)
+    conn.rollback()
+    autocommit = conn.autocommit
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(f'LISTEN {channel}')
+        if since_id is None:
+            cur.execute("SELECT COALESCE(MAX(id), 0) FROM t_p84121358_steam_clone_dark.messages")
+            since_id = cur.fetchone()[0]
+        messages = _fetch_new(cur, user_id, friend_id, since_id)
+        deadline = time.monotonic() + min(max(timeout, 0.0), MAX_WAIT_SECONDS)
+
+        while not messages:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if select.select([conn], [], [], remaining) == ([], [], []):
+                break
+            conn.poll()
+            woken = False
+            while conn.notifies:
+                payload: Dict[str, Any] = json.loads(conn.notifies.pop(0).payload)
+                if friend_id is None or payload.get('sender_id') == friend_id:
+                    woken = True
+            if woken:
+                messages = _fetch_new(cur, user_id, friend_id, since_id)
+        return messages, messages[-1][0] if messages else since_id
+    finally:
+        del conn.notifies[:]
+        try:
+            if not conn.closed:
+                cur.execute(f'UNLISTEN {channel}')
+                conn.autocommit = autocommit
+        except psycopg2.Error:
+            conn.close()
+        cur.close()
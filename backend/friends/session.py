@@ -0,0 +1,135 @@
+'''
+Business: Stateless HMAC-signed session tokens and a cached ban-version check
+Args: SESSION_SECRET, SESSION_TTL, BAN_CACHE_TTL, BAN_CACHE_SIZE env vars;
+      Authorization: Bearer <token> (or X-Session-Token) request header
+Returns: issue_token() for auth, authenticate() + ban_versions for every handler
+'''
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+SESSION_TTL: int = int(os.environ.get('SESSION_TTL', str(7 * 24 * 3600)))
+BAN_CACHE_TTL: float = float(os.environ.get('BAN_CACHE_TTL', '30'))
+BAN_CACHE_SIZE: int = int(os.environ.get('BAN_CACHE_SIZE', '10000'))
+TOKEN_PREFIX = 'v1'
+
+SESSION_SECRET: str = os.environ.get('SESSION_SECRET', '')
+
+# No fallback key: without SESSION_SECRET tokens are neither issued nor accepted
+_SECRET: Optional[bytes] = hashlib.sha256(SESSION_SECRET.encode()).digest() if SESSION_SECRET else None
+
+
+class InvalidToken(Exception):
+    pass
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    if _SECRET is None:
+        raise InvalidToken('SESSION_SECRET is not set')
+    return _b64encode(hmac.new(_SECRET, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, role: str, ban_version: int, ttl: int = SESSION_TTL) -> Optional[str]:
+    '''
+    Token is v1.<base64 "user_id|role|ban_version|expires">.<base64 HMAC-SHA256>;
+    None when SESSION_SECRET is not set, so nothing signed with a guessable key goes out.
+    '''
+    if _SECRET is None:
+        return None
+    payload = f'{TOKEN_PREFIX}.' + _b64encode(f'{int(user_id)}|{role}|{int(ban_version)}|{int(time.time()) + ttl}'.encode())
+    return f'{payload}.{_sign(payload)}'
+
+
+def verify_token(token: str) -> Dict[str, Any]:
+    '''
+    Check signature and expiry only, no database access.
+    Raises InvalidToken on any malformed, forged or expired token.
+    '''
+    try:
+        prefix, body, signature = token.split('.')
+        payload = f'{prefix}.{body}'
+        if prefix != TOKEN_PREFIX or not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+            raise InvalidToken('Bad signature')
+        user_id, role, ban_version, expires = _b64decode(body).decode().split('|')
+        session = {'user_id': int(user_id), 'role': role, 'ban_version': int(ban_version), 'expires': int(expires)}
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidToken('Malformed token') from e
+    if session['expires'] < time.time():
+        raise InvalidToken('Token expired')
+    return session
+
+
+def token_from_event(event: Dict[str, Any]) -> Optional[str]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    auth = headers.get('authorization', '')
+    if auth[:7].lower() == 'bearer ':
+        return auth[7:].strip()
+    return headers.get('x-session-token') or None
+
+
+def authenticate(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''Session of the caller, None when no token was sent; raises InvalidToken'''
+    token = token_from_event(event)
+    if token is None:
+        return None
+    return verify_token(token)
+
+
+class BanVersionCache:
+    '''
+    Per-instance LRU of user_id -> (ban_version, is_banned) with a short TTL.
+    A ban bumps users.ban_version, so tokens issued before it stop passing
+    is_current() within BAN_CACHE_TTL without a users lookup per request.
+    '''
+
+    def __init__(self, ttl: float = BAN_CACHE_TTL, size: int = BAN_CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.size = size
+        self._entries: 'OrderedDict[int, Tuple[int, bool, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def is_current(self, cur: Any, session: Dict[str, Any]) -> bool:
+        user_id = session['user_id']
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[2] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return not entry[1] and entry[0] == session['ban_version']
+
+        self.misses += 1
+        cur.execute(
+            "SELECT ban_version, is_banned FROM t_p84121358_steam_clone_dark.users WHERE id = %s",
+            (user_id,)
+        )
+        row = cur.fetchone()
+        if row is None:
+            return False
+        with self._lock:
+            self._entries[user_id] = (row[0], bool(row[1]), time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+        return not row[1] and row[0] == session['ban_version']
+
+    def forget(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(int(user_id), None)
+
+
+ban_versions = BanVersionCache()
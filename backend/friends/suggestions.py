@@ -0,0 +1,125 @@
+'''
+Business: "People you may know" ranking backed by the friend_suggestions table
+Args: cursor, the two users of a new friendship or the user asking for suggestions
+Returns: incremental mutual-friend updates and ranked candidate lists
+'''
+from typing import Any, Iterable, List, Tuple
+
+SUGGESTION_POOL = 100
+MUTUAL_WEIGHT = 3
+SHARED_GAME_WEIGHT = 1
+# First key of the transaction-level advisory locks taken per user before the graph changes
+FRIEND_GRAPH_LOCK = 1201
+
+
+def lock_friend_graph(cur: Any, user_ids: Iterable[int]) -> None:
+    '''
+    Take an advisory lock per user, in id order, until the transaction ends.
+    Call it before inserting friendships. Two new edges only form a 2-path
+    through a shared endpoint, so this serializes exactly the transactions
+    whose counts depend on each other's edges. A waiting transaction's next
+    statement sees the committed edges of the one it waited for.
+    '''
+    cur.execute(
+        """SELECT pg_advisory_xact_lock(%s, u.id)
+        FROM (SELECT DISTINCT id FROM unnest(%s::int[]) AS id ORDER BY id) u
+        ORDER BY u.id""",
+        (FRIEND_GRAPH_LOCK, sorted(set(user_ids)))
+    )
+
+
+def record_friendships(cur: Any, pairs: List[Tuple[int, int]]) -> None:
+    '''
+    Apply newly created friendships (already inserted in both directions) to
+    friend_suggestions. Every 2-path u-w-v that uses at least one new edge adds
+    one mutual friend to (u, v), so the cost is proportional to the degrees of
+    the new endpoints rather than a self-join of the whole graph per read.
+    The caller holds lock_friend_graph() for the endpoints. Upserts go in key
+    order so concurrent transactions lock suggestion rows in the same order.
+    '''
+    if not pairs:
+        return
+    lows = [low for low, _ in pairs]
+    highs = [high for _, high in pairs]
+    cur.execute(
+        """WITH new_edges AS (
+            SELECT e.a AS user_id, e.b AS friend_id FROM unnest(%(lows)s::int[], %(highs)s::int[]) AS e(a, b)
+            UNION ALL
+            SELECT e.b, e.a FROM unnest(%(lows)s::int[], %(highs)s::int[]) AS e(a, b)
+        ),
+        paths AS (
+            SELECT n.user_id, f.friend_id AS candidate_id
+            FROM new_edges n
+            JOIN t_p84121358_steam_clone_dark.friendships f ON f.user_id = n.friend_id
+            UNION ALL
+            SELECT f.friend_id, n.friend_id
+            FROM new_edges n
+            JOIN t_p84121358_steam_clone_dark.friendships f ON f.user_id = n.user_id
+            WHERE NOT EXISTS (SELECT 1 FROM new_edges o WHERE o.user_id = f.friend_id AND o.friend_id = f.user_id)
+        )
+        INSERT INTO t_p84121358_steam_clone_dark.friend_suggestions (user_id, candidate_id, mutual_count)
+        SELECT p.user_id, p.candidate_id, COUNT(*)
+        FROM paths p
+        WHERE p.user_id <> p.candidate_id
+          AND NOT EXISTS (
+            SELECT 1 FROM t_p84121358_steam_clone_dark.friendships e
+            WHERE e.user_id = p.user_id AND e.friend_id = p.candidate_id
+          )
+        GROUP BY p.user_id, p.candidate_id
+        ORDER BY p.user_id, p.candidate_id
+        ON CONFLICT (user_id, candidate_id) DO UPDATE
+        SET mutual_count = t_p84121358_steam_clone_dark.friend_suggestions.mutual_count + EXCLUDED.mutual_count""",
+        {'lows': lows, 'highs': highs}
+    )
+    cur.execute(
+        """DELETE FROM t_p84121358_steam_clone_dark.friend_suggestions s
+        USING unnest(%s::int[], %s::int[]) AS e(a, b)
+        WHERE (s.user_id = e.a AND s.candidate_id = e.b) OR (s.user_id = e.b AND s.candidate_id = e.a)""",
+        (lows, highs)
+    )
+
+
+def fetch_suggestions(cur: Any, user_id: int, limit: int) -> List[tuple]:
+    '''
+    Take the SUGGESTION_POOL best candidates by mutual friends straight from
+    the index, then re-rank only those by shared owned games.
+    '''
+    cur.execute(
+        """WITH pool AS (
+            SELECT s.candidate_id, s.mutual_count
+            FROM t_p84121358_steam_clone_dark.friend_suggestions s
+            WHERE s.user_id = %(user_id)s
+            ORDER BY s.mutual_count DESC
+            LIMIT %(pool)s
+        ),
+        mine AS (
+            SELECT COALESCE(array_agg(game_id), '{}') AS games
+            FROM t_p84121358_steam_clone_dark.purchases
+            WHERE user_id = %(user_id)s
+        ),
+        ranked AS (
+            SELECT p.candidate_id, p.mutual_count,
+                (SELECT COUNT(*) FROM t_p84121358_steam_clone_dark.purchases t
+                 WHERE t.user_id = p.candidate_id AND t.game_id = ANY(m.games)) AS shared_games
+            FROM pool p, mine m
+            WHERE NOT EXISTS (
+                SELECT 1 FROM t_p84121358_steam_clone_dark.users b
+                WHERE b.id = p.candidate_id AND b.is_banned = TRUE
+            )
+        ),
+        top AS (
+            SELECT candidate_id, mutual_count, shared_games
+            FROM ranked
+            ORDER BY mutual_count * %(mutual_weight)s + shared_games * %(game_weight)s DESC, candidate_id ASC
+            LIMIT %(limit)s
+        )
+        SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.has_checkmark, u.active_frame_id, f.image_url as frame_url,
+            t.mutual_count, t.shared_games
+        FROM top t
+        JOIN t_p84121358_steam_clone_dark.users u ON u.id = t.candidate_id
+        LEFT JOIN t_p84121358_steam_clone_dark.frames f ON u.active_frame_id = f.id
+        ORDER BY t.mutual_count * %(mutual_weight)s + t.shared_games * %(game_weight)s DESC, u.id ASC""",
+        {'user_id': user_id, 'pool': SUGGESTION_POOL, 'limit': limit,
+         'mutual_weight': MUTUAL_WEIGHT, 'game_weight': SHARED_GAME_WEIGHT}
+    )
+    return cur.fetchall()
@@ -0,0 +1,197 @@
+'''
+Business: Shared storage for uploaded game builds, chosen by BUILD_STORE
+Args: BUILD_STORE ('s3' or 'local'), BUILD_STORE_URL, BUILD_STORE_BUCKET, BUILD_STORE_ENDPOINT, BUILD_STORE_DIR env vars
+Returns: build_store used by uploads.py to stage chunks and publish finished builds,
+         None when no shared store with a public URL is configured
+'''
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import boto3
+except ImportError:
+    boto3 = None
+
+BUILD_STORE: str = os.environ.get('BUILD_STORE', 's3')
+# Public base URL finished builds are served from; a build URL is BUILD_STORE_URL/<name>
+BUILD_STORE_URL: Optional[str] = os.environ.get('BUILD_STORE_URL')
+BUILD_STORE_BUCKET: Optional[str] = os.environ.get('BUILD_STORE_BUCKET')
+BUILD_STORE_ENDPOINT: Optional[str] = os.environ.get('BUILD_STORE_ENDPOINT')
+BUILD_STORE_DIR: Optional[str] = os.environ.get('BUILD_STORE_DIR')
+# Staged chunks are rolled into multipart parts of this size; S3 needs 5 MiB for all but the last part
+PART_SIZE = 8 * 1024 * 1024
+
+
+class LocalBlobStore:
+    '''
+    Builds in a directory every function instance mounts (a network file
+    system, or one machine in development): in-progress uploads under staging/,
+    finished builds under builds/ named by content hash and served from base_url.
+    '''
+
+    def __init__(self, root: str, base_url: str) -> None:
+        self.staging = os.path.join(root, 'staging')
+        self.builds = os.path.join(root, 'builds')
+        self.base_url = base_url.rstrip('/')
+        os.makedirs(self.staging, exist_ok=True)
+        os.makedirs(self.builds, exist_ok=True)
+
+    def open_staging(self, key: str, offset: int) -> IO[bytes]:
+        '''
+        Writable file positioned at offset; anything past it from an earlier
+        failed attempt is dropped. Raises FileNotFoundError when resuming an
+        upload whose staged bytes are gone or short.
+        '''
+        path = os.path.join(self.staging, key)
+        handle = open(path, 'r+b' if offset else 'wb')
+        if handle.seek(0, os.SEEK_END) < offset:
+            handle.close()
+            raise FileNotFoundError(path)
+        handle.seek(offset)
+        handle.truncate()
+        return handle
+
+    def publish(self, key: str, name: str) -> None:
+        '''Move a complete staged upload to its permanent name'''
+        os.replace(os.path.join(self.staging, key), os.path.join(self.builds, name))
+
+    def url(self, name: str) -> str:
+        return f'{self.base_url}/{name}'
+
+    def discard(self, key: str) -> None:
+        try:
+            os.remove(os.path.join(self.staging, key))
+        except FileNotFoundError:
+            pass
+
+
+class S3BlobStore:
+    '''
+    Builds in an S3-compatible bucket. Each chunk is staged as its own object
+    under staging/<key>/chunks/, named by offset. Once the chunks before the
+    upload offset add up to PART_SIZE they are copied into the next part of a
+    multipart upload, whose id and part ETags are kept in staging/<key>/parts,
+    so no invocation moves more than a part and a chunk. Publishing completes
+    the multipart upload, or writes a small build in one go, under builds/.
+    '''
+
+    def __init__(self, client: Any, bucket: str, base_url: str) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.base_url = base_url.rstrip('/')
+
+    def _staged(self, key: str) -> Tuple[Dict[str, Any], List[Tuple[int, int, str]]]:
+        '''Multipart manifest and the (offset, size, object key) of staged chunks, in offset order'''
+        manifest: Dict[str, Any] = {'upload_id': None, 'parts': [], 'rolled': 0}
+        chunks = []
+        pages = self.client.get_paginator('list_objects_v2').paginate(Bucket=self.bucket, Prefix=f'staging/{key}/')
+        for page in pages:
+            for item in page.get('Contents', []):
+                if item['Key'] == f'staging/{key}/parts':
+                    manifest = json.loads(self.client.get_object(Bucket=self.bucket, Key=item['Key'])['Body'].read())
+                elif item['Key'].startswith(f'staging/{key}/chunks/'):
+                    chunks.append((int(item['Key'].rsplit('/', 1)[1]), item['Size'], item['Key']))
+        return manifest, sorted(chunks)
+
+    def _delete(self, keys: List[str]) -> None:
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={'Objects': [{'Key': k} for k in keys[start:start + 1000]]})
+
+    def _roll(self, key: str, manifest: Dict[str, Any], chunks: List[Tuple[int, int, str]]) -> None:
+        '''Copy chunks into the next part of the multipart upload, then drop them'''
+        if manifest['upload_id'] is None:
+            manifest['upload_id'] = self.client.create_multipart_upload(Bucket=self.bucket, Key=f'staging/{key}/build')['UploadId']
+        with tempfile.TemporaryFile() as part:
+            for _, _, chunk_key in chunks:
+                shutil.copyfileobj(self.client.get_object(Bucket=self.bucket, Key=chunk_key)['Body'], part)
+            part.seek(0)
+            number = len(manifest['parts']) + 1
+            etag = self.client.upload_part(
+                Bucket=self.bucket, Key=f'staging/{key}/build', UploadId=manifest['upload_id'], PartNumber=number, Body=part
+            )['ETag']
+        manifest['parts'].append({'PartNumber': number, 'ETag': etag})
+        manifest['rolled'] += sum(size for _, size, _ in chunks)
+        self.client.put_object(Bucket=self.bucket, Key=f'staging/{key}/parts', Body=json.dumps(manifest).encode())
+        self._delete([chunk_key for _, _, chunk_key in chunks])
+
+    @contextmanager
+    def open_staging(self, key: str, offset: int) -> Iterator[IO[bytes]]:
+        '''
+        Writable spool for the chunk at offset, stored when the block exits
+        without an error. Chunks staged at or past offset by an earlier failed
+        attempt are dropped. Raises FileNotFoundError when resuming an upload
+        whose staged bytes are gone or short.
+        '''
+        manifest, chunks = self._staged(key)
+        if offset:
+            end = manifest['rolled']
+            for chunk_offset, size, _ in chunks:
+                if chunk_offset == end and chunk_offset < offset:
+                    end += size
+            if end != offset:
+                raise FileNotFoundError(f'staging/{key}')
+        stale = [chunk_key for chunk_offset, _, chunk_key in chunks if chunk_offset >= offset]
+        if stale:
+            self._delete(stale)
+        pending = [chunk for chunk in chunks if chunk[0] < offset]
+        if sum(size for _, size, _ in pending) >= PART_SIZE:
+            self._roll(key, manifest, pending)
+
+        with tempfile.SpooledTemporaryFile(max_size=PART_SIZE) as spool:
+            yield spool
+            spool.seek(0)
+            self.client.put_object(Bucket=self.bucket, Key=f'staging/{key}/chunks/{offset:016d}', Body=spool)
+
+    def publish(self, key: str, name: str) -> None:
+        '''Assemble a complete staged upload under its permanent name'''
+        manifest, chunks = self._staged(key)
+        target = f'builds/{name}'
+        if manifest['upload_id'] is None:
+            with tempfile.TemporaryFile() as build:
+                for _, _, chunk_key in chunks:
+                    shutil.copyfileobj(self.client.get_object(Bucket=self.bucket, Key=chunk_key)['Body'], build)
+                build.seek(0)
+                self.client.put_object(Bucket=self.bucket, Key=target, Body=build)
+        else:
+            if chunks:
+                self._roll(key, manifest, chunks)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=f'staging/{key}/build', UploadId=manifest['upload_id'],
+                MultipartUpload={'Parts': manifest['parts']}
+            )
+            self.client.copy({'Bucket': self.bucket, 'Key': f'staging/{key}/build'}, self.bucket, target)
+        self.discard(key)
+
+    def url(self, name: str) -> str:
+        return f'{self.base_url}/{name}'
+
+    def discard(self, key: str) -> None:
+        manifest, chunks = self._staged(key)
+        if manifest['upload_id'] is not None:
+            try:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=f'staging/{key}/build', UploadId=manifest['upload_id'])
+            except self.client.exceptions.NoSuchUpload:
+                pass
+        self._delete([chunk_key for _, _, chunk_key in chunks] + [f'staging/{key}/parts', f'staging/{key}/build'])
+
+
+def make_store(kind: str) -> Optional[Any]:
+    '''
+    Store for BUILD_STORE, or None when it is not configured. Without a public
+    BUILD_STORE_URL nothing published could be downloaded by players, and a
+    local directory is only used when BUILD_STORE_DIR names a shared mount.
+    '''
+    if not BUILD_STORE_URL:
+        return None
+    if kind == 's3' and boto3 is not None and BUILD_STORE_BUCKET:
+        return S3BlobStore(boto3.client('s3', endpoint_url=BUILD_STORE_ENDPOINT), BUILD_STORE_BUCKET, BUILD_STORE_URL)
+    if kind == 'local' and BUILD_STORE_DIR:
+        return LocalBlobStore(BUILD_STORE_DIR, BUILD_STORE_URL)
+    return None
+
+
+build_store = make_store(BUILD_STORE)
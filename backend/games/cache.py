@@ -0,0 +1,71 @@
+'''
+Business: Versioned read-through cache for catalog list responses
+Args: CATALOG_CACHE_TTL, CATALOG_CACHE_SIZE env vars; cursor for the catalog version row
+Returns: catalog_cache shared by the games and admin handlers
+'''
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+CACHE_TTL: float = float(os.environ.get('CATALOG_CACHE_TTL', '60'))
+CACHE_SIZE: int = int(os.environ.get('CATALOG_CACHE_SIZE', '128'))
+
+
+class CatalogCache:
+    '''
+    In-process LRU with TTL, keyed by the catalog version kept in the
+    catalog_state row. Every edit bumps that row in its own transaction, so
+    all instances of every function stop serving older entries as soon as it
+    commits, and stale entries simply stop being reachable.
+    '''
+
+    def __init__(self, ttl: float = CACHE_TTL, size: int = CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.size = size
+        self._entries: 'OrderedDict[str, Tuple[str, str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, cur: Any) -> int:
+        cur.execute("SELECT version FROM t_p84121358_steam_clone_dark.catalog_state")
+        row = cur.fetchone()
+        return row[0] if row else 0
+
+    def get(self, key: str, version: int) -> Optional[Tuple[str, str]]:
+        full_key = f'{version}:{key}'
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry and entry[2] > time.monotonic():
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return entry[0], entry[1]
+            if entry:
+                del self._entries[full_key]
+            self.misses += 1
+        return None
+
+    def put(self, key: str, version: int, body: str) -> str:
+        full_key = f'{version}:{key}'
+        etag = '"' + hashlib.md5(f'{full_key}:{body}'.encode()).hexdigest() + '"'
+        self._store(full_key, etag, body)
+        return etag
+
+    def invalidate(self, cur: Any) -> None:
+        '''Bump the catalog version inside the caller's transaction, before it commits'''
+        cur.execute("UPDATE t_p84121358_steam_clone_dark.catalog_state SET version = version + 1")
+        with self._lock:
+            self._entries.clear()
+
+    def _store(self, full_key: str, etag: str, body: str) -> None:
+        with self._lock:
+            self._entries[full_key] = (etag, body, time.monotonic() + self.ttl)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+catalog_cache = CatalogCache()
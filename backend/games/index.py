@@ -1,7 +1,335 @@
-import json
-import os
-import psycopg2
-from typing import Dict, Any
+import base64
+import binascii
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Any, List, Optional, Tuple
+from cache import catalog_cache
+from db import acquire, release, statement
+from response import dumps, json_response, respond
+from router import MeteredCursor, Router
+from sales import record_sales
+from session import InvalidToken, authenticate, ban_versions
+from uploads import UploadError, byte_count, get_upload, start_upload, upload_state, write_chunk
+
+GAME_FIELDS = ['id', 'title', 'description', 'category', 'age_rating', 'file_url', 'logo_url', 'publisher_login', 'status', 'created_at', 'price', 'is_popular']
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+POPULAR_SHELF_SIZE = 20
+CACHED_STATUSES = ('approved', 'popular')
+CACHED_ACTIONS = (None, 'facets')
+FACET_FIELDS = ('category', 'age_rating')
+BAD_QUERY = (ValueError, binascii.Error, InvalidOperation)
+
+def encode_cursor(created_at: datetime, game_id: int) -> str:
+    raw = f'{created_at.isoformat()}|{game_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    created_at, game_id = raw.split('|')
+    return datetime.fromisoformat(created_at), int(game_id)
+
+def catalog_filters(params: Dict[str, Any], prefix: str = '') -> Tuple[List[str], List[Any]]:
+    '''
+    Conditions for the category and age_rating (comma-separated, any of) and
+    min_price/max_price query params; raises ValueError or InvalidOperation
+    on a price that is not a number.
+    '''
+    conditions = []
+    args: List[Any] = []
+    for field in FACET_FIELDS:
+        if params.get(field):
+            conditions.append(f'{prefix}{field} = ANY(%s)')
+            args.append(params[field].split(','))
+    for param, operator in (('min_price', '>='), ('max_price', '<=')):
+        if params.get(param):
+            price = Decimal(params[param])
+            if not price.is_finite():
+                raise ValueError(f'{param} must be finite')
+            conditions.append(f'COALESCE({prefix}price, 0) {operator} %s')
+            args.append(price)
+    return conditions, args
+
+def popular_query(columns: List[str], filters: List[str]) -> str:
+    '''
+    The status=popular shelf: admin-pinned games newest first, then the top
+    trending approved games by score. Each arm is a LIMITed index scan, so the
+    shelf costs the same however large the catalog or the score table grows.
+    '''
+    selected = ', '.join(f'g.{c}' for c in columns)
+    where = ''.join(f' AND {condition}' for condition in filters)
+    return f"""SELECT {', '.join(columns)} FROM (
+        (SELECT 0 AS shelf, NULL::float8 AS score, {selected} FROM t_p84121358_steam_clone_dark.games g
+        WHERE g.status = 'approved' AND g.is_popular = true{where}
+        ORDER BY g.created_at DESC, g.id DESC LIMIT %s)
+        UNION ALL
+        (SELECT 1, t.score, {selected} FROM t_p84121358_steam_clone_dark.game_trending t
+        JOIN t_p84121358_steam_clone_dark.games g ON g.id = t.game_id
+        WHERE t.score > 0 AND g.status = 'approved' AND g.is_popular IS NOT TRUE{where}
+        ORDER BY t.score DESC, t.game_id DESC LIMIT %s)
+    ) popular ORDER BY shelf, score DESC, created_at DESC, id DESC LIMIT %s"""
+
+def catalog_response(event: Dict[str, Any], etag: str, body: str) -> Dict[str, Any]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'ETag',
+        'Cache-Control': 'no-cache',
+        'ETag': etag
+    }
+    if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+        return {'statusCode': 304, 'headers': response_headers, 'isBase64Encoded': False, 'body': ''}
+    return respond(event, 200, body, response_headers, cache_key=etag)
+
+def serialize_field(field: str, value: Any) -> Any:
+    if field == 'price':
+        return value if value is not None else 0.0
+    if field == 'is_popular':
+        return bool(value)
+    return value
+
+def catalog_cache_key(params: Dict[str, Any]) -> Optional[str]:
+    if params.get('status', 'approved') not in CACHED_STATUSES or params.get('action') not in CACHED_ACTIONS:
+        return None
+    return '&'.join(f'{k}={params[k]}' for k in sorted(params))
+
+router = Router('games')
+
+@router.route('GET')
+def list_games(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    status = params.get('status', 'approved')
+    cache_key = catalog_cache_key(params)
+    cache_version = catalog_cache.version(cur)
+    
+    requested = params.get('fields')
+    fields = [f for f in GAME_FIELDS if f == 'id' or f in requested.split(',')] if requested else GAME_FIELDS
+    columns = list(dict.fromkeys(['id', 'created_at'] + fields))
+    paginated = 'limit' in params or 'cursor' in params
+    
+    try:
+        limit = min(max(int(params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+        filters, filter_args = catalog_filters(params, 'g.' if status == 'popular' else '')
+    except BAD_QUERY:
+        return json_response(event, 400, {'error': 'Invalid limit, cursor or price'})
+    
+    if status == 'popular':
+        if cursor is not None:
+            return json_response(event, 400, {'error': 'The popular shelf is a single page'})
+        shelf_size = limit if paginated else POPULAR_SHELF_SIZE
+        args = filter_args + [shelf_size] + filter_args + [shelf_size, shelf_size]
+        statement('games_popular', popular_query(columns, filters)).execute(cur, args)
+    else:
+        conditions = filters
+        args = filter_args
+        if status != 'all':
+            conditions.append('status = %s')
+            args.append(status)
+        if cursor is not None:
+            conditions.append('(created_at, id) < (%s, %s)')
+            args.extend(cursor)
+        
+        query = f"SELECT {', '.join(columns)} FROM t_p84121358_steam_clone_dark.games"
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY created_at DESC, id DESC'
+        if paginated:
+            query += ' LIMIT %s'
+            args.append(limit + 1)
+        
+        statement('games_catalog', query).execute(cur, args)
+    
+    rows = [dict(zip(columns, row)) for row in cur.fetchall()]
+    
+    next_cursor = None
+    if paginated and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    
+    games = [{f: serialize_field(f, row[f]) for f in fields} for row in rows]
+    body = dumps({'games': games, 'next_cursor': next_cursor} if paginated else games)
+    
+    if cache_key is not None:
+        etag = catalog_cache.put(cache_key, cache_version, body)
+        return catalog_response(event, etag, body)
+    
+    return respond(event, 200, body)
+
+@router.route('GET', 'facets')
+def catalog_facets(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    status = params.get('status', 'approved')
+    cache_key = catalog_cache_key(params)
+    cache_version = catalog_cache.version(cur)
+    selected = {field: params[field].split(',') for field in FACET_FIELDS if params.get(field)}
+    
+    if status == 'popular':
+        return json_response(event, 400, {'error': 'Facets are not counted for the popular shelf'})
+    try:
+        conditions, args = catalog_filters({k: v for k, v in params.items() if k not in FACET_FIELDS})
+    except BAD_QUERY:
+        return json_response(event, 400, {'error': 'Invalid price'})
+    if status != 'all':
+        conditions.append('status = %s')
+        args.append(status)
+    
+    query = 'SELECT category, age_rating, COUNT(*) FROM t_p84121358_steam_clone_dark.games'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    cur.execute(query + ' GROUP BY category, age_rating', args)
+    
+    # Each facet counts the games matching every other selected facet, so picking
+    # a category still shows how many games the other categories would give
+    counts: Dict[str, Dict[Any, int]] = {field: {} for field in FACET_FIELDS}
+    total = 0
+    for category, age_rating, count in cur.fetchall():
+        values = {'category': category, 'age_rating': age_rating}
+        for field in FACET_FIELDS:
+            if all(values[other] in selected[other] for other in selected if other != field):
+                counts[field][values[field]] = counts[field].get(values[field], 0) + count
+        if all(values[field] in selected[field] for field in selected):
+            total += count
+    
+    facets: Dict[str, Any] = {'total': total}
+    for field in FACET_FIELDS:
+        ranked = sorted(counts[field].items(), key=lambda item: (-item[1], str(item[0])))
+        facets[field] = [{'value': value, 'count': count} for value, count in ranked]
+    body = dumps(facets)
+    
+    if cache_key is not None:
+        etag = catalog_cache.put(cache_key, cache_version, body)
+        return catalog_response(event, etag, body)
+    
+    return respond(event, 200, body)
+
+@router.route('GET', 'upload_status')
+def get_upload_status(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    row = get_upload(cur, params.get('upload_id', ''))
+    if row is None:
+        return json_response(event, 404, {'error': 'Upload not found'})
+    
+    upload_id, _, size, received, digest, url = row
+    return json_response(event, 200, upload_state(upload_id, size, received, digest, url))
+
+@router.route('POST', 'start_upload')
+def begin_upload(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        size = byte_count(body_data.get('size'))
+    except (TypeError, ValueError):
+        return json_response(event, 400, {'error': 'size must be a whole number of bytes'})
+    
+    try:
+        state = start_upload(cur, body_data.get('filename'), size, body_data.get('publisher_login'), body_data.get('content_hash'))
+    except UploadError as e:
+        conn.rollback()
+        return json_response(event, e.status, e.body)
+    conn.commit()
+    
+    return json_response(event, 200, state)
+
+@router.route('POST', 'upload_chunk')
+def upload_chunk(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        offset = byte_count(body_data.get('offset'))
+    except (TypeError, ValueError):
+        return json_response(event, 400, {'error': 'offset must be a whole number of bytes'})
+    
+    try:
+        state = write_chunk(cur, str(body_data.get('upload_id')), offset, str(body_data.get('data') or ''))
+    except UploadError as e:
+        conn.rollback()
+        return json_response(event, e.status, e.body)
+    conn.commit()
+    
+    return json_response(event, 200, state)
+
+@router.route('POST')
+def submit_game(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    file_url = body_data.get('file_url')
+    if body_data.get('upload_id'):
+        upload = get_upload(cur, str(body_data['upload_id']))
+        if upload is None or upload[4] is None:
+            return json_response(event, 400, {'error': 'Upload not found or not complete'})
+        file_url = upload[5]
+    
+    cur.execute(
+        "INSERT INTO t_p84121358_steam_clone_dark.games (title, description, category, age_rating, file_url, logo_url, publisher_login, status, price, contact_email) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
+        (
+            body_data.get('title'),
+            body_data.get('description'),
+            body_data.get('category'),
+            body_data.get('age_rating'),
+            file_url,
+            body_data.get('logo_url'),
+            body_data.get('publisher_login'),
+            'pending',
+            body_data.get('price', 0),
+            body_data.get('contact_email')
+        )
+    )
+    game_id = cur.fetchone()[0]
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return json_response(event, 200, {'id': game_id, 'status': 'pending', 'file_url': file_url})
+
+@router.route('PUT')
+def update_game_status(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    game_id = body_data.get('id')
+    status = body_data.get('status')
+    
+    cur.execute(
+        "UPDATE t_p84121358_steam_clone_dark.games SET status = %s WHERE id = %s",
+        (status, game_id)
+    )
+    catalog_cache.invalidate(cur)
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('DELETE')
+def delete_game(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    game_id = body_data.get('game_id')
+    
+    if user_id and game_id:
+        statement('game_price', "SELECT price FROM t_p84121358_steam_clone_dark.games WHERE id = %s").execute(cur, (game_id,))
+        game = cur.fetchone()
+        
+        if game:
+            game_price = float(game[0]) if game[0] else 0
+            refund = int(game_price * 0.9)
+            
+            cur.execute(
+                "DELETE FROM t_p84121358_steam_clone_dark.purchases WHERE user_id = %s AND game_id = %s",
+                (user_id, game_id)
+            )
+            refunded = cur.rowcount
+            
+            cur.execute(
+                "UPDATE t_p84121358_steam_clone_dark.users SET balance = balance + %s WHERE id = %s RETURNING balance",
+                (refund, user_id)
+            )
+            new_balance = cur.fetchone()[0]
+            if refunded:
+                record_sales(cur, 'refund', [(int(game_id), refund, None)])
+            conn.commit()
+            
+            return json_response(event, 200, {'success': True, 'refund': refund, 'new_balance': new_balance})
+    
+    params = event.get('queryStringParameters', {})
+    game_id = params.get('id')
+    
+    if game_id:
+        cur.execute(
+            "DELETE FROM t_p84121358_steam_clone_dark.games WHERE id = %s",
+            (game_id,)
+        )
+        catalog_cache.invalidate(cur)
+        conn.commit()
+    
+    return json_response(event, 200, {'success': True})
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -18,159 +346,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
+    try:
+        session = authenticate(event)
+    except InvalidToken:
+        return json_response(event, 401, {'error': 'Invalid or expired session'})
+    
+    metrics = router.metrics_response(event)
+    if metrics is not None:
+        return metrics
+    
+    started = time.perf_counter()
+    cache_key = catalog_cache_key(event.get('queryStringParameters') or {}) if method == 'GET' else None
+    
+    conn = acquire()
+    conn.cursor_factory = MeteredCursor
     cur = conn.cursor()
     
     try:
-        if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            status = params.get('status', 'approved')
-            
-            if status == 'all':
-                cur.execute(
-                    "SELECT id, title, description, category, age_rating, file_url, logo_url, publisher_login, status, created_at, price, is_popular FROM t_p84121358_steam_clone_dark.games ORDER BY created_at DESC"
-                )
-            elif status == 'popular':
-                cur.execute(
-                    "SELECT id, title, description, category, age_rating, file_url, logo_url, publisher_login, status, created_at, price, is_popular FROM t_p84121358_steam_clone_dark.games WHERE status = 'approved' AND is_popular = true ORDER BY created_at DESC"
-                )
-            else:
-                cur.execute(
-                    "SELECT id, title, description, category, age_rating, file_url, logo_url, publisher_login, status, created_at, price, is_popular FROM t_p84121358_steam_clone_dark.games WHERE status = %s ORDER BY created_at DESC",
-                    (status,)
-                )
-            games = cur.fetchall()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps([{
-                    'id': g[0],
-                    'title': g[1],
-                    'description': g[2],
-                    'category': g[3],
-                    'age_rating': g[4],
-                    'file_url': g[5],
-                    'logo_url': g[6],
-                    'publisher_login': g[7],
-                    'status': g[8],
-                    'created_at': str(g[9]),
-                    'price': float(g[10]) if len(g) > 10 and g[10] is not None else 0.0,
-                    'is_popular': g[11] if len(g) > 11 else False
-                } for g in games])
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            
-            cur.execute(
-                "INSERT INTO t_p84121358_steam_clone_dark.games (title, description, category, age_rating, file_url, logo_url, publisher_login, status, price, contact_email) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id",
-                (
-                    body_data.get('title'),
-                    body_data.get('description'),
-                    body_data.get('category'),
-                    body_data.get('age_rating'),
-                    body_data.get('file_url'),
-                    body_data.get('logo_url'),
-                    body_data.get('publisher_login'),
-                    'pending',
-                    body_data.get('price', 0),
-                    body_data.get('contact_email')
-                )
-            )
-            game_id = cur.fetchone()[0]
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'id': game_id, 'status': 'pending'})
-            }
-        
-        elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            game_id = body_data.get('id')
-            status = body_data.get('status')
-            
-            cur.execute(
-                "UPDATE t_p84121358_steam_clone_dark.games SET status = %s WHERE id = %s",
-                (status, game_id)
-            )
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
+        if cache_key is not None:
+            cached = catalog_cache.get(cache_key, catalog_cache.version(cur))
+            if cached:
+                return router.observe('GET cached', started, catalog_response(event, *cached))
         
-        elif method == 'DELETE':
-            body_data = json.loads(event.get('body', '{}'))
-            user_id = body_data.get('user_id')
-            game_id = body_data.get('game_id')
-            
-            if user_id and game_id:
-                cur.execute(
-                    "SELECT price FROM t_p84121358_steam_clone_dark.games WHERE id = %s",
-                    (game_id,)
-                )
-                game = cur.fetchone()
-                
-                if game:
-                    game_price = float(game[0]) if game[0] else 0
-                    refund = int(game_price * 0.9)
-                    
-                    cur.execute(
-                        "DELETE FROM t_p84121358_steam_clone_dark.purchases WHERE user_id = %s AND game_id = %s",
-                        (user_id, game_id)
-                    )
-                    
-                    cur.execute(
-                        "UPDATE t_p84121358_steam_clone_dark.users SET balance = balance + %s WHERE id = %s RETURNING balance",
-                        (refund, user_id)
-                    )
-                    new_balance = cur.fetchone()[0]
-                    conn.commit()
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'success': True, 'refund': refund, 'new_balance': new_balance})
-                    }
-            
-            params = event.get('queryStringParameters', {})
-            game_id = params.get('id')
-            
-            if game_id:
-                cur.execute(
-                    "DELETE FROM t_p84121358_steam_clone_dark.games WHERE id = %s",
-                    (game_id,)
-                )
-                conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
+        if session is not None and not ban_versions.is_current(cur, session):
+            return json_response(event, 403, {'error': 'Session revoked'})
         
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return router.dispatch(event, cur, conn)
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release(conn)
\ No newline at end of file
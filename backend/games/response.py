@@ -0,0 +1,106 @@
+'''
+Business: Shared JSON response builder with CORS headers and compression
+Args: event (for Accept-Encoding), status code, payload or pre-encoded body,
+      RESPONSE_COMPRESS_MIN_BYTES env var
+Returns: API gateway response dict, gzip/brotli + base64 when it pays off
+'''
+import base64
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, Any, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES: int = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+COMPRESSED_CACHE_SIZE = 64
+
+CORS_HEADERS = {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'}
+
+_compressed: 'OrderedDict[Tuple[str, str], bytes]' = OrderedDict()
+_compressed_lock = threading.Lock()
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f'Cannot serialize {type(value).__name__}')
+
+
+def dumps(payload: Any) -> str:
+    '''orjson when installed (datetime handled natively), json otherwise'''
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(payload, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+
+def _negotiate(event: Dict[str, Any]) -> Optional[str]:
+    headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+    accepted = {part.split(';')[0].strip() for part in headers.get('accept-encoding', '').split(',')}
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def _compress(raw: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(raw, quality=BROTLI_QUALITY)
+    return gzip.compress(raw, compresslevel=GZIP_LEVEL)
+
+
+def respond(event: Dict[str, Any], status: int, body: str,
+            headers: Optional[Dict[str, str]] = None, cache_key: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    Wrap an already encoded body. Bodies over COMPRESS_MIN_BYTES are
+    compressed with the best encoding the client accepts; cache_key (an
+    ETag) lets repeated responses reuse the compressed bytes.
+    '''
+    response_headers = dict(headers or CORS_HEADERS)
+    raw = body.encode()
+    encoding = _negotiate(event) if len(raw) >= COMPRESS_MIN_BYTES else None
+    if encoding is None:
+        return {'statusCode': status, 'headers': response_headers, 'isBase64Encoded': False, 'body': body}
+
+    compressed = None
+    if cache_key is not None:
+        with _compressed_lock:
+            compressed = _compressed.get((cache_key, encoding))
+    if compressed is None:
+        compressed = _compress(raw, encoding)
+        if cache_key is not None:
+            with _compressed_lock:
+                _compressed[(cache_key, encoding)] = compressed
+                while len(_compressed) > COMPRESSED_CACHE_SIZE:
+                    _compressed.popitem(last=False)
+
+    response_headers['Content-Encoding'] = encoding
+    response_headers['Vary'] = 'Accept-Encoding'
+    return {
+        'statusCode': status,
+        'headers': response_headers,
+        'isBase64Encoded': True,
+        'body': base64.b64encode(compressed).decode()
+    }
+
+
+def json_response(event: Dict[str, Any], status: int, payload: Any,
+                  headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    return respond(event, status, dumps(payload), headers)
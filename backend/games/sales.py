@@ -0,0 +1,63 @@
+'''
+Business: Incrementally maintained sales rollups behind the admin statistics dashboard
+Args: cursor inside the purchase, trade or refund transaction and the sales it just wrote
+Returns: record_sales() folding them into hourly totals, daily per-item and per-seller
+         counters and the games' trending scores
+'''
+from typing import Any, List, Optional, Tuple
+
+from trending import HALF_LIFE_HOURS, TRENDING_WEIGHTS
+
+
+def record_sales(cur: Any, kind: str, sales: List[Tuple[int, Any, Optional[int]]]) -> None:
+    '''
+    Add (item_id, amount, seller_id) sales of one kind in the caller's
+    transaction, so the counters commit or roll back with the sale itself.
+    Counter rows are written in key order so concurrent checkouts lock them
+    in the same order; seller_id is None for store sales and refunds. Game
+    sales also add their weight to game_trending, measured against the
+    shared epoch so older scores never need rewriting.
+    '''
+    if not sales:
+        return
+    cur.execute(
+        """WITH sale AS (
+            SELECT s.item_id, s.amount, s.seller_id
+            FROM unnest(%(items)s::int[], %(amounts)s::numeric[], %(sellers)s::int[]) AS s(item_id, amount, seller_id)
+        ),
+        hourly AS (
+            INSERT INTO t_p84121358_steam_clone_dark.sales_hourly (bucket, kind, sales, amount)
+            SELECT date_trunc('hour', NOW()), %(kind)s, COUNT(*), SUM(amount) FROM sale
+            ON CONFLICT (bucket, kind) DO UPDATE
+            SET sales = sales_hourly.sales + EXCLUDED.sales, amount = sales_hourly.amount + EXCLUDED.amount
+        ),
+        items AS (
+            INSERT INTO t_p84121358_steam_clone_dark.sales_daily_items (day, kind, item_id, sales, amount)
+            SELECT NOW()::date, %(kind)s, item_id, COUNT(*), SUM(amount) FROM sale
+            GROUP BY item_id ORDER BY item_id
+            ON CONFLICT (day, kind, item_id) DO UPDATE
+            SET sales = sales_daily_items.sales + EXCLUDED.sales, amount = sales_daily_items.amount + EXCLUDED.amount
+        ),
+        trending AS (
+            INSERT INTO t_p84121358_steam_clone_dark.game_trending (game_id, score)
+            SELECT item_id, COUNT(*) * %(weight)s::float8 * power(2, EXTRACT(EPOCH FROM LOCALTIMESTAMP - t.epoch)::float8 / %(half_life)s)
+            FROM sale, t_p84121358_steam_clone_dark.trending_state t
+            WHERE %(weight)s::float8 IS NOT NULL
+            GROUP BY item_id, t.epoch ORDER BY item_id
+            ON CONFLICT (game_id) DO UPDATE SET score = game_trending.score + EXCLUDED.score
+        )
+        INSERT INTO t_p84121358_steam_clone_dark.sales_daily_sellers (day, seller_id, sales, amount)
+        SELECT NOW()::date, seller_id, COUNT(*), SUM(amount) FROM sale
+        WHERE seller_id IS NOT NULL
+        GROUP BY seller_id ORDER BY seller_id
+        ON CONFLICT (day, seller_id) DO UPDATE
+        SET sales = sales_daily_sellers.sales + EXCLUDED.sales, amount = sales_daily_sellers.amount + EXCLUDED.amount""",
+        {
+            'kind': kind,
+            'weight': TRENDING_WEIGHTS.get(kind),
+            'half_life': HALF_LIFE_HOURS * 3600,
+            'items': [s[0] for s in sales],
+            'amounts': [s[1] for s in sales],
+            'sellers': [s[2] for s in sales],
+        }
+    )
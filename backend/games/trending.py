@@ -0,0 +1,67 @@
+'''
+Business: Time-decayed trending score per game behind the catalog's status=popular shelf
+Args: TRENDING_HALF_LIFE_HOURS env var, cursor of the scheduled refresh
+Returns: weights sales.record_sales() bumps scores by and refresh_trending() rescoring from the rollups
+'''
+import math
+import os
+from typing import Any, Dict
+
+HALF_LIFE_HOURS: float = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '72'))
+# Sale kinds that move a game's score: store purchases, market resales at half weight, refunds back out
+TRENDING_WEIGHTS: Dict[str, float] = {'game': 1.0, 'market_game': 0.5, 'refund': -1.0}
+# The refresh ignores sales older than this (weight under 0.1%) and moves the epoch
+# forward once it is REBASE_HALF_LIVES old, far below double precision overflow
+WINDOW_HALF_LIVES = 10
+REBASE_HALF_LIVES = 256
+
+
+def refresh_trending(cur: Any) -> Dict[str, Any]:
+    '''
+    Rescore every game from the last WINDOW_HALF_LIVES half-lives of
+    sales_daily_items (each day's sales counted at noon) and drop games that
+    left the window. This repairs bumps that raced a previous refresh, and is
+    the only place the epoch moves. The caller commits.
+    '''
+    half_life = HALF_LIFE_HOURS * 3600
+    cur.execute(
+        """UPDATE t_p84121358_steam_clone_dark.trending_state
+        SET epoch = CASE WHEN LOCALTIMESTAMP - epoch > %s * INTERVAL '1 second' THEN date_trunc('hour', LOCALTIMESTAMP) ELSE epoch END,
+            refreshed_at = LOCALTIMESTAMP
+        RETURNING epoch""",
+        (half_life * REBASE_HALF_LIVES,)
+    )
+    epoch = cur.fetchone()[0]
+
+    kinds = sorted(TRENDING_WEIGHTS)
+    cur.execute(
+        """WITH scored AS (
+            SELECT d.item_id AS game_id,
+                SUM(d.sales * w.weight * power(2, EXTRACT(EPOCH FROM LEAST(d.day + INTERVAL '12 hours', LOCALTIMESTAMP) - %(epoch)s)::float8 / %(half_life)s)) AS score
+            FROM t_p84121358_steam_clone_dark.sales_daily_items d
+            JOIN unnest(%(kinds)s::varchar[], %(weights)s::float8[]) AS w(kind, weight) ON w.kind = d.kind
+            WHERE d.day >= LOCALTIMESTAMP::date - %(window_days)s
+            GROUP BY d.item_id
+        ),
+        dropped AS (
+            DELETE FROM t_p84121358_steam_clone_dark.game_trending t
+            WHERE NOT EXISTS (SELECT 1 FROM scored WHERE scored.game_id = t.game_id)
+            RETURNING t.game_id
+        ),
+        scores AS (
+            INSERT INTO t_p84121358_steam_clone_dark.game_trending (game_id, score)
+            SELECT game_id, score FROM scored ORDER BY game_id
+            ON CONFLICT (game_id) DO UPDATE SET score = EXCLUDED.score
+            RETURNING game_id
+        )
+        SELECT (SELECT COUNT(*) FROM scores), (SELECT COUNT(*) FROM dropped)""",
+        {
+            'epoch': epoch,
+            'half_life': half_life,
+            'kinds': kinds,
+            'weights': [TRENDING_WEIGHTS[k] for k in kinds],
+            'window_days': math.ceil(HALF_LIFE_HOURS * WINDOW_HALF_LIVES / 24),
+        }
+    )
+    scored, dropped = cur.fetchone()
+    return {'epoch': epoch, 'scored': scored, 'dropped': dropped}
@@ -0,0 +1,228 @@
+'''
+Business: Resumable chunked uploads of game builds with content-hash deduplication
+Args: BUILD_MAX_SIZE, BUILD_UPLOAD_TTL_HOURS env vars; base64 chunks sent at the upload's offset
+Returns: start_upload(), get_upload() and write_chunk() behind the games upload actions
+'''
+import base64
+import hashlib
+import os
+import re
+import secrets
+from typing import Any, Dict, List, Optional, Tuple
+
+from blobstore import build_store
+
+BLOCK_SIZE = 1024 * 1024
+# Two blocks per chunk keep a base64 chunk inside the function's request size limit
+MAX_CHUNK_SIZE = 2 * BLOCK_SIZE
+# Base64 is decoded in slices of this many characters (a multiple of 4), so a chunk is
+# written and hashed without a second full-size copy of it in memory
+DECODE_SLICE = 64 * 1024
+MAX_BUILD_SIZE: int = int(os.environ.get('BUILD_MAX_SIZE', str(2 * 1024 ** 3)))
+UPLOAD_TTL_HOURS: float = float(os.environ.get('BUILD_UPLOAD_TTL_HOURS', '24'))
+EXPIRE_BATCH = 20
+CONTENT_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    def __init__(self, status: int, message: str, offset: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.body: Dict[str, Any] = {'error': message}
+        if offset is not None:
+            self.body['offset'] = offset
+
+
+def content_hash(block_digests: bytes) -> str:
+    '''
+    SHA-256 over the SHA-256 of each BLOCK_SIZE block of the build. It is the
+    same for any chunking, and each chunk adds its blocks' digests as it is
+    written, so no invocation ever needs the whole file.
+    '''
+    return hashlib.sha256(block_digests).hexdigest()
+
+
+def byte_count(value: Any) -> int:
+    '''
+    Whole number of bytes from a request body: a JSON integer or a string of
+    digits. Fractions and booleans raise ValueError instead of being
+    truncated by int().
+    '''
+    if isinstance(value, (bool, float)):
+        raise ValueError(value)
+    return int(value or 0)
+
+
+def upload_state(upload_id: str, size: int, received: int, digest: Optional[str], url: Optional[str]) -> Dict[str, Any]:
+    return {
+        'upload_id': upload_id,
+        'status': 'complete' if digest else 'uploading',
+        'size': size,
+        'offset': received,
+        'block_size': BLOCK_SIZE,
+        'max_chunk_size': MAX_CHUNK_SIZE,
+        'content_hash': digest,
+        'file_url': url,
+    }
+
+
+def get_upload(cur: Any, upload_id: str, lock: bool = False) -> Optional[Tuple[Any, ...]]:
+    '''(id, filename, size, received, content_hash, url) of an upload, row-locked for a chunk write when lock is set'''
+    cur.execute(
+        f"""SELECT u.id, u.filename, u.size, u.received, u.content_hash, b.url
+        FROM t_p84121358_steam_clone_dark.build_uploads u
+        LEFT JOIN t_p84121358_steam_clone_dark.build_blobs b ON b.content_hash = u.content_hash
+        WHERE u.id = %s{' FOR UPDATE OF u' if lock else ''}""",
+        (upload_id,)
+    )
+    return cur.fetchone()
+
+
+def expire_uploads(cur: Any) -> List[str]:
+    '''Drop a batch of uploads idle for UPLOAD_TTL_HOURS along with their staged bytes'''
+    cur.execute(
+        """DELETE FROM t_p84121358_steam_clone_dark.build_uploads
+        WHERE id IN (
+            SELECT id FROM t_p84121358_steam_clone_dark.build_uploads
+            WHERE completed_at IS NULL AND updated_at < LOCALTIMESTAMP - %s * INTERVAL '1 hour'
+            ORDER BY updated_at LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id""",
+        (UPLOAD_TTL_HOURS, EXPIRE_BATCH)
+    )
+    expired = [row[0] for row in cur.fetchall()]
+    for upload_id in expired:
+        build_store.discard(upload_id)
+    return expired
+
+
+def start_upload(cur: Any, filename: str, size: int, publisher_login: Optional[str], digest: Optional[str] = None) -> Dict[str, Any]:
+    '''
+    Open an upload of size bytes. When the client already knows the build's
+    content_hash and that build is stored, the upload completes at once and
+    nothing has to be sent. Refused with 503 when no shared build store is
+    configured, so a resume can land on any instance and no instance-local
+    URL ever reaches a game row.
+    '''
+    if build_store is None:
+        raise UploadError(503, 'Build uploads are not configured')
+    filename = os.path.basename(filename or '')[:255]
+    if not filename or not 0 < size <= MAX_BUILD_SIZE:
+        raise UploadError(400, f'filename and a size of 1-{MAX_BUILD_SIZE} bytes are required')
+    if digest is not None and not CONTENT_HASH.match(digest):
+        raise UploadError(400, 'content_hash must be 64 lowercase hex digits')
+    expire_uploads(cur)
+
+    url = None
+    if digest is not None:
+        cur.execute(
+            "SELECT url FROM t_p84121358_steam_clone_dark.build_blobs WHERE content_hash = %s AND size = %s",
+            (digest, size)
+        )
+        stored = cur.fetchone()
+        url = stored[0] if stored else None
+
+    upload_id = secrets.token_urlsafe(18)
+    cur.execute(
+        """INSERT INTO t_p84121358_steam_clone_dark.build_uploads (id, publisher_login, filename, size, received, content_hash, completed_at)
+        VALUES (%s, %s, %s, %s, %s, %s, CASE WHEN %s THEN LOCALTIMESTAMP END)""",
+        (upload_id, publisher_login, filename, size, size if url else 0, digest if url else None, url is not None)
+    )
+    if url:
+        return upload_state(upload_id, size, size, digest, url)
+    return upload_state(upload_id, size, 0, None, None)
+
+
+def chunk_length(data: str) -> int:
+    '''Decoded size of a base64 chunk, without decoding it'''
+    if len(data) % 4:
+        raise UploadError(400, 'data must be base64')
+    return len(data) // 4 * 3 - len(data[-2:]) + len(data[-2:].rstrip('='))
+
+
+def stream_chunk(upload_id: str, offset: int, data: str) -> bytes:
+    '''Decode, store and hash a chunk slice by slice; returns the digests of the blocks it covers'''
+    digests = []
+    block = hashlib.sha256()
+    filled = 0
+    with build_store.open_staging(upload_id, offset) as out:
+        for start in range(0, len(data), DECODE_SLICE):
+            piece = memoryview(base64.b64decode(data[start:start + DECODE_SLICE], validate=True))
+            out.write(piece)
+            while piece:
+                take = min(BLOCK_SIZE - filled, len(piece))
+                block.update(piece[:take])
+                filled += take
+                piece = piece[take:]
+                if filled == BLOCK_SIZE:
+                    digests.append(block.digest())
+                    block = hashlib.sha256()
+                    filled = 0
+    if filled:
+        digests.append(block.digest())
+    return b''.join(digests)
+
+
+def write_chunk(cur: Any, upload_id: str, offset: int, data: str) -> Dict[str, Any]:
+    '''
+    Append one chunk at the upload's current offset. Chunks are whole blocks
+    except the last, so every chunk starts on a block boundary and its digests
+    extend the list kept on the row. Retrying a chunk whose response was lost
+    is safe: a stale offset is answered with 409 and the offset to resume from.
+    The last chunk computes the content hash and either publishes the build or,
+    when an identical one is already stored, drops the staged copy.
+    '''
+    if build_store is None:
+        raise UploadError(503, 'Build uploads are not configured')
+    row = get_upload(cur, upload_id, lock=True)
+    if row is None:
+        raise UploadError(404, 'Upload not found')
+    _, filename, size, received, digest, url = row
+    if digest:
+        return upload_state(upload_id, size, received, digest, url)
+    if offset != received:
+        raise UploadError(409, 'Chunk does not start at the upload offset', offset=received)
+
+    length = chunk_length(data)
+    if not 0 < length <= min(MAX_CHUNK_SIZE, size - received) or (length % BLOCK_SIZE and received + length != size):
+        raise UploadError(400, f'Chunks must be 1-{MAX_CHUNK_SIZE // BLOCK_SIZE} whole blocks of {BLOCK_SIZE} bytes, or the rest of the build')
+    try:
+        chunk_digests = stream_chunk(upload_id, offset, data)
+    except FileNotFoundError:
+        raise UploadError(410, 'Upload expired, start it again')
+    except ValueError:
+        raise UploadError(400, 'data must be base64')
+
+    received += length
+    cur.execute(
+        """UPDATE t_p84121358_steam_clone_dark.build_uploads
+        SET received = %s, block_digests = block_digests || %s, updated_at = LOCALTIMESTAMP
+        WHERE id = %s
+        RETURNING block_digests""",
+        (received, chunk_digests, upload_id)
+    )
+    block_digests = bytes(cur.fetchone()[0])
+    if received < size:
+        return upload_state(upload_id, size, received, None, None)
+
+    digest = content_hash(block_digests)
+    name = digest + re.sub(r'[^a-z0-9.]', '', os.path.splitext(filename)[1].lower())[:16]
+    cur.execute(
+        """INSERT INTO t_p84121358_steam_clone_dark.build_blobs (content_hash, size, url) VALUES (%s, %s, %s)
+        ON CONFLICT (content_hash) DO NOTHING
+        RETURNING url""",
+        (digest, size, build_store.url(name))
+    )
+    if cur.fetchone():
+        build_store.publish(upload_id, name)
+    else:
+        build_store.discard(upload_id)
+    cur.execute(
+        """UPDATE t_p84121358_steam_clone_dark.build_uploads u SET content_hash = %s, completed_at = LOCALTIMESTAMP
+        FROM t_p84121358_steam_clone_dark.build_blobs b
+        WHERE u.id = %s AND b.content_hash = %s
+        RETURNING b.url""",
+        (digest, upload_id, digest)
+    )
+    return upload_state(upload_id, size, received, digest, cur.fetchone()[0])
@@ -1,7 +1,338 @@
-import json
-import os
-import psycopg2
-from typing import Dict, Any
+import binascii
+from typing import Dict, Any, Set, Optional
+from db import acquire, release, statement
+from market import execute_trade, fetch_listings
+from response import json_response, respond
+from router import MeteredCursor, Router
+from sales import record_sales
+from session import InvalidToken, authenticate, ban_versions
+
+MAX_CART_SIZE = 100
+PROFILE_INCLUDES = ('purchases', 'frames', 'description')
+
+def profile_query(includes: Set[str]) -> str:
+    '''
+    Build the profile document in Postgres with json_build_object/json_agg,
+    so one round-trip returns ready-to-send JSON text. purchases, frames and
+    game descriptions are only selected when listed in includes.
+    '''
+    fields = [
+        "'id', u.id", "'email', u.email", "'username', u.username", "'display_name', u.display_name",
+        "'avatar_url', u.avatar_url", "'balance', u.balance::float8", "'is_verified', u.is_verified",
+        "'has_checkmark', u.has_checkmark", "'role', u.role", "'active_frame_id', u.active_frame_id"
+    ]
+    if 'purchases' in includes:
+        description = "'description', g.description, " if 'description' in includes else ''
+        fields.append(f"""'purchases', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'purchase_id', p.id, 'id', g.id, 'title', g.title, {description}'category', g.category,
+                'price', COALESCE(g.price, 0)::float8, 'file_url', g.file_url, 'logo_url', g.logo_url,
+                'is_on_market', p.is_on_market, 'market_price', p.market_price::float8
+            ) ORDER BY p.id), '[]'::json)
+            FROM t_p84121358_steam_clone_dark.purchases p
+            JOIN t_p84121358_steam_clone_dark.games g ON p.game_id = g.id
+            WHERE p.user_id = u.id AND p.is_on_market = FALSE
+        )""")
+    if 'frames' in includes:
+        fields.append("""'frames', (
+            SELECT COALESCE(json_agg(json_build_object(
+                'user_frame_id', uf.id, 'id', f.id, 'name', f.name, 'image_url', f.image_url,
+                'price', COALESCE(f.price, 0)::float8, 'is_on_market', uf.is_on_market, 'market_price', uf.market_price::float8
+            ) ORDER BY uf.id), '[]'::json)
+            FROM t_p84121358_steam_clone_dark.user_frames uf
+            JOIN t_p84121358_steam_clone_dark.frames f ON uf.frame_id = f.id
+            WHERE uf.user_id = u.id AND uf.is_on_market = FALSE
+        )""")
+    return f"SELECT json_build_object({', '.join(fields)})::text FROM t_p84121358_steam_clone_dark.users u WHERE u.id = %s"
+
+router = Router('profile')
+
+@router.route('GET', 'market_listings')
+def get_market_listings(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    try:
+        listings, next_cursor = fetch_listings(cur, params)
+    except (ValueError, TypeError, binascii.Error):
+        return json_response(event, 400, {'error': 'Invalid filter or cursor'})
+    
+    return json_response(event, 200, {'listings': listings, 'next_cursor': next_cursor})
+
+@router.route('GET')
+def get_profile(event: Dict[str, Any], params: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = params.get('user_id')
+    
+    if user_id:
+        includes = set(params['include'].split(',')) if 'include' in params else set(PROFILE_INCLUDES)
+        statement('profile', profile_query(includes)).execute(cur, (user_id,))
+        profile = cur.fetchone()
+        
+        if not profile:
+            return json_response(event, 404, {'error': 'User not found'})
+        
+        return respond(event, 200, profile[0])
+
+@router.route('PUT')
+def update_profile(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    
+    cur.execute(
+        "UPDATE t_p84121358_steam_clone_dark.users SET username = %s, display_name = %s, avatar_url = %s WHERE id = %s",
+        (body_data.get('username'), body_data.get('display_name'), body_data.get('avatar_url'), user_id)
+    )
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'get_frames')
+def get_frames(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    cur.execute("SELECT id, name, image_url, price FROM frames ORDER BY price ASC")
+    frames = cur.fetchall()
+    
+    return json_response(event, 200, [{
+        'id': f[0],
+        'name': f[1],
+        'image_url': f[2],
+        'price': f[3]
+    } for f in frames])
+
+@router.route('POST', 'get_user_frames')
+def get_user_frames(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    statement('user_frames', "SELECT uf.id as user_frame_id, f.id, f.name, f.image_url, f.price, uf.is_on_market, uf.market_price FROM t_p84121358_steam_clone_dark.user_frames uf JOIN t_p84121358_steam_clone_dark.frames f ON uf.frame_id = f.id WHERE uf.user_id = %s").execute(cur, (user_id,))
+    frames = cur.fetchall()
+    
+    return json_response(event, 200, [{
+        'user_frame_id': f[0],
+        'id': f[1],
+        'name': f[2],
+        'image_url': f[3],
+        'price': f[4],
+        'is_on_market': f[5],
+        'market_price': f[6]
+    } for f in frames])
+
+@router.route('POST', 'purchase_frame')
+def purchase_frame(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    frame_id = body_data.get('frame_id')
+    
+    statement('frame_price', "SELECT price FROM t_p84121358_steam_clone_dark.frames WHERE id = %s").execute(cur, (frame_id,))
+    frame = cur.fetchone()
+    price = float(frame[0])
+    
+    statement('user_balance', "SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s").execute(cur, (user_id,))
+    user = cur.fetchone()
+    balance = float(user[0])
+    
+    if balance >= price:
+        cur.execute(
+            "INSERT INTO t_p84121358_steam_clone_dark.user_frames (user_id, frame_id) VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING id",
+            (user_id, frame_id)
+        )
+        bought = cur.fetchone() is not None
+        cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET balance = balance - %s WHERE id = %s", (price, user_id))
+        if bought:
+            record_sales(cur, 'frame', [(frame_id, price, None)])
+        conn.commit()
+        
+        return json_response(event, 200, {'success': True, 'new_balance': balance - price})
+    else:
+        return json_response(event, 400, {'error': 'Недостаточно средств'})
+
+@router.route('POST', 'set_active_frame')
+def set_active_frame(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    frame_id = body_data.get('frame_id')
+    cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET active_frame_id = %s WHERE id = %s", (frame_id, user_id))
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'list_on_market')
+def list_on_market(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    item_type = body_data.get('item_type')
+    item_id = body_data.get('item_id')
+    price = body_data.get('price')
+    
+    if item_type == 'game':
+        cur.execute(
+            "UPDATE t_p84121358_steam_clone_dark.purchases SET is_on_market = TRUE, market_price = %s, listed_at = NOW() WHERE id = %s AND user_id = %s",
+            (price, item_id, user_id)
+        )
+    else:
+        cur.execute(
+            "UPDATE t_p84121358_steam_clone_dark.user_frames SET is_on_market = TRUE, market_price = %s, listed_at = NOW() WHERE id = %s AND user_id = %s",
+            (price, item_id, user_id)
+        )
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'remove_from_market')
+def remove_from_market(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    item_type = body_data.get('item_type')
+    item_id = body_data.get('item_id')
+    
+    if item_type == 'game':
+        cur.execute(
+            "UPDATE t_p84121358_steam_clone_dark.purchases SET is_on_market = FALSE, market_price = 0 WHERE id = %s AND user_id = %s",
+            (item_id, user_id)
+        )
+    else:
+        cur.execute(
+            "UPDATE t_p84121358_steam_clone_dark.user_frames SET is_on_market = FALSE, market_price = 0 WHERE id = %s AND user_id = %s",
+            (item_id, user_id)
+        )
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'buy_from_market')
+def buy_from_market(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    buyer_id = body_data.get('buyer_id')
+    listing_id = body_data.get('listing_id')
+    item_type = 'game' if body_data.get('item_type') == 'game' else 'frame'
+    
+    price, new_balance = execute_trade(cur, buyer_id, listing_id, item_type)
+    
+    if price is None:
+        conn.rollback()
+        return json_response(event, 404, {'error': 'Товар не найден'})
+    
+    if new_balance is None:
+        conn.rollback()
+        return json_response(event, 400, {'error': 'Недостаточно средств'})
+    
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True, 'price': price, 'new_balance': new_balance})
+
+@router.route('POST', 'create_frame')
+def create_frame(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    cur.execute(
+        "INSERT INTO t_p84121358_steam_clone_dark.frames (name, image_url, price) VALUES (%s, %s, %s) RETURNING id",
+        (body_data.get('name'), body_data.get('image_url'), body_data.get('price', 0))
+    )
+    frame_id = cur.fetchone()[0]
+    conn.commit()
+    
+    return json_response(event, 200, {'id': frame_id})
+
+@router.route('POST', 'delete_frame')
+def delete_frame(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    frame_id = body_data.get('frame_id')
+    cur.execute("DELETE FROM t_p84121358_steam_clone_dark.frames WHERE id = %s", (frame_id,))
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'update_frame_price')
+def update_frame_price(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    frame_id = body_data.get('frame_id')
+    price = body_data.get('price')
+    cur.execute("UPDATE t_p84121358_steam_clone_dark.frames SET price = %s WHERE id = %s", (price, frame_id))
+    conn.commit()
+    
+    return json_response(event, 200, {'success': True})
+
+@router.route('POST', 'purchase')
+def purchase(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    game_id = body_data.get('game_id')
+    
+    statement('game_price', "SELECT price FROM t_p84121358_steam_clone_dark.games WHERE id = %s").execute(cur, (game_id,))
+    game = cur.fetchone()
+    price = float(game[0])
+    
+    statement('user_balance', "SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s").execute(cur, (user_id,))
+    user = cur.fetchone()
+    balance = float(user[0])
+    
+    if balance >= price:
+        cur.execute(
+            "INSERT INTO t_p84121358_steam_clone_dark.purchases (user_id, game_id, price, purchased_at) VALUES (%s, %s, %s, NOW()) ON CONFLICT (user_id, game_id) DO NOTHING RETURNING id",
+            (user_id, game_id, price)
+        )
+        bought = cur.fetchone() is not None
+        cur.execute(
+            "UPDATE t_p84121358_steam_clone_dark.users SET balance = balance - %s WHERE id = %s",
+            (price, user_id)
+        )
+        if bought:
+            record_sales(cur, 'game', [(game_id, price, None)])
+        conn.commit()
+        
+        return json_response(event, 200, {'success': True, 'new_balance': balance - price})
+    else:
+        return json_response(event, 400, {'error': 'Insufficient balance'})
+
+@router.route('POST', 'checkout')
+def checkout(event: Dict[str, Any], body_data: Dict[str, Any], cur: Any, conn: Any) -> Optional[Dict[str, Any]]:
+    user_id = body_data.get('user_id')
+    try:
+        game_ids = list(dict.fromkeys(int(g) for g in body_data.get('game_ids') or []))
+    except (TypeError, ValueError):
+        game_ids = []
+    
+    if not game_ids or len(game_ids) > MAX_CART_SIZE:
+        return json_response(event, 400, {'error': f'game_ids must list 1-{MAX_CART_SIZE} games'})
+    
+    statement('user_balance_lock', "SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s FOR UPDATE").execute(cur, (user_id,))
+    user = cur.fetchone()
+    
+    if not user:
+        conn.rollback()
+        return json_response(event, 404, {'error': 'User not found'})
+    
+    cur.execute(
+        """SELECT g.id, g.price, p.id IS NOT NULL AS owned
+        FROM t_p84121358_steam_clone_dark.games g
+        LEFT JOIN t_p84121358_steam_clone_dark.purchases p ON p.game_id = g.id AND p.user_id = %s
+        WHERE g.id = ANY(%s)""",
+        (user_id, game_ids)
+    )
+    priced = {g[0]: (float(g[1] or 0), g[2]) for g in cur.fetchall()}
+    to_buy = [game_id for game_id in game_ids if game_id in priced and not priced[game_id][1]]
+    total = sum(priced[game_id][0] for game_id in to_buy)
+    
+    if float(user[0]) < total:
+        conn.rollback()
+        return json_response(event, 400, {'error': 'Insufficient balance', 'total': total, 'balance': float(user[0])})
+    
+    cur.execute(
+        """WITH inserted AS (
+            INSERT INTO t_p84121358_steam_clone_dark.purchases (user_id, game_id, price, purchased_at)
+            SELECT %s, item.game_id, item.price, NOW()
+            FROM unnest(%s::int[], %s::numeric[]) AS item(game_id, price)
+            ON CONFLICT (user_id, game_id) DO NOTHING
+            RETURNING game_id, price
+        )
+        UPDATE t_p84121358_steam_clone_dark.users
+        SET balance = balance - COALESCE((SELECT SUM(price) FROM inserted), 0)
+        WHERE id = %s
+        RETURNING balance, ARRAY(SELECT game_id FROM inserted)""",
+        (user_id, to_buy, [priced[game_id][0] for game_id in to_buy], user_id)
+    )
+    new_balance, purchased = cur.fetchone()
+    record_sales(cur, 'game', [(game_id, priced[game_id][0], None) for game_id in purchased])
+    conn.commit()
+    
+    items = []
+    for game_id in game_ids:
+        if game_id not in priced:
+            items.append({'game_id': game_id, 'status': 'not_found'})
+        elif game_id in purchased:
+            items.append({'game_id': game_id, 'status': 'purchased', 'price': priced[game_id][0]})
+        else:
+            items.append({'game_id': game_id, 'status': 'owned'})
+    
+    return json_response(event, 200, {
+        'success': True,
+        'total': float(sum(priced[game_id][0] for game_id in purchased)),
+        'new_balance': float(new_balance),
+        'items': items
+    })
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -18,457 +349,30 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, Authorization',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
-    db_url = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(db_url)
+    try:
+        session = authenticate(event)
+    except InvalidToken:
+        return json_response(event, 401, {'error': 'Invalid or expired session'})
+    
+    metrics = router.metrics_response(event)
+    if metrics is not None:
+        return metrics
+    
+    conn = acquire()
+    conn.cursor_factory = MeteredCursor
     cur = conn.cursor()
     
     try:
-        if method == 'GET':
-            params = event.get('queryStringParameters', {})
-            user_id = params.get('user_id')
-            
-            action = params.get('action')
-            
-            if action == 'market_listings':
-                cur.execute("""
-                    SELECT 
-                        p.id,
-                        p.user_id,
-                        p.game_id,
-                        p.market_price,
-                        'game' as item_type,
-                        g.title as item_name,
-                        g.logo_url as item_image,
-                        u.email as seller_email
-                    FROM t_p84121358_steam_clone_dark.purchases p
-                    JOIN t_p84121358_steam_clone_dark.games g ON p.game_id = g.id
-                    JOIN t_p84121358_steam_clone_dark.users u ON p.user_id = u.id
-                    WHERE p.is_on_market = TRUE
-                    UNION ALL
-                    SELECT 
-                        uf.id,
-                        uf.user_id,
-                        uf.frame_id as game_id,
-                        uf.market_price,
-                        'frame' as item_type,
-                        f.name as item_name,
-                        f.image_url as item_image,
-                        u.email as seller_email
-                    FROM t_p84121358_steam_clone_dark.user_frames uf
-                    JOIN t_p84121358_steam_clone_dark.frames f ON uf.frame_id = f.id
-                    JOIN t_p84121358_steam_clone_dark.users u ON uf.user_id = u.id
-                    WHERE uf.is_on_market = TRUE
-                    ORDER BY id DESC
-                """)
-                listings = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'listings': [{
-                        'id': l[0],
-                        'user_id': l[1],
-                        'game_id': l[2],
-                        'market_price': l[3],
-                        'item_type': l[4],
-                        'item_name': l[5],
-                        'item_image': l[6],
-                        'seller_email': l[7]
-                    } for l in listings]})
-                }
-            
-            if user_id:
-                cur.execute(
-                    "SELECT id, email, username, display_name, avatar_url, balance, is_verified, has_checkmark, role, active_frame_id FROM t_p84121358_steam_clone_dark.users WHERE id = %s",
-                    (user_id,)
-                )
-                user = cur.fetchone()
-                
-                if user:
-                    cur.execute(
-                        "SELECT p.id as purchase_id, g.id, g.title, g.description, g.category, g.price, g.file_url, g.logo_url, p.is_on_market, p.market_price FROM t_p84121358_steam_clone_dark.purchases p JOIN t_p84121358_steam_clone_dark.games g ON p.game_id = g.id WHERE p.user_id = %s AND p.is_on_market = FALSE",
-                        (user_id,)
-                    )
-                    purchases = cur.fetchall()
-                    
-                    cur.execute(
-                        "SELECT uf.id as user_frame_id, f.id, f.name, f.image_url, f.price, uf.is_on_market, uf.market_price FROM t_p84121358_steam_clone_dark.user_frames uf JOIN t_p84121358_steam_clone_dark.frames f ON uf.frame_id = f.id WHERE uf.user_id = %s AND uf.is_on_market = FALSE",
-                        (user_id,)
-                    )
-                    user_frames = cur.fetchall()
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({
-                            'id': user[0],
-                            'email': user[1],
-                            'username': user[2],
-                            'display_name': user[3],
-                            'avatar_url': user[4],
-                            'balance': float(user[5]),
-                            'is_verified': user[6],
-                            'has_checkmark': user[7],
-                            'role': user[8],
-                            'active_frame_id': user[9],
-                            'purchases': [{
-                                'purchase_id': p[0],
-                                'id': p[1],
-                                'title': p[2],
-                                'description': p[3],
-                                'category': p[4],
-                                'price': float(p[5]),
-                                'file_url': p[6],
-                                'logo_url': p[7],
-                                'is_on_market': p[8],
-                                'market_price': p[9]
-                            } for p in purchases],
-                            'frames': [{
-                                'user_frame_id': f[0],
-                                'id': f[1],
-                                'name': f[2],
-                                'image_url': f[3],
-                                'price': float(f[4]),
-                                'is_on_market': f[5],
-                                'market_price': f[6]
-                            } for f in user_frames]
-                        })
-                    }
+        if session is not None and not ban_versions.is_current(cur, session):
+            return json_response(event, 403, {'error': 'Session revoked'})
         
-        elif method == 'PUT':
-            body_data = json.loads(event.get('body', '{}'))
-            user_id = body_data.get('user_id')
-            
-            cur.execute(
-                "UPDATE t_p84121358_steam_clone_dark.users SET username = %s, display_name = %s, avatar_url = %s WHERE id = %s",
-                (body_data.get('username'), body_data.get('display_name'), body_data.get('avatar_url'), user_id)
-            )
-            conn.commit()
-            
-            return {
-                'statusCode': 200,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'isBase64Encoded': False,
-                'body': json.dumps({'success': True})
-            }
-        
-        elif method == 'POST':
-            body_data = json.loads(event.get('body', '{}'))
-            action = body_data.get('action')
-            
-            if action == 'get_frames':
-                cur.execute("SELECT id, name, image_url, price FROM frames ORDER BY price ASC")
-                frames = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'id': f[0],
-                        'name': f[1],
-                        'image_url': f[2],
-                        'price': float(f[3])
-                    } for f in frames])
-                }
-            
-            elif action == 'get_user_frames':
-                user_id = body_data.get('user_id')
-                cur.execute(
-                    "SELECT uf.id as user_frame_id, f.id, f.name, f.image_url, f.price, uf.is_on_market, uf.market_price FROM t_p84121358_steam_clone_dark.user_frames uf JOIN t_p84121358_steam_clone_dark.frames f ON uf.frame_id = f.id WHERE uf.user_id = %s",
-                    (user_id,)
-                )
-                frames = cur.fetchall()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps([{
-                        'user_frame_id': f[0],
-                        'id': f[1],
-                        'name': f[2],
-                        'image_url': f[3],
-                        'price': float(f[4]),
-                        'is_on_market': f[5],
-                        'market_price': f[6]
-                    } for f in frames])
-                }
-            
-            elif action == 'purchase_frame':
-                user_id = body_data.get('user_id')
-                frame_id = body_data.get('frame_id')
-                
-                cur.execute("SELECT price FROM t_p84121358_steam_clone_dark.frames WHERE id = %s", (frame_id,))
-                frame = cur.fetchone()
-                price = float(frame[0])
-                
-                cur.execute("SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s", (user_id,))
-                user = cur.fetchone()
-                balance = float(user[0])
-                
-                if balance >= price:
-                    cur.execute(
-                        "INSERT INTO t_p84121358_steam_clone_dark.user_frames (user_id, frame_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                        (user_id, frame_id)
-                    )
-                    cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET balance = balance - %s WHERE id = %s", (price, user_id))
-                    conn.commit()
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'success': True, 'new_balance': balance - price})
-                    }
-                else:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Недостаточно средств'})
-                    }
-            
-            elif action == 'set_active_frame':
-                user_id = body_data.get('user_id')
-                frame_id = body_data.get('frame_id')
-                cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET active_frame_id = %s WHERE id = %s", (frame_id, user_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'list_on_market':
-                user_id = body_data.get('user_id')
-                item_type = body_data.get('item_type')
-                item_id = body_data.get('item_id')
-                price = body_data.get('price')
-                
-                if item_type == 'game':
-                    cur.execute(
-                        "UPDATE t_p84121358_steam_clone_dark.purchases SET is_on_market = TRUE, market_price = %s WHERE id = %s AND user_id = %s",
-                        (price, item_id, user_id)
-                    )
-                else:
-                    cur.execute(
-                        "UPDATE t_p84121358_steam_clone_dark.user_frames SET is_on_market = TRUE, market_price = %s WHERE id = %s AND user_id = %s",
-                        (price, item_id, user_id)
-                    )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'remove_from_market':
-                user_id = body_data.get('user_id')
-                item_type = body_data.get('item_type')
-                item_id = body_data.get('item_id')
-                
-                if item_type == 'game':
-                    cur.execute(
-                        "UPDATE t_p84121358_steam_clone_dark.purchases SET is_on_market = FALSE, market_price = 0 WHERE id = %s AND user_id = %s",
-                        (item_id, user_id)
-                    )
-                else:
-                    cur.execute(
-                        "UPDATE t_p84121358_steam_clone_dark.user_frames SET is_on_market = FALSE, market_price = 0 WHERE id = %s AND user_id = %s",
-                        (item_id, user_id)
-                    )
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'buy_from_market':
-                buyer_id = body_data.get('buyer_id')
-                listing_id = body_data.get('listing_id')
-                item_type = body_data.get('item_type')
-                
-                if item_type == 'game':
-                    cur.execute(
-                        "SELECT p.user_id as seller_id, p.game_id, p.market_price FROM t_p84121358_steam_clone_dark.purchases p WHERE p.id = %s AND p.is_on_market = TRUE",
-                        (listing_id,)
-                    )
-                    listing = cur.fetchone()
-                    
-                    if not listing:
-                        return {
-                            'statusCode': 404,
-                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'isBase64Encoded': False,
-                            'body': json.dumps({'error': 'Товар не найден'})
-                        }
-                    
-                    seller_id, game_id, market_price = listing
-                    
-                    cur.execute("SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s", (buyer_id,))
-                    buyer = cur.fetchone()
-                    buyer_balance = float(buyer[0])
-                    
-                    if buyer_balance < market_price:
-                        return {
-                            'statusCode': 400,
-                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'isBase64Encoded': False,
-                            'body': json.dumps({'error': 'Недостаточно средств'})
-                        }
-                    
-                    cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET balance = balance + %s WHERE id = %s", (market_price, seller_id))
-                    cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET balance = balance - %s WHERE id = %s", (market_price, buyer_id))
-                    cur.execute("DELETE FROM t_p84121358_steam_clone_dark.purchases WHERE id = %s", (listing_id,))
-                    cur.execute(
-                        "INSERT INTO t_p84121358_steam_clone_dark.purchases (user_id, game_id, price, purchased_at) VALUES (%s, %s, %s, NOW())",
-                        (buyer_id, game_id, market_price)
-                    )
-                    
-                else:
-                    cur.execute(
-                        "SELECT uf.user_id as seller_id, uf.frame_id, uf.market_price FROM t_p84121358_steam_clone_dark.user_frames uf WHERE uf.id = %s AND uf.is_on_market = TRUE",
-                        (listing_id,)
-                    )
-                    listing = cur.fetchone()
-                    
-                    if not listing:
-                        return {
-                            'statusCode': 404,
-                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'isBase64Encoded': False,
-                            'body': json.dumps({'error': 'Товар не найден'})
-                        }
-                    
-                    seller_id, frame_id, market_price = listing
-                    
-                    cur.execute("SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s", (buyer_id,))
-                    buyer = cur.fetchone()
-                    buyer_balance = float(buyer[0])
-                    
-                    if buyer_balance < market_price:
-                        return {
-                            'statusCode': 400,
-                            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                            'isBase64Encoded': False,
-                            'body': json.dumps({'error': 'Недостаточно средств'})
-                        }
-                    
-                    cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET balance = balance + %s WHERE id = %s", (market_price, seller_id))
-                    cur.execute("UPDATE t_p84121358_steam_clone_dark.users SET balance = balance - %s WHERE id = %s", (market_price, buyer_id))
-                    cur.execute("DELETE FROM t_p84121358_steam_clone_dark.user_frames WHERE id = %s", (listing_id,))
-                    cur.execute(
-                        "INSERT INTO t_p84121358_steam_clone_dark.user_frames (user_id, frame_id) VALUES (%s, %s)",
-                        (buyer_id, frame_id)
-                    )
-                
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'create_frame':
-                cur.execute(
-                    "INSERT INTO t_p84121358_steam_clone_dark.frames (name, image_url, price) VALUES (%s, %s, %s) RETURNING id",
-                    (body_data.get('name'), body_data.get('image_url'), body_data.get('price', 0))
-                )
-                frame_id = cur.fetchone()[0]
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'id': frame_id})
-                }
-            
-            elif action == 'delete_frame':
-                frame_id = body_data.get('frame_id')
-                cur.execute("DELETE FROM t_p84121358_steam_clone_dark.frames WHERE id = %s", (frame_id,))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'update_frame_price':
-                frame_id = body_data.get('frame_id')
-                price = body_data.get('price')
-                cur.execute("UPDATE t_p84121358_steam_clone_dark.frames SET price = %s WHERE id = %s", (price, frame_id))
-                conn.commit()
-                
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                    'isBase64Encoded': False,
-                    'body': json.dumps({'success': True})
-                }
-            
-            elif action == 'purchase':
-                user_id = body_data.get('user_id')
-                game_id = body_data.get('game_id')
-                
-                cur.execute("SELECT price FROM t_p84121358_steam_clone_dark.games WHERE id = %s", (game_id,))
-                game = cur.fetchone()
-                price = float(game[0])
-                
-                cur.execute("SELECT balance FROM t_p84121358_steam_clone_dark.users WHERE id = %s", (user_id,))
-                user = cur.fetchone()
-                balance = float(user[0])
-                
-                if balance >= price:
-                    cur.execute(
-                        "INSERT INTO t_p84121358_steam_clone_dark.purchases (user_id, game_id, price, purchased_at) VALUES (%s, %s, %s, NOW()) ON CONFLICT (user_id, game_id) DO NOTHING",
-                        (user_id, game_id, price)
-                    )
-                    cur.execute(
-                        "UPDATE t_p84121358_steam_clone_dark.users SET balance = balance - %s WHERE id = %s",
-                        (price, user_id)
-                    )
-                    conn.commit()
-                    
-                    return {
-                        'statusCode': 200,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'success': True, 'new_balance': balance - price})
-                    }
-                else:
-                    return {
-                        'statusCode': 400,
-                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                        'isBase64Encoded': False,
-                        'body': json.dumps({'error': 'Insufficient balance'})
-                    }
-        
-        return {
-            'statusCode': 405,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Method not allowed'})
-        }
+        return router.dispatch(event, cur, conn)
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release(conn)
\ No newline at end of file
@@ -0,0 +1,201 @@
+'''
+Business: Marketplace order book over games and frames put up for sale
+Args: item_type, min_price, max_price, item_id, sort, limit, cursor query params
+Returns: one page of listings plus an opaque cursor for the next page
+'''
+import base64
+import json
+from typing import Dict, Any, List, Optional, Tuple
+
+from sales import record_sales
+
+DEFAULT_LISTINGS_LIMIT = 50
+MAX_LISTINGS_LIMIT = 200
+
+SORTS: Dict[str, Tuple[str, str]] = {
+    'recent': ('listed_at', 'DESC'),
+    'price_asc': ('market_price', 'ASC'),
+    'price_desc': ('market_price', 'DESC'),
+}
+
+BRANCHES: Dict[str, Dict[str, str]] = {
+    'game': {
+        'alias': 'p',
+        'item_column': 'p.game_id',
+        'source': """SELECT p.id, p.user_id, p.game_id, p.market_price, 'game' as item_type, g.title as item_name, g.logo_url as item_image, u.email as seller_email, p.listed_at
+            FROM t_p84121358_steam_clone_dark.purchases p
+            JOIN t_p84121358_steam_clone_dark.games g ON p.game_id = g.id
+            JOIN t_p84121358_steam_clone_dark.users u ON p.user_id = u.id""",
+    },
+    'frame': {
+        'alias': 'uf',
+        'item_column': 'uf.frame_id',
+        'source': """SELECT uf.id, uf.user_id, uf.frame_id as game_id, uf.market_price, 'frame' as item_type, f.name as item_name, f.image_url as item_image, u.email as seller_email, uf.listed_at
+            FROM t_p84121358_steam_clone_dark.user_frames uf
+            JOIN t_p84121358_steam_clone_dark.frames f ON uf.frame_id = f.id
+            JOIN t_p84121358_steam_clone_dark.users u ON uf.user_id = u.id""",
+    },
+}
+
+
+def encode_cursor(value: Any, item_type: str, listing_id: int) -> str:
+    raw = json.dumps([str(value), item_type, listing_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str, int]:
+    value, item_type, listing_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if item_type not in BRANCHES:
+        raise ValueError('Unknown item type in cursor')
+    return str(value), item_type, int(listing_id)
+
+
+def _branch_query(item_type: str, column: str, direction: str, params: Dict[str, Any],
+                  cursor: Optional[Tuple[str, str, int]], limit: int) -> Tuple[str, List[Any]]:
+    branch = BRANCHES[item_type]
+    alias = branch['alias']
+    sort_column = f'{alias}.{column}'
+    conditions = [f'{alias}.is_on_market = TRUE']
+    args: List[Any] = []
+
+    if params.get('min_price'):
+        conditions.append(f'{alias}.market_price >= %s')
+        args.append(float(params['min_price']))
+    if params.get('max_price'):
+        conditions.append(f'{alias}.market_price <= %s')
+        args.append(float(params['max_price']))
+    if params.get('item_id'):
+        conditions.append(f"{branch['item_column']} = %s")
+        args.append(int(params['item_id']))
+
+    if cursor is not None:
+        value, cursor_type, cursor_id = cursor
+        op = '>' if direction == 'ASC' else '<'
+        if item_type == cursor_type:
+            conditions.append(f'({sort_column}, {alias}.id) {op} (%s, %s)')
+            args.extend([value, cursor_id])
+        elif (item_type > cursor_type) == (direction == 'ASC'):
+            conditions.append(f'{sort_column} {op}= %s')
+            args.append(value)
+        else:
+            conditions.append(f'{sort_column} {op} %s')
+            args.append(value)
+
+    query = f"""({branch['source']}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {sort_column} {direction}, {alias}.id {direction}
+            LIMIT %s)"""
+    args.append(limit)
+    return query, args
+
+
+def fetch_listings(cur: Any, params: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    '''
+    Each item type is read by its own index-ordered, LIMITed branch and the
+    two branches are merged on (sort column, item_type, id), which gives a
+    stable total order even though purchases and user_frames ids collide.
+    Raises ValueError on malformed filters or cursor.
+    '''
+    column, direction = SORTS.get(params.get('sort', 'recent'), SORTS['recent'])
+    limit = min(max(int(params.get('limit', DEFAULT_LISTINGS_LIMIT)), 1), MAX_LISTINGS_LIMIT)
+    cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+    item_types = [params['item_type']] if params.get('item_type') in BRANCHES else list(BRANCHES)
+
+    parts: List[str] = []
+    args: List[Any] = []
+    for item_type in item_types:
+        query, branch_args = _branch_query(item_type, column, direction, params, cursor, limit + 1)
+        parts.append(query)
+        args.extend(branch_args)
+
+    cur.execute(
+        f"""SELECT * FROM ({' UNION ALL '.join(parts)}) listings
+        ORDER BY {column} {direction}, item_type {direction}, id {direction}
+        LIMIT %s""",
+        args + [limit + 1]
+    )
+    rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[8] if column == 'listed_at' else last[3], last[4], last[0])
+
+    return [{
+        'id': l[0],
+        'user_id': l[1],
+        'game_id': l[2],
+        'market_price': l[3] if l[3] is not None else 0.0,
+        'item_type': l[4],
+        'item_name': l[5],
+        'item_image': l[6],
+        'seller_email': l[7],
+        'listed_at': l[8]
+    } for l in rows], next_cursor
+
+
+TRADE_TABLES: Dict[str, Tuple[str, str, str]] = {
+    'game': ('purchases', 'game_id', 'INSERT INTO t_p84121358_steam_clone_dark.purchases (user_id, game_id, price, purchased_at) SELECT b.id, l.item_id, l.market_price, NOW()'),
+    'frame': ('user_frames', 'frame_id', 'INSERT INTO t_p84121358_steam_clone_dark.user_frames (user_id, frame_id) SELECT b.id, l.item_id'),
+}
+
+
+def execute_trade(cur: Any, buyer_id: int, listing_id: int, item_type: str) -> Tuple[Optional[float], Optional[float]]:
+    '''
+    Run a whole market trade as one statement: lock the listing (skipping rows
+    another buyer already holds), lock both users rows in id order, debit the
+    buyer only if the balance covers the price, credit the seller and move the
+    item, then count the sale in the rollups. The id order keeps a trade and
+    its mirror (the seller buying from the buyer) from deadlocking. Returns (price, new buyer balance); price is None when the
+    listing is gone or already owned by the buyer, balance is None when
+    funds are insufficient.
+    '''
+    table, item_column, insert = TRADE_TABLES[item_type]
+    cur.execute(
+        f"""WITH listing AS (
+            SELECT t.id, t.user_id AS seller_id, t.{item_column} AS item_id, t.market_price
+            FROM t_p84121358_steam_clone_dark.{table} t
+            WHERE t.id = %(listing_id)s AND t.is_on_market = TRUE AND t.user_id <> %(buyer_id)s
+              AND NOT EXISTS (
+                SELECT 1 FROM t_p84121358_steam_clone_dark.{table} o
+                WHERE o.user_id = %(buyer_id)s AND o.{item_column} = t.{item_column}
+              )
+            FOR UPDATE OF t SKIP LOCKED
+        ),
+        parties AS (
+            SELECT u.id FROM t_p84121358_steam_clone_dark.users u, listing l
+            WHERE u.id IN (%(buyer_id)s, l.seller_id)
+            ORDER BY u.id
+            FOR UPDATE OF u
+        ),
+        buyer AS (
+            UPDATE t_p84121358_steam_clone_dark.users u SET balance = u.balance - l.market_price
+            FROM listing l
+            WHERE u.id = %(buyer_id)s AND u.balance >= l.market_price AND (SELECT count(*) FROM parties) > 0
+            RETURNING u.id, u.balance
+        ),
+        seller AS (
+            UPDATE t_p84121358_steam_clone_dark.users u SET balance = u.balance + l.market_price
+            FROM listing l, buyer b
+            WHERE u.id = l.seller_id
+            RETURNING u.id
+        ),
+        removed AS (
+            DELETE FROM t_p84121358_steam_clone_dark.{table} t
+            USING listing l, buyer b
+            WHERE t.id = l.id
+            RETURNING t.id
+        ),
+        added AS (
+            {insert}
+            FROM listing l, buyer b
+            RETURNING 1
+        )
+        SELECT (SELECT market_price FROM listing), (SELECT balance FROM buyer), (SELECT seller_id FROM listing), (SELECT item_id FROM listing)""",
+        {'listing_id': listing_id, 'buyer_id': buyer_id}
+    )
+    price, balance, seller_id, item_id = cur.fetchone()
+    if balance is not None:
+        record_sales(cur, f'market_{item_type}', [(item_id, price, seller_id)])
+    return (float(price) if price is not None else None), (float(balance) if balance is not None else None)
@@ -0,0 +1,75 @@
+'''
+Business: Throughput, memory and deduplication of chunked game build uploads
+Args: DATABASE_URL of a disposable database, --size-mb of the build, --chunk-mb, BUILD_STORE_* env vars
+      (a local store in a temporary directory unless BUILD_STORE is set)
+Returns: MB/s through the games handler, peak Python memory while handling one
+         chunk vs the build size, and the cost of re-submitting the same build
+Usage: DATABASE_URL=... python benchmarks/build_uploads.py --size-mb 64
+'''
+import argparse
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional
+
+from user_search import load_handler
+
+
+def call(handler: Callable, data: Dict[str, Any]) -> Dict[str, Any]:
+    response = handler({'httpMethod': 'POST', 'headers': {}, 'body': json.dumps(data)}, None)
+    if response['statusCode'] != 200:
+        raise SystemExit(f"{data['action']} returned {response['statusCode']}: {response['body']}")
+    return json.loads(response['body'])
+
+
+def upload(handler: Callable, build: bytes, chunk: int, content_hash: Optional[str] = None) -> Dict[str, Any]:
+    '''Upload build chunk by chunk; returns the final state plus timing and per-chunk memory peaks'''
+    started = time.perf_counter()
+    state = call(handler, {'action': 'start_upload', 'filename': 'bench.apk', 'size': len(build), 'content_hash': content_hash})
+    peak = 0
+    while state['status'] != 'complete':
+        offset = state['offset']
+        payload = base64.b64encode(build[offset:offset + chunk]).decode()
+        tracemalloc.start()
+        state = call(handler, {'action': 'upload_chunk', 'upload_id': state['upload_id'], 'offset': offset, 'data': payload})
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {**state, 'seconds': time.perf_counter() - started, 'peak_chunk_bytes': peak}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size-mb', type=int, default=64)
+    parser.add_argument('--chunk-mb', type=int, default=2)
+    args = parser.parse_args()
+
+    if 'BUILD_STORE' not in os.environ:
+        os.environ.update(BUILD_STORE='local', BUILD_STORE_DIR=tempfile.mkdtemp(), BUILD_STORE_URL='https://builds.example.com')
+    handler = load_handler('games')
+    block = 1024 * 1024
+    build = os.urandom(args.size_mb * block - 12345)
+    expected = hashlib.sha256(b''.join(hashlib.sha256(build[i:i + block]).digest() for i in range(0, len(build), block))).hexdigest()
+
+    first = upload(handler, build, args.chunk_mb * block)
+    again = upload(handler, build, block)
+    known = upload(handler, build, block, content_hash=first['content_hash'])
+    fractional = handler({'httpMethod': 'POST', 'headers': {}, 'body': json.dumps(
+        {'action': 'start_upload', 'filename': 'bench.apk', 'size': len(build) + 0.5})}, None)
+    print(json.dumps({
+        'build_mb': round(len(build) / block, 2),
+        'first_upload': {'seconds': round(first['seconds'], 3), 'mb_per_sec': round(len(build) / block / first['seconds'], 1),
+                         'peak_chunk_mb': round(first['peak_chunk_bytes'] / block, 2)},
+        'reupload_other_chunking': {'seconds': round(again['seconds'], 3), 'same_url': again['file_url'] == first['file_url']},
+        'resubmit_by_hash': {'seconds': round(known['seconds'], 4), 'same_url': known['file_url'] == first['file_url']},
+        'hash_matches_client': first['content_hash'] == expected,
+        'fractional_size_rejected': fractional['statusCode'] == 400,
+        'file_url': first['file_url'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
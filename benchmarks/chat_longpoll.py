@@ -0,0 +1,98 @@
+'''
+Business: Delivery latency check for friends action=wait_messages (LISTEN/NOTIFY)
+Args: DATABASE_URL of a disposable migrated database, --listeners, --rounds
+Returns: per-message wake-up latency and the empty-timeout behaviour
+Usage: DATABASE_URL=... python benchmarks/chat_longpoll.py --listeners 8
+'''
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from user_search import SCHEMA, load_handler
+
+import psycopg2
+
+
+def ensure_users(count: int) -> List[int]:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    ids = []
+    for i in range(count):
+        cur.execute(
+            f"""INSERT INTO {SCHEMA}.users (email, password, username) VALUES (%s, 'x', %s)
+            ON CONFLICT (email) DO UPDATE SET email = EXCLUDED.email RETURNING id""",
+            (f'chat{i}@example.com', f'chat{i}')
+        )
+        ids.append(cur.fetchone()[0])
+    conn.commit()
+    conn.close()
+    return ids
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listeners', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_SIZE', str(args.listeners + 2))
+    handler = load_handler('friends')
+    sender, *receivers = ensure_users(args.listeners + 1)
+
+    def last_id() -> int:
+        conn = psycopg2.connect(os.environ['DATABASE_URL'])
+        cur = conn.cursor()
+        cur.execute(f'SELECT COALESCE(MAX(id), 0) FROM {SCHEMA}.messages')
+        value = cur.fetchone()[0]
+        conn.close()
+        return value
+
+    started = time.perf_counter()
+    empty = handler({'httpMethod': 'GET', 'queryStringParameters': {'action': 'wait_messages', 'user_id': str(receivers[0]), 'since_id': '2147483646', 'timeout': '1'}}, None)
+    print(f'empty wait returned {empty["body"]} after {time.perf_counter() - started:.2f}s (timeout=1s)')
+
+    latencies: List[float] = []
+    for _ in range(args.rounds):
+        since = last_id()
+        woke: Dict[int, float] = {}
+
+        def listen(receiver: int) -> None:
+            result = handler({'httpMethod': 'GET', 'queryStringParameters': {
+                'action': 'wait_messages', 'user_id': str(receiver), 'friend_id': str(sender),
+                'since_id': str(since), 'timeout': '10'}}, None)
+            if json.loads(result['body']):
+                woke[receiver] = time.perf_counter()
+
+        threads = [threading.Thread(target=listen, args=(r,)) for r in receivers]
+        for t in threads:
+            t.start()
+        time.sleep(0.3)
+
+        sent_at: Dict[int, float] = {}
+        for receiver in receivers:
+            sent_at[receiver] = time.perf_counter()
+            handler({'httpMethod': 'POST', 'body': json.dumps({'action': 'send_message', 'sender_id': sender, 'receiver_id': receiver, 'message': 'ping'})}, None)
+        for t in threads:
+            t.join()
+        if len(woke) != len(receivers):
+            print(f'missed deliveries: {len(receivers) - len(woke)}', file=sys.stderr)
+            sys.exit(1)
+        latencies.extend((woke[r] - sent_at[r]) * 1000 for r in receivers)
+
+    latencies.sort()
+    print(f'listeners={args.listeners} rounds={args.rounds} deliveries={len(latencies)}')
+    print({
+        'p50_ms': round(latencies[len(latencies) // 2], 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        'max_ms': round(latencies[-1], 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+    })
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+'''
+Business: Benchmark of friend suggestions on a synthetic power-law friendship graph
+Args: DATABASE_URL of a disposable migrated database, --users, --edges-per-user,
+      --live-edges (added through the handler after the bulk load),
+      --batch-size (send live edges through add_friends in chunks instead),
+      --threads sending live edges concurrently
+Returns: add_friend and suggestions latency vs. a per-request self-join, failed
+         live adds, and a check of every incrementally maintained count against
+         a full recompute
+Usage: DATABASE_URL=... python benchmarks/friend_recommendations.py --users 20000
+'''
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Set, Tuple
+
+import psycopg2
+
+from user_search import SCHEMA, load_handler
+
+BACKFILL_SQL = f"""
+INSERT INTO {SCHEMA}.friend_suggestions (user_id, candidate_id, mutual_count)
+SELECT a.user_id, b.friend_id, COUNT(*)
+FROM {SCHEMA}.friendships a
+JOIN {SCHEMA}.friendships b ON b.user_id = a.friend_id
+WHERE b.friend_id <> a.user_id
+  AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.friendships e WHERE e.user_id = a.user_id AND e.friend_id = b.friend_id)
+GROUP BY a.user_id, b.friend_id
+"""
+
+MISMATCH_SQL = f"""
+WITH expected AS (
+    SELECT a.user_id, b.friend_id AS candidate_id, COUNT(*) AS mutual_count
+    FROM {SCHEMA}.friendships a
+    JOIN {SCHEMA}.friendships b ON b.user_id = a.friend_id
+    WHERE b.friend_id <> a.user_id
+      AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.friendships e WHERE e.user_id = a.user_id AND e.friend_id = b.friend_id)
+    GROUP BY a.user_id, b.friend_id
+),
+stored AS (
+    SELECT user_id, candidate_id, mutual_count FROM {SCHEMA}.friend_suggestions WHERE mutual_count > 0
+)
+SELECT COUNT(*) FROM ((SELECT * FROM expected EXCEPT SELECT * FROM stored) UNION ALL (SELECT * FROM stored EXCEPT SELECT * FROM expected)) diff
+"""
+
+SELF_JOIN_SQL = f"""
+SELECT b.friend_id, COUNT(*) AS mutual
+FROM {SCHEMA}.friendships a
+JOIN {SCHEMA}.friendships b ON b.user_id = a.friend_id
+WHERE a.user_id = %s AND b.friend_id <> a.user_id
+  AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.friendships e WHERE e.user_id = a.user_id AND e.friend_id = b.friend_id)
+GROUP BY b.friend_id
+ORDER BY mutual DESC
+LIMIT 10
+"""
+
+
+def power_law_edges(nodes: int, per_node: int, rng: random.Random) -> List[Tuple[int, int]]:
+    '''Barabasi-Albert preferential attachment over node indexes 0..nodes-1'''
+    edges: Set[Tuple[int, int]] = set()
+    targets: List[int] = list(range(per_node))
+    for node in range(per_node, nodes):
+        chosen = set()
+        while len(chosen) < per_node:
+            chosen.add(rng.choice(targets))
+        for other in chosen:
+            edges.add((min(node, other), max(node, other)))
+            targets.extend((node, other))
+    return sorted(edges)
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    samples = sorted(samples)
+    return {
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[max(int(len(samples) * 0.95) - 1, 0)], 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def timed(run: Callable[[Any], Any], items: List[Any]) -> Dict[str, float]:
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        run(item)
+        samples.append((time.perf_counter() - started) * 1000)
+    return percentiles(samples)
+
+
+def timed_concurrently(run: Callable[[Any], Dict[str, Any]], items: List[Any], threads: int) -> Tuple[Dict[str, float], int]:
+    '''Latency percentiles of run over items spread across threads, and how many calls failed'''
+    samples: List[float] = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def worker(chunk: List[Any]) -> None:
+        for item in chunk:
+            started = time.perf_counter()
+            try:
+                failed = run(item)['statusCode'] >= 500
+            except psycopg2.Error:
+                # Unhandled in the handler, so the function runtime would answer 500
+                failed = True
+            with lock:
+                samples.append((time.perf_counter() - started) * 1000)
+                failures[0] += failed
+
+    workers = [threading.Thread(target=worker, args=(items[i::threads],)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    return percentiles(samples), failures[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--edges-per-user', type=int, default=5)
+    parser.add_argument('--live-edges', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+    os.environ.setdefault('DB_POOL_SIZE', str(args.threads))
+
+    rng = random.Random(args.seed)
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM {SCHEMA}.friend_suggestions")
+    cur.execute(f"DELETE FROM {SCHEMA}.friendships")
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username)
+        SELECT 'graph' || i || '@example.com', 'x', 'graph' || i FROM generate_series(1, %s) i
+        ON CONFLICT (email) DO UPDATE SET username = EXCLUDED.username
+        RETURNING id""",
+        (args.users,)
+    )
+    ids = [r[0] for r in cur.fetchall()]
+    edges = [(ids[a], ids[b]) for a, b in power_law_edges(args.users, args.edges_per_user, rng)]
+    rng.shuffle(edges)
+    live, bulk = edges[:args.live_edges], edges[args.live_edges:]
+
+    buffer = io.StringIO()
+    for a, b in bulk:
+        buffer.write(f'{a}\t{b}\n{b}\t{a}\n')
+    buffer.seek(0)
+    cur.copy_expert(f'COPY {SCHEMA}.friendships (user_id, friend_id) FROM STDIN', buffer)
+    started = time.perf_counter()
+    cur.execute(BACKFILL_SQL)
+    backfill_s = time.perf_counter() - started
+    cur.execute(f'ANALYZE {SCHEMA}.friendships')
+    cur.execute(f'ANALYZE {SCHEMA}.friend_suggestions')
+    conn.commit()
+
+    handler = load_handler('friends')
+    if args.batch_size:
+        batches = [live[i:i + args.batch_size] for i in range(0, len(live), args.batch_size)]
+        add_latency, add_failures = timed_concurrently(lambda batch: handler({'httpMethod': 'POST', 'body': json.dumps(
+            {'action': 'add_friends', 'pairs': batch})}, None), batches, args.threads)
+    else:
+        add_latency, add_failures = timed_concurrently(lambda edge: handler({'httpMethod': 'POST', 'body': json.dumps(
+            {'action': 'add_friend', 'user_id': edge[0], 'friend_id': edge[1]})}, None), live, args.threads)
+
+    cur.execute(f'SELECT user_id, COUNT(*) FROM {SCHEMA}.friendships GROUP BY user_id ORDER BY 2 DESC')
+    degrees = cur.fetchall()
+    hubs = [u for u, _ in degrees[:20]]
+    regular = [u for u, _ in rng.sample(degrees, min(200, len(degrees)))]
+
+    def suggestions(user_id: int) -> None:
+        handler({'httpMethod': 'GET', 'queryStringParameters': {'action': 'suggestions', 'user_id': str(user_id)}}, None)
+
+    def self_join(user_id: int) -> None:
+        cur.execute(SELF_JOIN_SQL, (user_id,))
+        cur.fetchall()
+
+    cur.execute(MISMATCH_SQL)
+    mismatches = cur.fetchone()[0]
+
+    report = {
+        'users': args.users,
+        'friendships': len(edges),
+        'max_degree': degrees[0][1],
+        'median_degree': degrees[len(degrees) // 2][1],
+        'backfill_s': round(backfill_s, 2),
+        'batch_size': args.batch_size,
+        'threads': args.threads,
+        'add_friend': add_latency,
+        'add_friend_failures': add_failures,
+        'suggestions_hubs': timed(suggestions, hubs),
+        'suggestions_regular': timed(suggestions, regular),
+        'self_join_hubs': timed(self_join, hubs),
+        'self_join_regular': timed(self_join, regular),
+        'consistency_mismatches': mismatches,
+    }
+    conn.close()
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if mismatches or add_failures else 0)
+
+
+if __name__ == '__main__':
+    main()
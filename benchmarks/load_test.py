@@ -0,0 +1,338 @@
+'''
+Business: Concurrent load test that drives every handler(event, context) directly
+Args: DATABASE_URL of a disposable database, --migrate (apply db_migrations to an
+      empty database first), --scenarios, --concurrency, --duration, --warmup,
+      --users, --games, --output, --compare (baseline JSON), --threshold,
+      --min-delta-ms
+Returns: throughput and p50/p95/p99 latency per action, saved as JSON; with
+         --compare, per-action p95 deltas and exit code 1 on regressions
+Usage: DATABASE_URL=... python benchmarks/load_test.py --migrate --concurrency 8 \
+         --duration 30 --output before.json
+       DATABASE_URL=... python benchmarks/load_test.py --concurrency 8 \
+         --duration 30 --output after.json --compare before.json
+'''
+import argparse
+import base64
+import glob
+import gzip
+import json
+import os
+import platform
+import random
+import subprocess
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+
+from user_search import ROOT, SCHEMA, load_handler
+
+Step = Tuple[str, str, Callable[[random.Random, 'World', Dict[str, Any]], Dict[str, Any]], int]
+
+
+class World:
+    '''Ids of the seeded data the scenarios pick from'''
+
+    def __init__(self, users: List[int], games: List[int], purchases: List[Tuple[int, int]], pairs: List[Tuple[int, int]]) -> None:
+        self.users = users
+        self.games = games
+        self.purchases = purchases
+        self.pairs = pairs
+
+
+def get(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {'httpMethod': 'GET', 'headers': {'Accept-Encoding': 'gzip'},
+            'queryStringParameters': {k: str(v) for k, v in params.items()}}
+
+
+def post(body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'httpMethod': 'POST', 'headers': {}, 'body': json.dumps(body)}
+
+
+def browse_listings(rng: random.Random, world: World, state: Dict[str, Any]) -> Dict[str, Any]:
+    return get({'action': 'market_listings', 'sort': rng.choice(['recent', 'price_asc', 'price_desc']), 'limit': 20})
+
+
+def list_item(rng: random.Random, world: World, state: Dict[str, Any]) -> Dict[str, Any]:
+    purchase_id, user_id = rng.choice(world.purchases)
+    return post({'action': 'list_on_market', 'user_id': user_id, 'item_type': 'game',
+                 'item_id': purchase_id, 'price': rng.randint(1, 50)})
+
+
+def buy_item(rng: random.Random, world: World, state: Dict[str, Any]) -> Dict[str, Any]:
+    listings = state.get('listings') or [{'id': rng.choice(world.purchases)[0], 'item_type': 'game'}]
+    listing = rng.choice(listings)
+    return post({'action': 'buy_from_market', 'buyer_id': rng.choice(world.users),
+                 'listing_id': listing['id'], 'item_type': listing['item_type']})
+
+
+def send_message(rng: random.Random, world: World, state: Dict[str, Any]) -> Dict[str, Any]:
+    sender, receiver = rng.choice(world.pairs)
+    return post({'action': 'send_message', 'sender_id': sender, 'receiver_id': receiver,
+                 'message': f'load test {rng.random():.6f}'})
+
+
+def sync_messages(rng: random.Random, world: World, state: Dict[str, Any]) -> Dict[str, Any]:
+    user_id, friend_id = rng.choice(world.pairs)
+    since = state.setdefault('since', {}).get((user_id, friend_id), 0)
+    return get({'action': 'messages', 'user_id': user_id, 'friend_id': friend_id, 'since_id': since})
+
+
+SCENARIOS: Dict[str, List[Step]] = {
+    'catalog': [
+        ('games.catalog', 'games', lambda rng, w, s: get({'status': 'approved'}), 4),
+        ('games.catalog_page', 'games', lambda rng, w, s: get({'status': 'approved', 'limit': 50, 'fields': 'title,price,logo_url'}), 3),
+        ('games.all', 'games', lambda rng, w, s: get({'status': 'all', 'limit': 50}), 1),
+    ],
+    'profile': [
+        ('profile.get', 'profile', lambda rng, w, s: get({'user_id': rng.choice(w.users)}), 3),
+        ('profile.header', 'profile', lambda rng, w, s: get({'user_id': rng.choice(w.users), 'include': ''}), 1),
+    ],
+    'market': [
+        ('profile.market_listings', 'profile', browse_listings, 4),
+        ('profile.list_on_market', 'profile', list_item, 2),
+        ('profile.buy_from_market', 'profile', buy_item, 2),
+    ],
+    'chat': [
+        ('friends.send_message', 'friends', send_message, 1),
+        ('friends.messages_sync', 'friends', sync_messages, 4),
+    ],
+    'friends': [
+        ('friends.search', 'friends', lambda rng, w, s: get({'action': 'search', 'user_id': rng.choice(w.users), 'search': f'load{rng.randint(1, 99)}'}), 3),
+        ('friends.autocomplete', 'friends', lambda rng, w, s: get({'action': 'search', 'user_id': rng.choice(w.users), 'search': f'lo{rng.randint(0, 9)}', 'mode': 'autocomplete'}), 2),
+        ('friends.suggestions', 'friends', lambda rng, w, s: get({'action': 'suggestions', 'user_id': rng.choice(w.users)}), 1),
+    ],
+}
+
+
+def migrate(conn: Any) -> None:
+    cur = conn.cursor()
+    cur.execute(f'CREATE SCHEMA IF NOT EXISTS {SCHEMA}')
+    cur.execute(f'ALTER DATABASE {conn.info.dbname} SET search_path TO {SCHEMA}, public')
+    cur.execute(f'SET search_path TO {SCHEMA}, public')
+    for path in sorted(glob.glob(os.path.join(ROOT, 'db_migrations', 'V*.sql'))):
+        with open(path) as migration:
+            cur.execute(migration.read())
+    conn.commit()
+
+
+def seed(conn: Any, users: int, games: int) -> World:
+    cur = conn.cursor()
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username, display_name, balance)
+        SELECT 'load' || i || '@example.com', 'x', 'load' || i, 'Load ' || i, 1000000
+        FROM generate_series(1, %s) i
+        ON CONFLICT (email) DO UPDATE SET balance = 1000000
+        RETURNING id""",
+        (users,)
+    )
+    user_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(f"SELECT count(*) FROM {SCHEMA}.games WHERE title LIKE 'Load game %%'")
+    missing = games - cur.fetchone()[0]
+    if missing > 0:
+        cur.execute(
+            f"""INSERT INTO {SCHEMA}.games (title, description, category, age_rating, status, price, created_at)
+            SELECT 'Load game ' || i, repeat('Описание ', 20), (ARRAY['Action', 'RPG', 'Puzzle'])[1 + i %% 3], '12+',
+                   'approved', (i %% 60)::numeric, NOW() - i * INTERVAL '1 minute'
+            FROM generate_series(1, %s) i""",
+            (missing,)
+        )
+    cur.execute(f"SELECT id FROM {SCHEMA}.games WHERE title LIKE 'Load game %%'")
+    game_ids = [r[0] for r in cur.fetchall()]
+    rng = random.Random(18)
+    owned = [(u, g) for u in user_ids for g in rng.sample(game_ids, min(3, len(game_ids)))]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.purchases (user_id, game_id, price)
+        SELECT u, g, 10 FROM unnest(%s::int[], %s::int[]) AS o(u, g)
+        ON CONFLICT DO NOTHING""",
+        ([u for u, _ in owned], [g for _, g in owned])
+    )
+    pairs = [(user_ids[i], user_ids[(i + 1) % len(user_ids)]) for i in range(len(user_ids))]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.friendships (user_id, friend_id)
+        SELECT a, b FROM unnest(%s::int[], %s::int[]) AS e(a, b)
+        UNION ALL SELECT b, a FROM unnest(%s::int[], %s::int[]) AS e(a, b)
+        ON CONFLICT DO NOTHING""",
+        ([a for a, _ in pairs], [b for _, b in pairs], [a for a, _ in pairs], [b for _, b in pairs])
+    )
+    cur.execute(f'SELECT id, user_id FROM {SCHEMA}.purchases WHERE user_id = ANY(%s)', (user_ids,))
+    purchases = cur.fetchall()
+    cur.execute('ANALYZE')
+    conn.commit()
+    return World(user_ids, game_ids, purchases, pairs)
+
+
+def percentile(samples: List[float], q: float) -> float:
+    return samples[min(int(len(samples) * q), len(samples) - 1)]
+
+
+def summarize(samples: List[float], errors: int, rejected: int, seconds: float) -> Dict[str, Any]:
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'errors': errors,
+        'rejected': rejected,
+        'throughput_rps': round(len(samples) / seconds, 1),
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p95_ms': round(percentile(samples, 0.95), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'max_ms': round(samples[-1], 3),
+    }
+
+
+def run(handlers: Dict[str, Callable], world: World, steps: List[Step], concurrency: int,
+        warmup: float, duration: float) -> Tuple[Dict[str, List[float]], Dict[str, int], Dict[str, int]]:
+    '''Errors are exceptions and 5xx; rejected counts 4xx such as buying an already sold listing'''
+    latencies: Dict[str, List[float]] = {name: [] for name, _, _, _ in steps}
+    errors: Dict[str, int] = {name: 0 for name, _, _, _ in steps}
+    rejected: Dict[str, int] = {name: 0 for name, _, _, _ in steps}
+    lock = threading.Lock()
+    started = time.perf_counter()
+    record_from = started + warmup
+    stop_at = record_from + duration
+    weights = [weight for _, _, _, weight in steps]
+
+    def worker(seed_value: int) -> None:
+        rng = random.Random(seed_value)
+        state: Dict[str, Any] = {}
+        local: Dict[str, List[float]] = {name: [] for name in latencies}
+        local_errors: Dict[str, int] = {name: 0 for name in latencies}
+        local_rejected: Dict[str, int] = {name: 0 for name in latencies}
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            name, function, build, _ = rng.choices(steps, weights)[0]
+            event = build(rng, world, state)
+            began = time.perf_counter()
+            try:
+                response = handlers[function](event, None)
+                failed = response['statusCode'] >= 500
+            except Exception:
+                response, failed = None, True
+            elapsed = (time.perf_counter() - began) * 1000
+            if response is not None and response['statusCode'] == 200:
+                remember(name, event, response, state)
+            if began >= record_from:
+                local[name].append(elapsed)
+                local_errors[name] += failed
+                local_rejected[name] += response is not None and 400 <= response['statusCode'] < 500
+        with lock:
+            for name in latencies:
+                latencies[name].extend(local[name])
+                errors[name] += local_errors[name]
+                rejected[name] += local_rejected[name]
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, rejected
+
+
+def remember(name: str, event: Dict[str, Any], response: Dict[str, Any], state: Dict[str, Any]) -> None:
+    '''Feed responses back into the worker state so follow-up steps hit live data'''
+    if name not in ('profile.market_listings', 'friends.messages_sync'):
+        return
+    body = response['body']
+    if response.get('isBase64Encoded'):
+        body = gzip.decompress(base64.b64decode(body))
+    if name == 'profile.market_listings':
+        state['listings'] = json.loads(body)['listings']
+    else:
+        messages = json.loads(body)
+        if messages:
+            params = event['queryStringParameters']
+            state['since'][(int(params['user_id']), int(params['friend_id']))] = messages[-1]['id']
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> bool:
+    '''A regression needs both the relative threshold and min_delta_ms, so sub-millisecond cache hits don't flap'''
+    regressed = False
+    print(f"{'action':28} {'base p95':>10} {'new p95':>10} {'change':>8} {'base rps':>9} {'new rps':>9}")
+    for name, stats in sorted(report['actions'].items()):
+        base = baseline.get('actions', {}).get(name)
+        if not base:
+            print(f'{name:28} {"-":>10} {stats["p95_ms"]:>10} {"new":>8}')
+            continue
+        change = (stats['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        flag = ' REGRESSION' if change > threshold and stats['p95_ms'] - base['p95_ms'] > min_delta_ms else ''
+        regressed = regressed or bool(flag)
+        print(f"{name:28} {base['p95_ms']:>10} {stats['p95_ms']:>10} {change:>+8.1%} "
+              f"{base['throughput_rps']:>9} {stats['throughput_rps']:>9}{flag}")
+    return regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--migrate', action='store_true')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=300)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    parser.add_argument('--min-delta-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f'unknown scenarios: {", ".join(sorted(unknown))}')
+    os.environ.setdefault('DB_POOL_SIZE', str(args.concurrency))
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.migrate:
+        migrate(conn)
+    world = seed(conn, args.users, args.games)
+    conn.close()
+
+    steps = [step for name in scenarios for step in SCENARIOS[name]]
+    handlers = {function: load_handler(function) for function in sorted({step[1] for step in steps})}
+    latencies, errors, rejected = run(handlers, world, steps, args.concurrency, args.warmup, args.duration)
+
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'scenarios': scenarios,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'users': len(world.users),
+            'games': len(world.games),
+        },
+        'total': summarize(all_samples, sum(errors.values()), sum(rejected.values()), args.duration) if all_samples else {},
+        'actions': {name: summarize(samples, errors[name], rejected[name], args.duration)
+                    for name, samples in sorted(latencies.items()) if samples},
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as out:
+            out.write(text + '\n')
+    print(text)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare(report, baseline, args.threshold, args.min_delta_ms):
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+'''
+Business: Concurrency benchmark for profile action=buy_from_market
+Args: DATABASE_URL of a disposable migrated database, --buyers N, --listings M,
+      --cross-pairs P users buying each other's listings at the same time
+Returns: trades/sec plus integrity checks (no double-sells, money conserved,
+         no failed cross-buys, e.g. deadlocks between a buyer and a seller)
+Usage: DATABASE_URL=... python benchmarks/market_trades.py --buyers 16 --listings 500 --cross-pairs 8
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+
+from user_search import SCHEMA, load_handler
+
+
+def seed(buyers: int, listings: int) -> Dict[str, List[int]]:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f"DELETE FROM {SCHEMA}.user_frames WHERE user_id IN (SELECT id FROM {SCHEMA}.users WHERE email LIKE 'trade%%')")
+    cur.execute(f"DELETE FROM {SCHEMA}.purchases WHERE user_id IN (SELECT id FROM {SCHEMA}.users WHERE email LIKE 'trade%%')")
+    cur.execute(f"DELETE FROM {SCHEMA}.users WHERE email LIKE 'trade%%'")
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.frames (name, image_url, price)
+        SELECT 'bench frame ' || i, 'https://example.com/f.png', 1 FROM generate_series(1, %s) i
+        RETURNING id""",
+        (listings,)
+    )
+    frame_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username, balance)
+        SELECT 'trade-seller' || i || '@example.com', 'x', 'seller' || i, 0 FROM generate_series(1, %s) i
+        RETURNING id""",
+        (max(listings // 10, 1),)
+    )
+    seller_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username, balance)
+        SELECT 'trade-buyer' || i || '@example.com', 'x', 'buyer' || i, 100000 FROM generate_series(1, %s) i
+        RETURNING id""",
+        (buyers,)
+    )
+    buyer_ids = [r[0] for r in cur.fetchall()]
+    listing_ids = []
+    for i, frame_id in enumerate(frame_ids):
+        cur.execute(
+            f"""INSERT INTO {SCHEMA}.user_frames (user_id, frame_id, is_on_market, market_price)
+            VALUES (%s, %s, TRUE, %s) RETURNING id""",
+            (seller_ids[i % len(seller_ids)], frame_id, 5 + i % 20)
+        )
+        listing_ids.append(cur.fetchone()[0])
+    conn.commit()
+    conn.close()
+    return {'buyers': buyer_ids, 'sellers': seller_ids, 'listings': listing_ids, 'frames': frame_ids}
+
+
+def seed_cross(pairs: int, per_user: int) -> List[Tuple[int, List[int]]]:
+    '''Pairs of users who each list per_user frames; returns (user, partner's listings) for both sides'''
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username, balance)
+        SELECT 'trade-cross' || i || '@example.com', 'x', 'cross' || i, 100000 FROM generate_series(1, %s) i
+        RETURNING id""",
+        (pairs * 2,)
+    )
+    user_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.frames (name, image_url, price)
+        SELECT 'bench cross frame ' || i, 'https://example.com/f.png', 1 FROM generate_series(1, %s) i
+        RETURNING id""",
+        (pairs * 2 * per_user,)
+    )
+    frame_ids = [r[0] for r in cur.fetchall()]
+    listings: Dict[int, List[int]] = {u: [] for u in user_ids}
+    for i, frame_id in enumerate(frame_ids):
+        owner = user_ids[i % len(user_ids)]
+        cur.execute(
+            f"""INSERT INTO {SCHEMA}.user_frames (user_id, frame_id, is_on_market, market_price)
+            VALUES (%s, %s, TRUE, %s) RETURNING id""",
+            (owner, frame_id, 5 + i % 20)
+        )
+        listings[owner].append(cur.fetchone()[0])
+    conn.commit()
+    conn.close()
+    sides = []
+    for a, b in zip(user_ids[::2], user_ids[1::2]):
+        sides.append((a, listings[b]))
+        sides.append((b, listings[a]))
+    return sides
+
+
+def cross_buy(handler: Callable, pairs: int, per_user: int) -> Dict[str, Any]:
+    '''
+    Each user of a pair buys the other's listings while the other buys theirs,
+    so every trade locks the same two users rows as its mirror trade.
+    '''
+    sides = seed_cross(pairs, per_user)
+    everyone = [user for user, _ in sides]
+    money_before = total_balance(everyone)
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def trader(buyer_id: int, listing_ids: List[int]) -> None:
+        for listing_id in listing_ids:
+            try:
+                status = handler({'httpMethod': 'POST', 'body': json.dumps({
+                    'action': 'buy_from_market', 'buyer_id': buyer_id,
+                    'listing_id': listing_id, 'item_type': 'frame'})}, None)['statusCode']
+            except psycopg2.Error:
+                # Unhandled in the handler, so the function runtime would answer 500
+                status = 500
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=trader, args=side) for side in sides]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'pairs': pairs,
+        'attempts': sum(statuses.values()),
+        'statuses': statuses,
+        'trades_per_sec': round(statuses.get(200, 0) / elapsed, 1),
+        'money_conserved': abs(total_balance(everyone) - money_before) < 1e-6,
+    }
+
+
+def total_balance(user_ids: List[int]) -> float:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f'SELECT COALESCE(SUM(balance), 0) FROM {SCHEMA}.users WHERE id = ANY(%s)', (user_ids,))
+    value = float(cur.fetchone()[0])
+    conn.close()
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buyers', type=int, default=16)
+    parser.add_argument('--listings', type=int, default=500)
+    parser.add_argument('--cross-pairs', type=int, default=8)
+    parser.add_argument('--cross-listings', type=int, default=25)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DB_POOL_SIZE', str(max(args.buyers, args.cross_pairs * 2)))
+    handler = load_handler('profile')
+    data = seed(args.buyers, args.listings)
+    everyone = data['buyers'] + data['sellers']
+    money_before = total_balance(everyone)
+
+    wins: Dict[int, List[int]] = {b: [] for b in data['buyers']}
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def buyer(buyer_id: int) -> None:
+        rng = random.Random(buyer_id)
+        pending = list(data['listings'])
+        rng.shuffle(pending)
+        for listing_id in pending:
+            response = handler({'httpMethod': 'POST', 'body': json.dumps({
+                'action': 'buy_from_market', 'buyer_id': buyer_id,
+                'listing_id': listing_id, 'item_type': 'frame'})}, None)
+            with lock:
+                statuses[response['statusCode']] = statuses.get(response['statusCode'], 0) + 1
+            if response['statusCode'] == 200:
+                wins[buyer_id].append(listing_id)
+
+    threads = [threading.Thread(target=buyer, args=(b,)) for b in data['buyers']]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    sold = [l for won in wins.values() for l in won]
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f'SELECT count(*) FROM {SCHEMA}.user_frames WHERE frame_id = ANY(%s)', (data['frames'],))
+    frame_rows = cur.fetchone()[0]
+    cur.execute(f'SELECT count(*) FROM {SCHEMA}.user_frames WHERE frame_id = ANY(%s) AND is_on_market', (data['frames'],))
+    still_listed = cur.fetchone()[0]
+    conn.close()
+
+    report = {
+        'buyers': args.buyers,
+        'listings': args.listings,
+        'attempts': sum(statuses.values()),
+        'statuses': statuses,
+        'trades': len(sold),
+        'trades_per_sec': round(len(sold) / elapsed, 1),
+        'attempts_per_sec': round(sum(statuses.values()) / elapsed, 1),
+        'double_sells': len(sold) - len(set(sold)),
+        'frame_rows': frame_rows,
+        'still_listed': still_listed,
+        'money_conserved': abs(total_balance(everyone) - money_before) < 1e-6,
+    }
+    cross = report['cross_buy'] = cross_buy(handler, args.cross_pairs, args.cross_listings)
+    print(json.dumps(report, indent=2))
+    ok = report['double_sells'] == 0 and report['trades'] == args.listings and frame_rows == args.listings and report['money_conserved']
+    ok = ok and cross['statuses'] == {200: cross['attempts']} and cross['money_conserved']
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Business: Parse/plan savings of db.statement() prepared statements on the profile and catalog paths
+Args: DATABASE_URL of a disposable database, --requests per path, --users, --games
+Returns: handler latency with DB_PREPARE_STATEMENTS on and off, and Postgres
+         planning time for the plain SQL vs EXECUTE of the prepared statement
+Usage: DATABASE_URL=... python benchmarks/prepared_statements.py --requests 2000
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+from load_test import World, seed
+from user_search import load_handler
+
+PATHS: Dict[str, Callable[[random.Random, World], Dict[str, Any]]] = {
+    'profile': lambda rng, w: {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {'user_id': str(rng.choice(w.users))}},
+    'catalog_page': lambda rng, w: {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {'status': 'all', 'limit': '50'}},
+    'purchase_balance_check': lambda rng, w: {'httpMethod': 'POST', 'headers': {}, 'body': json.dumps(
+        {'action': 'purchase', 'user_id': rng.choice(w.users), 'game_id': rng.choice(w.games)})},
+}
+HANDLERS = {'profile': 'profile', 'catalog_page': 'games', 'purchase_balance_check': 'profile'}
+
+
+def timed(handler: Callable, build: Callable, world: World, requests: int) -> Dict[str, float]:
+    rng = random.Random(20)
+    samples: List[float] = []
+    for _ in range(requests):
+        event = build(rng, world)
+        started = time.perf_counter()
+        handler(event, None)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95)], 3),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+    }
+
+
+def planning_ms(cur: Any, sql: str, args: tuple) -> float:
+    cur.execute('EXPLAIN (ANALYZE, SUMMARY, FORMAT JSON) ' + sql, args)
+    return cur.fetchone()[0][0]['Planning Time']
+
+
+def planning(conn: Any, db: Any, world: World) -> Dict[str, Dict[str, float]]:
+    '''Planning Time reported by Postgres for the same statement, plain vs prepared (after 6 runs, past the custom-plan phase)'''
+    cur = conn.cursor()
+    report = {}
+    for name, stmt in sorted(db._statements.items()):
+        if stmt.params > 1 or 'FOR UPDATE' in stmt.sql:
+            continue
+        args = (world.users[0],) if stmt.params else ()
+        plain = min(planning_ms(cur, stmt.sql, args) for _ in range(5))
+        cur.execute(stmt.prepare_sql)
+        for _ in range(6):
+            cur.execute(stmt.execute_sql, args)
+        prepared = min(planning_ms(cur, stmt.execute_sql, args) for _ in range(5))
+        cur.execute(f'DEALLOCATE {stmt.name}')
+        report[name] = {'plain_planning_ms': round(plain, 4), 'prepared_planning_ms': round(prepared, 4)}
+    conn.rollback()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=300)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    world = seed(conn, args.users, args.games)
+    handlers = {function: load_handler(function) for function in set(HANDLERS.values())}
+    db = sys.modules['db']
+
+    report: Dict[str, Any] = {'requests': args.requests}
+    for path, build in PATHS.items():
+        handler = handlers[HANDLERS[path]]
+        results = {}
+        # Two rounds each, keeping the second, so warm-up and cache effects don't favour either side
+        for enabled in (False, True, False, True):
+            db.PREPARE_STATEMENTS = enabled
+            results['prepared' if enabled else 'plain'] = timed(handler, build, world, args.requests)
+        report[path] = results
+    report['planning'] = planning(conn, db, world)
+    report['pool'] = db.stats()
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
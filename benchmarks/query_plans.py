@@ -0,0 +1,437 @@
+'''
+Business: Query plan regression suite for every SQL statement the handlers issue
+Args: DATABASE_URL of a disposable database, --migrate (apply db_migrations to an
+      empty database first), --users, --games (seeded scale), --verbose, --output
+Returns: per-statement plan summary; exit code 1 when a hot statement plans a
+         sequential scan on one of the scaled tables
+Usage: DATABASE_URL=... python benchmarks/query_plans.py --migrate --users 20000
+'''
+import argparse
+import base64
+import glob
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import psycopg2
+
+from load_test import migrate
+from user_search import ROOT, SCHEMA, load_handler
+
+SCALED_TABLES = {'users', 'games', 'purchases', 'user_frames', 'friendships', 'messages', 'friend_suggestions',
+                 'sales_hourly', 'sales_daily_items', 'sales_daily_sellers', 'game_trending'}
+SALES_HISTORY_DAYS = 730
+SHARED_MODULES = {'cache.py', 'db.py', 'response.py', 'router.py', 'sales.py', 'session.py', 'trending.py'}
+NOT_HANDLER_SQL = {'db.py', 'router.py'}
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+Probe = Tuple[str, str, Callable[[Dict[str, Any]], Dict[str, Any]], bool]
+
+
+def get(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {'httpMethod': 'GET', 'headers': {}, 'queryStringParameters': {k: str(v) for k, v in params.items()}}
+
+
+def body(method: str, data: Dict[str, Any], params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {'httpMethod': method, 'headers': {}, 'body': json.dumps(data), 'queryStringParameters': params or {}}
+
+
+# (label, function, event builder, hot). Hot statements must not seq scan a scaled
+# table; the rest (unpaginated lists, cached facet counts, ILIKE search, exports,
+# year-long dashboards, the scheduled trending rescore) are reported only.
+PROBES: List[Probe] = [
+    ('catalog page', 'games', lambda ids: get({'status': 'approved', 'limit': 50}), True),
+    ('catalog next page', 'games', lambda ids: get({'status': 'approved', 'limit': 50, 'cursor': ids['catalog_cursor']}), True),
+    ('catalog popular', 'games', lambda ids: get({'status': 'popular', 'limit': 50}), True),
+    ('catalog category page', 'games', lambda ids: get({'status': 'approved', 'category': 'Puzzle', 'limit': 50}), True),
+    ('catalog filtered page', 'games', lambda ids: get({'status': 'approved', 'category': 'Puzzle', 'age_rating': '12+', 'min_price': 5, 'max_price': 40, 'limit': 50}), True),
+    ('catalog facets', 'games', lambda ids: get({'action': 'facets', 'category': 'Puzzle', 'max_price': 40}), False),
+    ('moderation queue', 'games', lambda ids: get({'status': 'pending', 'limit': 50}), True),
+    ('catalog all page', 'games', lambda ids: get({'status': 'all', 'limit': 50}), True),
+    ('catalog unpaginated', 'games', lambda ids: get({'status': 'approved'}), False),
+    ('submit game', 'games', lambda ids: body('POST', {'title': 'Plan probe', 'price': 1}), True),
+    ('start upload', 'games', lambda ids: body('POST', {'action': 'start_upload', 'filename': 'plan.apk', 'size': 3, 'content_hash': '0' * 64}), True),
+    ('upload status', 'games', lambda ids: get({'action': 'upload_status', 'upload_id': ids['upload']}), True),
+    ('upload chunk', 'games', lambda ids: body('POST', {'action': 'upload_chunk', 'upload_id': ids['upload'], 'offset': 0, 'data': 'cGxu'}), True),
+    ('submit uploaded build', 'games', lambda ids: body('POST', {'title': 'Plan probe', 'upload_id': ids['upload']}), True),
+    ('moderate game', 'games', lambda ids: body('PUT', {'id': ids['game'], 'status': 'approved'}), True),
+    ('refund game', 'games', lambda ids: body('DELETE', {'user_id': ids['refund_user'], 'game_id': ids['refund_game']}), True),
+    ('delete game', 'games', lambda ids: body('DELETE', {}, {'id': ids['spare_game']}), True),
+    ('profile', 'profile', lambda ids: get({'user_id': ids['user']}), True),
+    ('signed session', 'profile', lambda ids: {**get({'user_id': ids['user'], 'include': ''}), 'headers': {'Authorization': f"Bearer {ids['token']}"}}, True),
+    ('profile header', 'profile', lambda ids: get({'user_id': ids['user'], 'include': ''}), True),
+    ('update profile', 'profile', lambda ids: body('PUT', {'user_id': ids['user'], 'username': f"plan_user{ids['user']}"}), True),
+    ('frame shop', 'profile', lambda ids: body('POST', {'action': 'get_frames'}), True),
+    ('user frames', 'profile', lambda ids: body('POST', {'action': 'get_user_frames', 'user_id': ids['user']}), True),
+    ('purchase frame', 'profile', lambda ids: body('POST', {'action': 'purchase_frame', 'user_id': ids['user'], 'frame_id': ids['frame']}), True),
+    ('create frame', 'profile', lambda ids: body('POST', {'action': 'create_frame', 'name': 'Plan probe', 'image_url': 'https://cdn.example.com/probe.png'}), True),
+    ('update frame price', 'profile', lambda ids: body('POST', {'action': 'update_frame_price', 'frame_id': ids['frame'], 'price': 3}), True),
+    ('delete frame', 'profile', lambda ids: body('POST', {'action': 'delete_frame', 'frame_id': ids['spare_frame']}), True),
+    ('set active frame', 'profile', lambda ids: body('POST', {'action': 'set_active_frame', 'user_id': ids['user'], 'frame_id': ids['frame']}), True),
+    ('market recent', 'profile', lambda ids: get({'action': 'market_listings', 'sort': 'recent', 'limit': 20}), True),
+    ('market cheapest', 'profile', lambda ids: get({'action': 'market_listings', 'sort': 'price_asc', 'limit': 20}), True),
+    ('market by game', 'profile', lambda ids: get({'action': 'market_listings', 'item_type': 'game', 'item_id': ids['game'], 'sort': 'price_asc'}), True),
+    ('list game', 'profile', lambda ids: body('POST', {'action': 'list_on_market', 'user_id': ids['seller'], 'item_type': 'game', 'item_id': ids['seller_purchase'], 'price': 5}), True),
+    ('list frame', 'profile', lambda ids: body('POST', {'action': 'list_on_market', 'user_id': ids['user'], 'item_type': 'frame', 'item_id': ids['user_frame'], 'price': 5}), True),
+    ('unlist frame', 'profile', lambda ids: body('POST', {'action': 'remove_from_market', 'user_id': ids['user'], 'item_type': 'frame', 'item_id': ids['user_frame']}), True),
+    ('buy listing', 'profile', lambda ids: body('POST', {'action': 'buy_from_market', 'buyer_id': ids['user'], 'listing_id': ids['seller_purchase'], 'item_type': 'game'}), True),
+    ('unlist game', 'profile', lambda ids: body('POST', {'action': 'remove_from_market', 'user_id': ids['seller'], 'item_type': 'game', 'item_id': ids['seller_purchase']}), True),
+    ('purchase game', 'profile', lambda ids: body('POST', {'action': 'purchase', 'user_id': ids['user'], 'game_id': ids['game']}), True),
+    ('checkout', 'profile', lambda ids: body('POST', {'action': 'checkout', 'user_id': ids['user'], 'game_ids': ids['cart']}), True),
+    ('friends', 'friends', lambda ids: get({'action': 'friends', 'user_id': ids['user']}), True),
+    ('user search', 'friends', lambda ids: get({'action': 'search', 'user_id': ids['user'], 'search': 'plan_user12', 'limit': 20}), True),
+    ('autocomplete', 'friends', lambda ids: get({'action': 'search', 'user_id': ids['user'], 'search': 'plan_user3', 'mode': 'autocomplete'}), True),
+    ('conversation', 'friends', lambda ids: get({'action': 'messages', 'user_id': ids['user'], 'friend_id': ids['friend']}), True),
+    ('conversation since', 'friends', lambda ids: get({'action': 'messages', 'user_id': ids['user'], 'friend_id': ids['friend'], 'since_id': 1}), True),
+    ('conversation history', 'friends', lambda ids: get({'action': 'messages', 'user_id': ids['user'], 'friend_id': ids['friend'], 'limit': 50}), True),
+    ('inbox poll', 'friends', lambda ids: get({'action': 'wait_messages', 'user_id': ids['user'], 'since_id': ids['last_message'], 'timeout': 0}), True),
+    ('first inbox poll', 'friends', lambda ids: get({'action': 'wait_messages', 'user_id': ids['user'], 'timeout': 0}), True),
+    ('conversation poll', 'friends', lambda ids: get({'action': 'wait_messages', 'user_id': ids['user'], 'friend_id': ids['friend'], 'since_id': ids['last_message'], 'timeout': 0}), True),
+    ('suggestions', 'friends', lambda ids: get({'action': 'suggestions', 'user_id': ids['user']}), True),
+    ('add friend', 'friends', lambda ids: body('POST', {'action': 'add_friend', 'user_id': ids['user'], 'friend_id': ids['stranger']}), True),
+    ('add friends batch', 'friends', lambda ids: body('POST', {'action': 'add_friends', 'pairs': [[ids['friend'], ids['stranger']]]}), True),
+    ('send message', 'friends', lambda ids: body('POST', {'action': 'send_message', 'sender_id': ids['user'], 'receiver_id': ids['friend'], 'message': 'plan probe'}), True),
+    ('register', 'auth', lambda ids: body('POST', {'action': 'register', 'email': f'plan-probe-{time.time_ns()}@example.com', 'password': 'probe'}), True),
+    ('login', 'auth', lambda ids: body('POST', {'action': 'login', 'email': 'plan1@example.com', 'password': 'probe'}), True),
+    ('admin users', 'admin', lambda ids: get({'action': 'users'}), False),
+    ('admin user search', 'admin', lambda ids: get({'action': 'users', 'search': 'plan_user12'}), False),
+    ('admin export users', 'admin', lambda ids: get({'action': 'export', 'entity': 'users', 'created_from': '2024-01-01'}), False),
+    ('admin export users page', 'admin', lambda ids: get({'action': 'export', 'entity': 'users', 'after': ids['user']}), False),
+    ('admin export purchases', 'admin', lambda ids: get({'action': 'export', 'entity': 'purchases'}), False),
+    ('admin export listings', 'admin', lambda ids: get({'action': 'export', 'entity': 'market_listings', 'format': 'ndjson'}), False),
+    ('sales dashboard', 'admin', lambda ids: get({'action': 'sales_stats'}), True),
+    ('sales dashboard hourly', 'admin', lambda ids: get({'action': 'sales_stats', 'bucket': 'hour', 'from': '2024-06-01', 'to': '2024-06-07'}), True),
+    ('sales dashboard yearly', 'admin', lambda ids: get({'action': 'sales_stats', 'bucket': 'month', 'from': '2024-01-01', 'to': '2024-12-31'}), False),
+    ('refresh trending', 'admin', lambda ids: body('PUT', {'action': 'refresh_trending'}), False),
+    ('ban', 'admin', lambda ids: body('PUT', {'action': 'ban', 'user_id': ids['stranger']}), True),
+    ('unban', 'admin', lambda ids: body('PUT', {'action': 'unban', 'user_id': ids['stranger']}), True),
+    ('bulk ban', 'admin', lambda ids: body('PUT', {'action': 'bulk_ban', 'user_ids': [ids['stranger'], ids['friend']]}), True),
+    ('bulk unban', 'admin', lambda ids: body('PUT', {'action': 'bulk_unban', 'user_ids': [ids['stranger'], ids['friend']]}), True),
+    ('bulk update balance', 'admin', lambda ids: body('PUT', {'action': 'bulk_update_balance', 'balances': {ids['user']: 1000000, ids['friend']: 1000000}}), True),
+    ('bulk toggle verified', 'admin', lambda ids: body('PUT', {'action': 'bulk_toggle_verified', 'user_ids': [ids['stranger']]}), True),
+    ('bulk toggle checkmark', 'admin', lambda ids: body('PUT', {'action': 'bulk_toggle_checkmark', 'user_ids': [ids['stranger']]}), True),
+    ('bulk update game price', 'admin', lambda ids: body('PUT', {'action': 'bulk_update_game_price', 'prices': {ids['game']: 10}}), True),
+    ('bulk toggle popular', 'admin', lambda ids: body('PUT', {'action': 'bulk_toggle_popular', 'game_ids': ids['cart'], 'is_popular': False}), True),
+    ('update balance', 'admin', lambda ids: body('PUT', {'action': 'update_balance', 'user_id': ids['user'], 'balance': 1000000}), True),
+    ('update game price', 'admin', lambda ids: body('PUT', {'action': 'update_game_price', 'game_id': ids['game'], 'price': 10}), True),
+    ('toggle popular', 'admin', lambda ids: body('PUT', {'action': 'toggle_popular', 'game_id': ids['game'], 'is_popular': False}), True),
+    ('toggle verified', 'admin', lambda ids: body('PUT', {'action': 'toggle_verified', 'user_id': ids['stranger']}), True),
+    ('toggle checkmark', 'admin', lambda ids: body('PUT', {'action': 'toggle_checkmark', 'user_id': ids['stranger']}), True),
+]
+
+
+def seed(conn: Any, users: int, games: int) -> None:
+    '''Scale the tables the hot queries touch; skipped when already seeded to this size'''
+    cur = conn.cursor()
+    cur.execute(f"SELECT count(*) FROM {SCHEMA}.users WHERE email LIKE 'plan%%@example.com'")
+    if cur.fetchone()[0] >= users:
+        return
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username, display_name, balance, created_at)
+        SELECT 'plan' || i || '@example.com', 'probe', 'plan_user' || i, 'Plan User ' || i, 1000000,
+               TIMESTAMP '2024-01-01' + i * INTERVAL '1 minute'
+        FROM generate_series(1, %s) i
+        ON CONFLICT (email) DO NOTHING""",
+        (users,)
+    )
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.games (title, description, category, age_rating, status, price, is_popular, created_at)
+        SELECT 'Plan game ' || i, 'Plan game description', (ARRAY['Action', 'Puzzle', 'RPG', 'Strategy'])[1 + i %% 4],
+               (ARRAY['0+', '6+', '12+', '16+', '18+'])[1 + i %% 5],
+               CASE WHEN i %% 20 = 0 THEN 'rejected' WHEN i %% 7 = 0 THEN 'pending' ELSE 'approved' END,
+               (i %% 60)::numeric, i %% 50 = 0, TIMESTAMP '2024-01-01' + i * INTERVAL '1 hour'
+        FROM generate_series(1, %s) i""",
+        (games,)
+    )
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.frames (name, image_url, price)
+        SELECT 'Plan frame ' || i, 'https://cdn.example.com/frames/' || i || '.png', i
+        FROM generate_series(1, 20) i"""
+    )
+    cur.execute(f"SELECT id FROM {SCHEMA}.users WHERE email LIKE 'plan%%@example.com' ORDER BY id")
+    user_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(f"SELECT id FROM {SCHEMA}.games WHERE title LIKE 'Plan game %%' ORDER BY id")
+    game_ids = [r[0] for r in cur.fetchall()]
+    cur.execute(f"SELECT id FROM {SCHEMA}.frames WHERE name LIKE 'Plan frame %%' ORDER BY id")
+    frame_ids = [r[0] for r in cur.fetchall()]
+
+    rng = random.Random(19)
+    owned = [(u, g) for u in user_ids for g in rng.sample(game_ids, 5)]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.purchases (user_id, game_id, price, is_on_market, market_price)
+        SELECT u, g, 10, random() < 0.1, 1 + floor(random() * 50)
+        FROM unnest(%s::int[], %s::int[]) AS o(u, g)
+        ON CONFLICT DO NOTHING""",
+        ([u for u, _ in owned], [g for _, g in owned])
+    )
+    framed = [(u, f) for u in user_ids for f in rng.sample(frame_ids, 2)]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.user_frames (user_id, frame_id, is_on_market, market_price)
+        SELECT u, f, random() < 0.05, 1 + floor(random() * 50)
+        FROM unnest(%s::int[], %s::int[]) AS o(u, f)
+        ON CONFLICT DO NOTHING""",
+        ([u for u, _ in framed], [f for _, f in framed])
+    )
+    position = {user_id: i for i, user_id in enumerate(user_ids)}
+    edges = [(user_ids[i], user_ids[(i + step) % len(user_ids)]) for i in range(len(user_ids)) for step in (1, 2, 3, 5, 8)]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.friendships (user_id, friend_id)
+        SELECT a, b FROM unnest(%s::int[], %s::int[]) AS e(a, b)
+        UNION ALL SELECT b, a FROM unnest(%s::int[], %s::int[]) AS e(a, b)
+        ON CONFLICT DO NOTHING""",
+        ([a for a, _ in edges], [b for _, b in edges], [a for a, _ in edges], [b for _, b in edges])
+    )
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.friend_suggestions (user_id, candidate_id, mutual_count)
+        SELECT a, b, 1 + (a + b) %% 5 FROM unnest(%s::int[], %s::int[]) AS e(a, b)
+        ON CONFLICT DO NOTHING""",
+        ([a for a, _ in edges], [user_ids[(position[b] + 13) % len(user_ids)] for _, b in edges])
+    )
+    chats = [rng.choice(edges) for _ in range(users * 10)]
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.messages (sender_id, receiver_id, message)
+        SELECT s, r, 'plan message' FROM unnest(%s::int[], %s::int[]) AS m(s, r)""",
+        ([s for s, _ in chats], [r for _, r in chats])
+    )
+    conn.commit()
+    cur.execute('ANALYZE')
+    conn.commit()
+
+
+def seed_sales(conn: Any) -> None:
+    '''Two years of rollup history, ending before the probes' default 30-day window'''
+    cur = conn.cursor()
+    cur.execute(f"SELECT count(*) FROM {SCHEMA}.sales_hourly WHERE bucket < '2025-01-01'")
+    if cur.fetchone()[0]:
+        return
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.sales_hourly (bucket, kind, sales, amount)
+        SELECT TIMESTAMP '2023-01-01' + h * INTERVAL '1 hour', k, 1 + h %% 7, 10 * (1 + h %% 7)
+        FROM generate_series(0, %s * 24 - 1) h, unnest(ARRAY['game', 'frame', 'market_game', 'market_frame', 'refund']) k""",
+        (SALES_HISTORY_DAYS,)
+    )
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.sales_daily_items (day, kind, item_id, sales, amount)
+        SELECT DATE '2023-01-01' + d, k, g, 1, 10
+        FROM generate_series(0, %s - 1) d, unnest(ARRAY['game', 'refund']) k, generate_series(1, 300) g""",
+        (SALES_HISTORY_DAYS,)
+    )
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.sales_daily_sellers (day, seller_id, sales, amount)
+        SELECT DATE '2023-01-01' + d, u, 1, 10
+        FROM generate_series(0, %s - 1) d, generate_series(1, 300) u""",
+        (SALES_HISTORY_DAYS,)
+    )
+    conn.commit()
+    cur.execute('ANALYZE')
+    conn.commit()
+
+
+def seed_trending(conn: Any) -> None:
+    '''A trending score for every game, as the scheduled refresh leaves it; the refresh probe clears most of them again'''
+    cur = conn.cursor()
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.game_trending (game_id, score)
+        SELECT id, (id * 7919 % 1000) / 10.0 FROM {SCHEMA}.games
+        ON CONFLICT (game_id) DO NOTHING"""
+    )
+    conn.commit()
+    cur.execute(f'ANALYZE {SCHEMA}.game_trending')
+    conn.commit()
+
+
+def probe_ids(cur: Any) -> Dict[str, Any]:
+    '''
+    Ids the probes address: a well connected user, one of their friends, live
+    listings, a spare game and frame nothing references so deletes succeed, and
+    a fresh 3-byte build upload.
+    The user's balance is topped up and the password reset to legacy plaintext so
+    purchases go through and login takes the rehash path.
+    '''
+    cur.execute(f"UPDATE {SCHEMA}.users SET password = 'probe', balance = 1000000 WHERE email = 'plan1@example.com' RETURNING id, ban_version")
+    user, ban_version = cur.fetchone()
+    cur.execute(f'SELECT friend_id FROM {SCHEMA}.friendships WHERE user_id = %s ORDER BY friend_id LIMIT 1', (user,))
+    friend = cur.fetchone()[0]
+    cur.execute(
+        f"""SELECT id FROM {SCHEMA}.users WHERE email LIKE 'plan%%@example.com' AND id <> %s
+        AND id NOT IN (SELECT friend_id FROM {SCHEMA}.friendships WHERE user_id = %s) ORDER BY id DESC LIMIT 1""",
+        (user, user)
+    )
+    stranger = cur.fetchone()[0]
+    cur.execute(
+        f"""SELECT p.id, p.user_id, p.game_id FROM {SCHEMA}.purchases p
+        WHERE p.is_on_market = FALSE AND p.user_id <> %s
+          AND NOT EXISTS (SELECT 1 FROM {SCHEMA}.purchases o WHERE o.user_id = %s AND o.game_id = p.game_id)
+        ORDER BY p.id DESC LIMIT 2""",
+        (user, user)
+    )
+    listing, refund = cur.fetchall()
+    cur.execute(f"SELECT id FROM {SCHEMA}.games WHERE status = 'approved' AND title LIKE 'Plan game %%' ORDER BY id LIMIT 6")
+    games = [r[0] for r in cur.fetchall()]
+    cur.execute(f'SELECT id, frame_id FROM {SCHEMA}.user_frames WHERE user_id = %s LIMIT 1', (user,))
+    user_frame, frame = cur.fetchone()
+    cur.execute(f'SELECT max(id) FROM {SCHEMA}.messages')
+    last_message = cur.fetchone()[0]
+    cur.execute(f"SELECT created_at, id FROM {SCHEMA}.games WHERE status = 'approved' ORDER BY created_at DESC, id DESC OFFSET 49 LIMIT 1")
+    created_at, game_id = cur.fetchone()
+    cur.execute(f"INSERT INTO {SCHEMA}.games (title, status) VALUES ('Plan spare', 'pending') RETURNING id")
+    spare_game = cur.fetchone()[0]
+    cur.execute(f"INSERT INTO {SCHEMA}.frames (name, image_url) VALUES ('Plan spare', '') RETURNING id")
+    spare_frame = cur.fetchone()[0]
+    upload = f'plan-{time.time_ns()}'
+    cur.execute(f"INSERT INTO {SCHEMA}.build_uploads (id, filename, size) VALUES (%s, 'plan.apk', 3)", (upload,))
+    cur.connection.commit()
+    cursor = base64.urlsafe_b64encode(f'{created_at.isoformat()}|{game_id}'.encode()).decode().rstrip('=')
+    return {
+        'user': user, 'friend': friend, 'stranger': stranger,
+        'seller': listing[1], 'seller_purchase': listing[0],
+        'refund_user': refund[1], 'refund_game': refund[2],
+        'game': games[0], 'cart': games[1:], 'frame': frame, 'user_frame': user_frame,
+        'last_message': last_message, 'catalog_cursor': cursor,
+        'spare_game': spare_game, 'spare_frame': spare_frame, 'upload': upload,
+        'token': sys.modules['session'].issue_token(user, 'user', ban_version),
+        'admin_token': sys.modules['session'].issue_token(user, 'admin', ban_version),
+    }
+
+
+def site_key(path: str, line: int) -> str:
+    name = os.path.basename(path)
+    if name in SHARED_MODULES:
+        return f'{name}:{line}'
+    return f'{os.path.relpath(path, os.path.join(ROOT, "backend"))}:{line}'
+
+
+def static_sites() -> Set[str]:
+    '''Every cur.execute(...) and statement(...).execute(cur, ...) call site in the function sources'''
+    sites: Set[str] = set()
+    for path in sorted(glob.glob(os.path.join(ROOT, 'backend', '*', '*.py'))):
+        if os.path.basename(path) in NOT_HANDLER_SQL:
+            continue
+        with open(path) as source:
+            for number, line in enumerate(source, 1):
+                if re.search(r'\bcur\.execute\(|\)\.execute\(cur\b', line):
+                    sites.add(site_key(path, number))
+    return sites
+
+
+def install_capture(captured: List[Dict[str, Any]], current: Dict[str, Any]) -> None:
+    router = sys.modules['router']
+    original = router.MeteredCursor.execute
+
+    def execute(self: Any, query: Any, vars: Any = None) -> None:
+        caller = sys._getframe(1)
+        while os.path.basename(caller.f_code.co_filename) == 'db.py':
+            caller = caller.f_back
+        captured.append({
+            'probe': current['label'],
+            'hot': current['hot'],
+            'site': site_key(caller.f_code.co_filename, caller.f_lineno),
+            'sql': self.mogrify(query, vars).decode(),
+        })
+        original(self, query, vars)
+
+    router.MeteredCursor.execute = execute
+
+
+def walk(plan: Dict[str, Any]) -> List[Dict[str, Any]]:
+    nodes = [plan]
+    for child in plan.get('Plans', []):
+        nodes.extend(walk(child))
+    return nodes
+
+
+def explain(cur: Any, sql: str) -> Dict[str, Any]:
+    cur.execute('EXPLAIN (FORMAT JSON) ' + sql)
+    plan = cur.fetchone()[0][0]['Plan']
+    cur.connection.rollback()
+    nodes = walk(plan)
+    return {
+        'cost': plan['Total Cost'],
+        'seq_scans': sorted({n['Relation Name'] for n in nodes if n['Node Type'] == 'Seq Scan'}),
+        'indexes': sorted({n['Index Name'] for n in nodes if 'Index Name' in n}),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--migrate', action='store_true')
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--games', type=int, default=5000)
+    parser.add_argument('--verbose', action='store_true')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    # Plain SQL rather than PREPARE/EXECUTE pairs, so each statement can be explained on its own
+    os.environ['DB_PREPARE_STATEMENTS'] = '0'
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+    os.environ.update(BUILD_STORE='local', BUILD_STORE_DIR=tempfile.mkdtemp(), BUILD_STORE_URL='https://builds.example.com')
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if args.migrate:
+        migrate(conn)
+    seed(conn, args.users, args.games)
+    seed_sales(conn)
+    seed_trending(conn)
+
+    handlers = {function: load_handler(function) for function in ('games', 'profile', 'friends', 'auth', 'admin')}
+    captured: List[Dict[str, Any]] = []
+    current: Dict[str, Any] = {}
+    install_capture(captured, current)
+
+    ids = probe_ids(conn.cursor())
+
+    failures: List[str] = []
+    for label, function, build, hot in PROBES:
+        current.update(label=label, hot=hot)
+        event = build(ids)
+        if function == 'admin':
+            event['headers'] = {'Authorization': f"Bearer {ids['admin_token']}"}
+        response = handlers[function](event, None)
+        if response['statusCode'] >= 500:
+            failures.append(f'{label}: handler returned {response["statusCode"]}')
+
+    results: List[Dict[str, Any]] = []
+    seen: Set[Tuple[str, str]] = set()
+    cur = conn.cursor()
+    for statement in captured:
+        first = statement['sql'].lstrip().split(None, 1)[0].upper()
+        if first not in EXPLAINABLE or 'pg_notify(' in statement['sql'] or (statement['probe'], statement['site']) in seen:
+            continue
+        seen.add((statement['probe'], statement['site']))
+        plan = explain(cur, statement['sql'])
+        scaled = [table for table in plan['seq_scans'] if table in SCALED_TABLES]
+        result = {**statement, **plan, 'fails': bool(statement['hot'] and scaled)}
+        results.append(result)
+        if result['fails']:
+            failures.append(f"{statement['probe']} ({statement['site']}): seq scan on {', '.join(scaled)}")
+        marker = 'FAIL' if result['fails'] else ('seq ' if scaled else 'ok  ')
+        print(f"{marker} {statement['probe']:24} {statement['site']:28} cost={plan['cost']:<10} "
+              f"{','.join(plan['indexes']) or '-'}{' seq:' + ','.join(plan['seq_scans']) if plan['seq_scans'] else ''}")
+        if args.verbose:
+            print('     ' + ' '.join(statement['sql'].split())[:400])
+
+    covered = {statement['site'] for statement in captured}
+    uncovered = sorted(static_sites() - covered)
+    print(f'\n{len(results)} statements explained from {len(covered)} call sites; '
+          f'{len(uncovered)} call sites not exercised by a probe')
+    for site in uncovered:
+        print(f'  not covered: {site}')
+
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump({'statements': results, 'uncovered': uncovered, 'failures': failures}, out, indent=2, default=str)
+            out.write('\n')
+
+    if failures:
+        print('\nFailures:')
+        for failure in failures:
+            print(f'  {failure}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+Business: CPU and payload size of list responses through the shared response layer
+Args: --rows (list length), --repeat
+Returns: per-response encode time and body size for the legacy json.dumps path,
+         the response module with stdlib json / orjson, and gzip / brotli
+Usage: python benchmarks/response_encoding.py --rows 200
+'''
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List
+
+from user_search import ROOT
+
+sys.path.insert(0, os.path.join(ROOT, 'backend', 'games'))
+
+import response  # noqa: E402
+
+
+def sample_rows(count: int) -> List[tuple]:
+    rng = random.Random(5)
+    started = datetime(2024, 1, 1)
+    categories = ['Action', 'RPG', 'Puzzle', 'Strategy', 'Racing']
+    return [(
+        i,
+        f'Game title {i}',
+        'Описание игры ' * rng.randint(3, 12),
+        rng.choice(categories),
+        f'https://cdn.example.com/logos/{i}.png',
+        Decimal(rng.randint(0, 5000)) / 100,
+        started + timedelta(minutes=i * 17),
+        rng.random() < 0.1,
+    ) for i in range(count)]
+
+
+def legacy(rows: List[tuple]) -> Dict[str, Any]:
+    return {'statusCode': 200, 'body': json.dumps([{
+        'id': r[0], 'title': r[1], 'description': r[2], 'category': r[3], 'logo_url': r[4],
+        'price': float(r[5]), 'created_at': str(r[6]), 'is_popular': r[7]
+    } for r in rows])}
+
+
+def shared(rows: List[tuple], event: Dict[str, Any]) -> Dict[str, Any]:
+    return response.json_response(event, 200, [{
+        'id': r[0], 'title': r[1], 'description': r[2], 'category': r[3], 'logo_url': r[4],
+        'price': r[5], 'created_at': r[6], 'is_popular': r[7]
+    } for r in rows])
+
+
+def measure(run: Callable[[], Dict[str, Any]], repeat: int) -> Dict[str, float]:
+    result = run()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        run()
+    body = result['body']
+    size = len(base64.b64decode(body)) if result.get('isBase64Encoded') else len(body.encode())
+    return {'ms_per_response': round((time.perf_counter() - started) * 1000 / repeat, 3), 'bytes': size}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    rows = sample_rows(args.rows)
+    plain = {'headers': {}}
+    report: Dict[str, Any] = {'rows': args.rows, 'legacy_json_dumps': measure(lambda: legacy(rows), args.repeat)}
+
+    fast = response.orjson
+    response.orjson = None
+    report['stdlib_json'] = measure(lambda: shared(rows, plain), args.repeat)
+    response.orjson = fast
+    if fast is not None:
+        report['orjson'] = measure(lambda: shared(rows, plain), args.repeat)
+    report['gzip'] = measure(lambda: shared(rows, {'headers': {'Accept-Encoding': 'gzip'}}), args.repeat)
+    if response.brotli is not None:
+        report['brotli'] = measure(lambda: shared(rows, {'headers': {'Accept-Encoding': 'br, gzip'}}), args.repeat)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+'''
+Business: Per-request cost of signed session verification vs. a users lookup
+Args: DATABASE_URL of a migrated database, --requests, --users,
+      --iterations (comma-separated PBKDF2 costs to time)
+Returns: verify / ban-check / DB lookup latency and password hash cost
+Usage: DATABASE_URL=... python benchmarks/session_tokens.py --requests 20000
+'''
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+from user_search import ROOT, SCHEMA
+
+sys.path.insert(0, os.path.join(ROOT, 'backend', 'auth'))
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+from passwords import hash_password, verify_password  # noqa: E402
+from session import BanVersionCache, authenticate, issue_token  # noqa: E402
+
+
+def per_call_us(run: Callable[[Any], Any], items: List[Any]) -> Dict[str, float]:
+    samples = []
+    for item in items:
+        started = time.perf_counter()
+        run(item)
+        samples.append((time.perf_counter() - started) * 1e6)
+    samples.sort()
+    return {
+        'p50_us': round(samples[len(samples) // 2], 2),
+        'p99_us': round(samples[max(int(len(samples) * 0.99) - 1, 0)], 2),
+        'mean_us': round(sum(samples) / len(samples), 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--iterations', default='100000,310000,600000')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    cur = conn.cursor()
+    cur.execute(f'SELECT id, role, ban_version FROM {SCHEMA}.users WHERE NOT is_banned ORDER BY id LIMIT %s', (args.users,))
+    users = cur.fetchall()
+    rng = random.Random(3)
+    events = []
+    for _ in range(args.requests):
+        user_id, role, ban_version = rng.choice(users)
+        events.append({'headers': {'Authorization': 'Bearer ' + issue_token(user_id, role, ban_version)}})
+
+    ban_cache = BanVersionCache()
+
+    def verify_and_check(event: Dict[str, Any]) -> None:
+        ban_cache.is_current(cur, authenticate(event))
+
+    def users_lookup(event: Dict[str, Any]) -> None:
+        cur.execute(
+            f'SELECT id, role, is_banned FROM {SCHEMA}.users WHERE id = %s',
+            (authenticate(event)['user_id'],)
+        )
+        cur.fetchone()
+
+    report: Dict[str, Any] = {
+        'requests': args.requests,
+        'distinct_users': len(users),
+        'issue_token': per_call_us(lambda e: issue_token(1, 'user', 0), events),
+        'verify_token': per_call_us(authenticate, events),
+        'verify_plus_cached_ban_check': per_call_us(verify_and_check, events),
+        'ban_cache': {'hits': ban_cache.hits, 'misses': ban_cache.misses},
+        'users_lookup_per_request': per_call_us(users_lookup, events),
+        'password_hash_ms': {},
+    }
+    for iterations in [int(i) for i in args.iterations.split(',')]:
+        started = time.perf_counter()
+        stored = hash_password('correct horse', iterations)
+        hashed = time.perf_counter()
+        verify_password('correct horse', stored)
+        report['password_hash_ms'][iterations] = {
+            'hash': round((hashed - started) * 1000, 1),
+            'verify': round((time.perf_counter() - hashed) * 1000, 1),
+        }
+    conn.close()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''
+Business: Latency benchmark for friends action=search at scale
+Args: DATABASE_URL of a disposable database migrated with db_migrations,
+      --users (default 1000000), --queries, --prefix-len
+Returns: p50/p95/mean latency for legacy ILIKE, ranked search and autocomplete
+Usage: DATABASE_URL=... python benchmarks/user_search.py --users 1000000
+'''
+import argparse
+import importlib.util
+import os
+import random
+import statistics
+import string
+import time
+from typing import Any, Callable, Dict, List
+
+import psycopg2
+
+SCHEMA = 't_p84121358_steam_clone_dark'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_handler(function: str) -> Callable[[Dict[str, Any], Any], Dict[str, Any]]:
+    function_dir = os.path.join(ROOT, 'backend', function)
+    import sys
+    sys.path.insert(0, function_dir)
+    spec = importlib.util.spec_from_file_location(f'{function}_index', os.path.join(function_dir, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+def seed_users(conn: Any, total: int) -> None:
+    cur = conn.cursor()
+    cur.execute(f'SELECT count(*) FROM {SCHEMA}.users')
+    existing = cur.fetchone()[0]
+    if existing >= total:
+        return
+    print(f'seeding {total - existing} users...')
+    cur.execute(
+        f"""INSERT INTO {SCHEMA}.users (email, password, username, display_name, is_verified, has_checkmark)
+        SELECT 'bench' || i || '@example.com', 'x',
+               translate(substr(md5(i::text), 1, 10), '0123456789', 'ghijklmnop'),
+               initcap(translate(substr(md5((i * 7)::text), 1, 8), '0123456789', 'ghijklmnop')),
+               i %% 50 = 0, i %% 200 = 0
+        FROM generate_series(%s, %s) AS i""",
+        (existing + 1, total)
+    )
+    cur.execute(f'ANALYZE {SCHEMA}.users')
+    conn.commit()
+    cur.close()
+
+
+def measure(run: Callable[[str], Any], terms: List[str]) -> Dict[str, float]:
+    samples = []
+    for term in terms:
+        started = time.perf_counter()
+        run(term)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        'p50_ms': round(samples[len(samples) // 2], 3),
+        'p95_ms': round(samples[int(len(samples) * 0.95) - 1], 3),
+        'mean_ms': round(statistics.mean(samples), 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1_000_000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--prefix-len', type=int, default=3)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    seed_users(conn, args.users)
+    handler = load_handler('friends')
+
+    rng = random.Random(42)
+    alphabet = string.ascii_lowercase[:16]
+    terms = [''.join(rng.choice(alphabet) for _ in range(args.prefix_len)) for _ in range(args.queries)]
+
+    def legacy(term: str) -> None:
+        cur = conn.cursor()
+        cur.execute(
+            f"""SELECT u.id, u.username, u.display_name, u.avatar_url, u.is_verified, u.has_checkmark, u.active_frame_id, f.image_url
+            FROM {SCHEMA}.users u LEFT JOIN {SCHEMA}.frames f ON u.active_frame_id = f.id
+            WHERE (u.username ILIKE %s OR u.display_name ILIKE %s) AND u.id != %s
+            ORDER BY u.has_checkmark DESC, u.is_verified DESC, u.username ASC""",
+            (f'%{term}%', f'%{term}%', 1)
+        )
+        cur.fetchall()
+        cur.close()
+
+    def search(term: str) -> None:
+        handler({'httpMethod': 'GET', 'queryStringParameters': {'action': 'search', 'user_id': '1', 'search': term}}, None)
+
+    def autocomplete(term: str) -> None:
+        handler({'httpMethod': 'GET', 'queryStringParameters': {'action': 'search', 'mode': 'autocomplete', 'user_id': '1', 'search': term}}, None)
+
+    legacy_terms = terms[:max(len(terms) // 10, 5)]
+    print(f'users={args.users} queries={args.queries} prefix_len={args.prefix_len}')
+    print('legacy ILIKE  ', measure(legacy, legacy_terms))
+    print('ranked search ', measure(search, terms))
+    print('autocomplete  ', measure(autocomplete, terms))
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+-- Prefix indexes for user search and autocomplete (lowercased, C collation so LIKE 'abc%' and ORDER BY can use them)
+CREATE INDEX IF NOT EXISTS idx_users_username_lower ON users ((lower(username)) COLLATE "C");
+CREATE INDEX IF NOT EXISTS idx_users_display_name_lower ON users ((lower(display_name)) COLLATE "C");
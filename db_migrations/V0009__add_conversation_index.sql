@@ -0,0 +1,2 @@
+-- One index serves both directions of a conversation: (lower id, higher id, message id)
+CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (LEAST(sender_id, receiver_id), GREATEST(sender_id, receiver_id), id);
@@ -0,0 +1,19 @@
+-- Marketplace columns (already present on older deployments)
+ALTER TABLE purchases ADD COLUMN IF NOT EXISTS is_on_market BOOLEAN DEFAULT FALSE;
+ALTER TABLE purchases ADD COLUMN IF NOT EXISTS market_price DECIMAL(10, 2) DEFAULT 0;
+ALTER TABLE user_frames ADD COLUMN IF NOT EXISTS is_on_market BOOLEAN DEFAULT FALSE;
+ALTER TABLE user_frames ADD COLUMN IF NOT EXISTS market_price DECIMAL(10, 2) DEFAULT 0;
+
+-- When an item was put up for sale, used for "recent" ordering
+ALTER TABLE purchases ADD COLUMN IF NOT EXISTS listed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+ALTER TABLE user_frames ADD COLUMN IF NOT EXISTS listed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;
+UPDATE purchases SET listed_at = purchased_at WHERE is_on_market = TRUE;
+UPDATE user_frames SET listed_at = purchased_at WHERE is_on_market = TRUE;
+
+-- Partial indexes only cover items currently for sale
+CREATE INDEX IF NOT EXISTS idx_purchases_market_price ON purchases (market_price, id) WHERE is_on_market = TRUE;
+CREATE INDEX IF NOT EXISTS idx_purchases_market_recent ON purchases (listed_at, id) WHERE is_on_market = TRUE;
+CREATE INDEX IF NOT EXISTS idx_purchases_market_item ON purchases (game_id, market_price, id) WHERE is_on_market = TRUE;
+CREATE INDEX IF NOT EXISTS idx_user_frames_market_price ON user_frames (market_price, id) WHERE is_on_market = TRUE;
+CREATE INDEX IF NOT EXISTS idx_user_frames_market_recent ON user_frames (listed_at, id) WHERE is_on_market = TRUE;
+CREATE INDEX IF NOT EXISTS idx_user_frames_market_item ON user_frames (frame_id, market_price, id) WHERE is_on_market = TRUE;
@@ -0,0 +1,20 @@
+-- Precomputed "people you may know": mutual friend counts for non-friend pairs,
+-- kept up to date incrementally by add_friend
+CREATE TABLE IF NOT EXISTS friend_suggestions (
+  user_id INTEGER REFERENCES users(id),
+  candidate_id INTEGER REFERENCES users(id),
+  mutual_count INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (user_id, candidate_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_friend_suggestions_rank ON friend_suggestions (user_id, mutual_count DESC);
+
+-- Backfill from the existing friendships graph
+INSERT INTO friend_suggestions (user_id, candidate_id, mutual_count)
+SELECT a.user_id, b.friend_id, COUNT(*)
+FROM friendships a
+JOIN friendships b ON b.user_id = a.friend_id
+WHERE b.friend_id <> a.user_id
+  AND NOT EXISTS (SELECT 1 FROM friendships e WHERE e.user_id = a.user_id AND e.friend_id = b.friend_id)
+GROUP BY a.user_id, b.friend_id
+ON CONFLICT (user_id, candidate_id) DO UPDATE SET mutual_count = EXCLUDED.mutual_count;
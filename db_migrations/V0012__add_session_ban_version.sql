@@ -0,0 +1,2 @@
+-- Bumped on every ban so signed session tokens issued before it stop verifying
+ALTER TABLE users ADD COLUMN IF NOT EXISTS ban_version INTEGER NOT NULL DEFAULT 0;
@@ -0,0 +1,21 @@
+-- Secondary indexes for hot handler queries; benchmarks/query_plans.py checks their plans at scale
+
+-- Catalog: status filter with newest-first keyset pages, status=all and the popular shelf
+CREATE INDEX IF NOT EXISTS idx_games_status_created ON games (status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_games_created ON games (created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_games_popular ON games (created_at DESC, id DESC) WHERE status = 'approved' AND is_popular = TRUE;
+
+-- Inventories: a user's items split by whether they are listed, in id order
+CREATE INDEX IF NOT EXISTS idx_purchases_user_market ON purchases (user_id, is_on_market, id);
+CREATE INDEX IF NOT EXISTS idx_user_frames_user_market ON user_frames (user_id, is_on_market, id);
+
+-- Owners of a game or frame, for foreign key checks when one is deleted
+CREATE INDEX IF NOT EXISTS idx_purchases_game ON purchases (game_id);
+CREATE INDEX IF NOT EXISTS idx_user_frames_frame ON user_frames (frame_id);
+
+-- Messages by recipient (inbox long-poll without a friend filter) and by sender
+CREATE INDEX IF NOT EXISTS idx_messages_receiver ON messages (receiver_id, id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender ON messages (sender_id, id);
+
+-- Admin user list and created_from/created_to export filters
+CREATE INDEX IF NOT EXISTS idx_users_created ON users (created_at DESC);
@@ -0,0 +1,56 @@
+-- Sales rollups for the admin dashboard, kept up to date by the purchase, trade and refund
+-- handlers in the same transaction (see backend/*/sales.py). kind is one of
+-- game, frame, market_game, market_frame, refund; amount is what changed hands.
+
+-- Totals per hour and kind; day/week/month buckets are summed from these
+CREATE TABLE IF NOT EXISTS sales_hourly (
+  bucket TIMESTAMP NOT NULL,
+  kind VARCHAR(20) NOT NULL,
+  sales INTEGER NOT NULL DEFAULT 0,
+  amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (bucket, kind)
+);
+
+-- Per game or frame per day, for revenue per item and top sellers
+CREATE TABLE IF NOT EXISTS sales_daily_items (
+  day DATE NOT NULL,
+  kind VARCHAR(20) NOT NULL,
+  item_id INTEGER NOT NULL,
+  sales INTEGER NOT NULL DEFAULT 0,
+  amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, kind, item_id)
+);
+
+-- Market turnover per selling user per day. No foreign keys on the rollups: history
+-- outlives deleted users and games
+CREATE TABLE IF NOT EXISTS sales_daily_sellers (
+  day DATE NOT NULL,
+  seller_id INTEGER NOT NULL,
+  sales INTEGER NOT NULL DEFAULT 0,
+  amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, seller_id)
+);
+
+-- Backfill from what is owned today. Earlier market resales and refunds left no
+-- history, so every existing purchase counts as a store sale at its recorded price.
+INSERT INTO sales_hourly (bucket, kind, sales, amount)
+SELECT date_trunc('hour', s.at), s.kind, COUNT(*), SUM(s.amount)
+FROM (
+  SELECT p.purchased_at AS at, 'game' AS kind, COALESCE(p.price, 0) AS amount FROM purchases p
+  UNION ALL
+  SELECT uf.purchased_at, 'frame', COALESCE(f.price, 0) FROM user_frames uf JOIN frames f ON f.id = uf.frame_id
+) s
+WHERE s.at IS NOT NULL
+GROUP BY 1, 2
+ON CONFLICT (bucket, kind) DO NOTHING;
+
+INSERT INTO sales_daily_items (day, kind, item_id, sales, amount)
+SELECT s.at::date, s.kind, s.item_id, COUNT(*), SUM(s.amount)
+FROM (
+  SELECT p.purchased_at AS at, 'game' AS kind, p.game_id AS item_id, COALESCE(p.price, 0) AS amount FROM purchases p
+  UNION ALL
+  SELECT uf.purchased_at, 'frame', uf.frame_id, COALESCE(f.price, 0) FROM user_frames uf JOIN frames f ON f.id = uf.frame_id
+) s
+WHERE s.at IS NOT NULL
+GROUP BY 1, 2, 3
+ON CONFLICT (day, kind, item_id) DO NOTHING;
@@ -0,0 +1,24 @@
+-- Trending ranking behind the games catalog status=popular shelf: time-decayed store
+-- and market sales per game (see backend/*/trending.py). An event of weight w at time t
+-- adds w * 2^((t - epoch) / half-life) to the game's score, so every score decays by the
+-- same factor without being rewritten and the ranking is a plain index scan on score.
+
+-- The single row holding the epoch scores are measured against; refresh_trending moves
+-- it forward long before the scores could overflow
+CREATE TABLE IF NOT EXISTS trending_state (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  epoch TIMESTAMP NOT NULL,
+  refreshed_at TIMESTAMP
+);
+
+INSERT INTO trending_state (epoch) VALUES (date_trunc('hour', LOCALTIMESTAMP)) ON CONFLICT (id) DO NOTHING;
+
+-- Bumped by the sale handlers in the sale's transaction and rescored from sales_daily_items
+-- by the admin refresh_trending action. Filled by its first run; until then the shelf
+-- shows the admin-pinned games only, as before. No foreign key, like the sales rollups
+CREATE TABLE IF NOT EXISTS game_trending (
+  game_id INTEGER PRIMARY KEY,
+  score DOUBLE PRECISION NOT NULL DEFAULT 0
+);
+
+CREATE INDEX IF NOT EXISTS idx_game_trending_score ON game_trending (score DESC, game_id DESC);
@@ -0,0 +1,3 @@
+-- Catalog pages filtered by category keep the newest-first keyset order of
+-- idx_games_status_created; age rating and price filter the rows it returns
+CREATE INDEX IF NOT EXISTS idx_games_status_category_created ON games (status, category, created_at DESC, id DESC);
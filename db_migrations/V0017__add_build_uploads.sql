@@ -0,0 +1,27 @@
+-- Resumable chunked uploads of game builds (see backend/games/uploads.py). Each
+-- distinct build is stored once, keyed by its content hash, however often it is uploaded
+
+CREATE TABLE IF NOT EXISTS build_blobs (
+  content_hash CHAR(64) PRIMARY KEY,
+  size BIGINT NOT NULL,
+  url VARCHAR(500) NOT NULL,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- One row per upload; received is the offset to resume from and block_digests the
+-- SHA-256 of every block written so far, so finishing needs no second read of the file
+CREATE TABLE IF NOT EXISTS build_uploads (
+  id VARCHAR(32) PRIMARY KEY,
+  publisher_login VARCHAR(255),
+  filename VARCHAR(255) NOT NULL,
+  size BIGINT NOT NULL,
+  received BIGINT NOT NULL DEFAULT 0,
+  block_digests BYTEA NOT NULL DEFAULT '',
+  content_hash CHAR(64) REFERENCES build_blobs(content_hash),
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  completed_at TIMESTAMP
+);
+
+-- Abandoned uploads, expired oldest first
+CREATE INDEX IF NOT EXISTS idx_build_uploads_pending ON build_uploads (updated_at) WHERE completed_at IS NULL;
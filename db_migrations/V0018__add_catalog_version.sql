@@ -0,0 +1,9 @@
+-- Catalog cache version shared by every function instance (see backend/*/cache.py).
+-- Game edits bump it in their own transaction; the games function reads it per
+-- request, so cached catalog pages and ETags from before the edit stop matching.
+CREATE TABLE IF NOT EXISTS catalog_state (
+  id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+  version BIGINT NOT NULL DEFAULT 0
+);
+
+INSERT INTO catalog_state (version) VALUES (0) ON CONFLICT (id) DO NOTHING;
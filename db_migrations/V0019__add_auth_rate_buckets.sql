@@ -0,0 +1,9 @@
+-- Login/register token buckets shared by every auth instance (see backend/auth/ratelimit.py).
+-- A missing row is a full bucket, so rows that have refilled are pruned by age
+CREATE TABLE IF NOT EXISTS auth_rate_buckets (
+  key TEXT PRIMARY KEY,
+  tokens DOUBLE PRECISION NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_auth_rate_buckets_updated ON auth_rate_buckets (updated_at);